@@ -1,7 +1,10 @@
 """
 bot/handlers.py - معالجات بوت Telegram
 التحسينات:
-  - Semaphore لتحديد التحميلات المتزامنة (لحماية الذاكرة)
+  - طابور مهام دائم (jobs): handle_message يسجل مهمة التحميل ويرد فوراً، والعمّال ينفذونها
+  - جدولة القبول (bot.scheduler): مجمع لكل منصة، أولوية للقائمة البيضاء، وطابور محدود
+  - مرحلة ffmpeg (downloaders.media_pipeline) قبل الرفع: faststart وضغط وصورة مصغرة
+  - تحديث بيانات المستخدم (الاسم والصورة) عند انتهاء المدة فقط (bot.user_profiles)
   - Executor مشترك من main.py
   - حذف فوري للملف بعد الإرسال
   - تقليل استدعاءات DB غير الضرورية
@@ -13,13 +16,17 @@ import os
 from telegram import Update
 from telegram.ext import ContextTypes
 
+import config
 from data import database
+import jobs
+from bot import media_cache, membership, profile_cache, scheduler, user_profiles
 from downloaders import (
     BaseDownloader,
     InstagramDownloader,
     FacebookDownloader,
     TikTokDownloader,
 )
+from downloaders import media_pipeline, sizing, urls
 
 logger = logging.getLogger(__name__)
 
@@ -29,64 +36,157 @@ _facebook = FacebookDownloader()
 _tiktok   = TikTokDownloader()
 _generic  = BaseDownloader()
 
-# ─── Executor مشترك (يُعيّن من main.py) ─────────────────────────────────────
+# ─── Executor مشترك لـ yt-dlp (يُعيّن من main.py) ────────────────────────────
+# بقية التحميلات (Instagram و TikWM و CDN) غير متزامنة ولا تستهلك خيوطاً
 EXECUTOR = None
 
-# ─── حد أقصى للتحميلات المتزامنة (لحماية RAM) ───────────────────────────────
-_download_semaphore = asyncio.Semaphore(6)
+# ─── التحميلات الجارية حسب الرابط الموحّد (Single-flight) ───────────────────
+# الطلبات المتزامنة لنفس المنشور تنتظر تحميلاً واحداً ثم تُرسل النتيجة بـ file_id
+_inflight: dict[str, asyncio.Future] = {}
 
 
-def _get_downloader(url: str) -> tuple[BaseDownloader, str]:
-    if "instagram.com" in url:
-        return _insta, "Instagram"
-    if "facebook.com" in url or "fb.watch" in url:
-        return _facebook, "Facebook"
-    if "tiktok.com" in url:
-        return _tiktok, "TikTok"
-    return _generic, "Generic"
+_DOWNLOADERS = {
+    "Instagram": _insta,
+    "Facebook":  _facebook,
+    "TikTok":    _tiktok,
+}
 
 
-async def _get_user_photo(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> tuple[str | None, str | None]:
+def _priority(is_whitelisted: bool) -> int:
+    return scheduler.PRIORITY_WHITELIST if is_whitelisted else scheduler.PRIORITY_NORMAL
+
+
+async def _announce_queue(edit, ticket: scheduler.Ticket, template: database.Template) -> None:
+    """إبلاغ المستخدم بترتيبه في الطابور والوقت التقريبي (إن لم يُقبل فوراً).
+    edit: دالة غير متزامنة تستقبل النص (مثل status_msg.edit_text).
+    تُستدعى بين submit و async with: عند الإلغاء هنا تُحرَّر التذكرة حتى لا يضيع مكانها."""
+    if not ticket.waiting:
+        return
     try:
-        photos = await context.bot.get_user_profile_photos(user_id, limit=1)
-        if photos.total_count > 0:
-            photo_size = photos.photos[0][0]
-            f = await context.bot.get_file(photo_size.file_id)
-            return f.file_path, photo_size.file_id
-    except Exception:
-        pass
-    return None, None
-
-
-async def _update_user_db(context: ContextTypes.DEFAULT_TYPE, user) -> None:
-    """دالة مساعدة لتحديث بيانات المستخدم شاملة الصورة ومعرف الملف."""
-    photo_url, photo_file_id = await _get_user_photo(context, user.id)
-    database.upsert_user(
-        user_id=user.id,
-        username=user.username,
-        first_name=user.first_name,
-        photo_url=photo_url,
-        photo_file_id=photo_file_id
+        await edit(template.render(
+            position=ticket.position() + 1,
+            eta=max(1, round(ticket.estimated_wait())),
+        ))
+    except Exception as e:
+        logger.debug("Could not show queue position: %s", e)
+    except BaseException:
+        ticket.abandon()
+        raise
+
+
+def _too_large_text(err: sizing.MediaTooLarge) -> str:
+    """رسالة واضحة للمستخدم عند تجاوز حد الرفع."""
+    size = f"{err.size / 1048576:.1f} MB" if err.size else "غير معروف"
+    return database.get_settings_snapshot().render(
+        "msg_too_large", "⚠️ حجم الملف ({size}) أكبر من الحد المسموح للرفع في تيليجرام ({limit} MB).",
+        size=size, limit=round(err.limit / 1048576),
     )
 
 
+async def _canonical_key(url: str) -> str:
+    """مفتاح المنشور الثابت (الروابط المختصرة تُحل بطلب غير متزامن مرة واحدة)."""
+    return str(await urls.canonicalize_async(url))
+
+
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+async def _prepare_videos(results: str | list[str]) -> tuple[str | list[str], dict[str, dict]]:
+    """تمرير مقاطع الفيديو في النتيجة عبر مرحلة ffmpeg (Remux / ضغط / بيانات وصفية).
+    يعيد المسارات بعد المعالجة وبياناتها الوصفية حسب المسار."""
+    paths  = results if isinstance(results, list) else [results]
+    videos = [p for p in paths if not p.lower().endswith(_IMAGE_EXTS)]
+    processed = await asyncio.gather(*(media_pipeline.postprocess(v) for v in videos), return_exceptions=True)
+    failed = next((r for r in processed if isinstance(r, BaseException)), None)
+    if failed is not None:
+        # المسارات الأصلية قد تكون استُبدلت؛ نحذف ما أنتجته المرحلة قبل رفع الخطأ
+        for info in processed:
+            if isinstance(info, dict):
+                _generic.cleanup([info["path"], info.get("thumb")])
+        raise failed
+    renamed = {v: info["path"] for v, info in zip(videos, processed) if info}
+    meta    = {info["path"]: info for info in processed if info and "duration" in info}
+    paths   = [renamed.get(p, p) for p in paths]
+    return (paths if isinstance(results, list) else paths[0]), meta
+
+
+def _video_extras(info: dict | None, opened: list) -> dict:
+    """وسائط send_video / InputMediaVideo الإضافية (المدة والأبعاد والصورة المصغرة)."""
+    if not info:
+        return {}
+    extras = {k: info[k] for k in ("duration", "width", "height") if info.get(k)}
+    extras["supports_streaming"] = True
+    if info.get("thumb"):
+        fh = open(info["thumb"], "rb")
+        opened.append(fh)
+        extras["thumbnail"] = fh
+    return extras
+
+
+def _thumbs(meta: dict[str, dict]) -> list[str]:
+    return [info["thumb"] for info in meta.values() if info.get("thumb")]
+
+
+def _extract_file_ids(sent) -> list[dict]:
+    """استخراج معرفات file_id من رسالة (أو ألبوم) أرسلها البوت لتخزينها في الذاكرة."""
+    messages = sent if isinstance(sent, (list, tuple)) else [sent]
+    items = []
+    for m in messages:
+        if m.video:
+            items.append({"type": "video", "file_id": m.video.file_id})
+        elif m.photo:
+            items.append({"type": "photo", "file_id": m.photo[-1].file_id})
+        elif m.animation:
+            items.append({"type": "animation", "file_id": m.animation.file_id})
+        elif m.document:
+            items.append({"type": "document", "file_id": m.document.file_id})
+    return items
+
+
+async def _send_cached(bot, chat_id: int, entry: dict, reply_to: int | None = None) -> None:
+    """إعادة إرسال نتيجة مخزنة بمعرفات file_id مباشرة (بدون تحميل أو رفع)."""
+    items   = entry["items"]
+    caption = entry.get("caption", "")
+    if len(items) > 1:
+        from telegram import InputMediaPhoto, InputMediaVideo
+        media = []
+        for item in items[:10]:
+            cap = caption if not media else ""
+            if item["type"] == "photo":
+                media.append(InputMediaPhoto(media=item["file_id"], caption=cap))
+            elif item["type"] == "video":
+                media.append(InputMediaVideo(media=item["file_id"], caption=cap))
+        await bot.send_media_group(chat_id=chat_id, media=media, reply_to_message_id=reply_to)
+        return
+
+    item = items[0]
+    if item["type"] == "photo":
+        await bot.send_photo(chat_id=chat_id, photo=item["file_id"], caption=caption, reply_to_message_id=reply_to)
+    elif item["type"] == "animation":
+        await bot.send_animation(chat_id=chat_id, animation=item["file_id"], caption=caption, reply_to_message_id=reply_to)
+    elif item["type"] == "document":
+        await bot.send_document(chat_id=chat_id, document=item["file_id"], caption=caption, reply_to_message_id=reply_to)
+    else:
+        await bot.send_video(chat_id=chat_id, video=item["file_id"], caption=caption, reply_to_message_id=reply_to)
+
+
 # ─── /start ──────────────────────────────────────────────────────────────────
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
         user = update.effective_user
         if not user: return
         
-        await _update_user_db(context, user)
+        await user_profiles.touch(context.bot, user, wait=True)
         database.log_message(user.id, "user", "/start")
 
-        db_user = database.get_user(user.id)
-        if db_user and db_user["is_banned"]:
+        if database.is_banned(user.id):
             return
 
-        msg = database.get_setting("welcome_msg", "أهلاً! أرسل رابط الفيديو.")
+        settings = database.get_settings_snapshot()
+        msg = settings.get("welcome_msg", "أهلاً! أرسل رابط الفيديو.")
         
-        share_msg  = database.get_setting("share_msg", "هذا هو البوت الاحترافي للتحميل! @ir4qibot")
-        share_btn  = database.get_setting("share_btn_text", "مشاركة مع الأصدقاء 🔗")
+        share_msg  = settings.get("share_msg", "هذا هو البوت الاحترافي للتحميل! @ir4qibot")
+        share_btn  = settings.get("share_btn_text", "مشاركة مع الأصدقاء 🔗")
         
         import urllib.parse
         try:
@@ -115,10 +215,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         user = update.effective_user
         if not user: return
         database.log_message(user.id, "user", "/help")
-        db_user = database.get_user(user.id)
-        if db_user and db_user["is_banned"]:
+        if database.is_banned(user.id):
             return
-        msg = database.get_setting("help_msg", "أرسل رابط فيديو من Instagram أو Facebook أو TikTok.")
+        msg = database.get_settings_snapshot().get("help_msg", "أرسل رابط فيديو من Instagram أو Facebook أو TikTok.")
         await update.message.reply_text(msg)
         database.log_message(user.id, "bot", msg)
     except Exception as e:
@@ -152,12 +251,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         if not update.message or not update.message.text: return
         url     = update.message.text.strip()
 
-        asyncio.create_task(_update_user_db(context, user))
+        await user_profiles.touch(context.bot, user)
         database.log_message(user.id, "user", url)
+        settings = database.get_settings_snapshot()
 
-        db_user = database.get_user(user.id)
-        if db_user and db_user["is_banned"]:
-            msg = database.get_setting("msg_banned", "⛔ أنت محظور.")
+        if database.is_banned(user.id):
+            msg = settings.get("msg_banned", "⛔ أنت محظور.")
             await update.message.reply_text(msg)
             return
 
@@ -165,7 +264,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         is_whitelisted  = whitelist_entry is not None
 
         if not is_whitelisted:
-            if not await _check_subscriptions(update, context, user.id, chat_id):
+            if not await _check_subscriptions(update, context, user.id, chat_id, settings):
                 return
 
         if not url.startswith(("http://", "https://")):
@@ -190,44 +289,153 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 return
 
         # ----- التحميل -----
-        downloader, platform = _get_downloader(url)
+        platform = urls.detect_platform(url)
 
-        custom_reply = whitelist_entry.get("custom_reply") if is_whitelisted else None
-        
-        msg_analyzing = custom_reply if custom_reply else database.get_setting("msg_analyzing", "جاري التحليل... 🔍")
-        msg_routing   = database.get_setting("msg_routing",   "توجيه إلى {platform}... 🔄").replace("{platform}", platform)
-        msg_complete  = database.get_setting("msg_complete",  "تم التحميل! جاري الرفع... 📤")
-        msg_error     = database.get_setting("msg_error",     "فشل التحميل ({platform}) ❌").replace("{platform}", platform)
-        msg_caption   = database.get_setting("msg_caption",   "المصدر: {platform}").replace("{platform}", platform)
+        custom_reply  = whitelist_entry.get("custom_reply") if is_whitelisted else None
+        msg_analyzing = custom_reply if custom_reply else settings.get("msg_analyzing", "جاري التحليل... 🔍")
+
+        # ----- الذاكرة: إعادة الإرسال بـ file_id إن سبق رفع نفس المنشور -----
+        cache_key = await _canonical_key(url)
+        cached    = await asyncio.to_thread(media_cache.get, cache_key)
+        if cached:
+            try:
+                await _send_cached(context.bot, chat_id, cached, update.message.message_id)
+                logger.info("⚡ Media cache hit: %s", cache_key)
+                return
+            except Exception as e:
+                logger.warning("⚠️ Cached file_id rejected, downloading again: %s", e)
+                await asyncio.to_thread(media_cache.invalidate, cache_key)
 
+        # ----- تسجيل مهمة التحميل في الطابور الدائم والرد فوراً -----
         status_msg = await update.message.reply_text(msg_analyzing)
+        try:
+            # حد المهام المعلقة لكل مستخدم: مستخدم واحد لا يملأ الطابور أمام الآخرين
+            job_id = await asyncio.to_thread(jobs.enqueue, "download", {
+                "url":           url,
+                "platform":      platform,
+                "cache_key":     cache_key,
+                "chat_id":       chat_id,
+                "user_id":       user.id,
+                "reply_to":      update.message.message_id,
+                "status_msg_id": status_msg.message_id,
+                "whitelisted":   is_whitelisted,
+            }, _priority(is_whitelisted), str(user.id), config.JOB_MAX_PENDING_PER_USER)
+        except jobs.PendingLimit:
+            await status_msg.edit_text(settings.get("msg_busy", "⚠️ البوت مشغول جداً حالياً، يرجى المحاولة بعد قليل."))
+            return
+        jobs.worker.notify()
+        logger.info("📥 Queued download job %s: %s", job_id, cache_key)
+    except Exception as e:
+        logger.error(f"FATAL error in handle_message: {e}", exc_info=True)
 
-        await context.bot.edit_message_text(chat_id=chat_id, message_id=status_msg.message_id, text=msg_routing)
 
-        async with _download_semaphore:
+# ─── تنفيذ مهمة التحميل (من عمّال الطابور) ──────────────────────────────────
+async def run_download_job(bot, job: jobs.Job) -> None:
+    """تحميل ورفع منشور من مهمة في الطابور. الاستثناء يعني فشلاً قابلاً لإعادة المحاولة،
+    و jobs.Defer إعادةً للطابور دون احتساب محاولة."""
+    p          = job.payload
+    url        = p["url"]
+    platform   = p["platform"]
+    cache_key  = p["cache_key"]
+    chat_id    = p["chat_id"]
+    reply_to   = p["reply_to"]
+    status_id  = p["status_msg_id"]
+    last_try   = job.attempts >= job.max_attempts
+    downloader = _DOWNLOADERS.get(platform, _generic)
+
+    settings      = database.get_settings_snapshot()
+    msg_routing   = settings.render("msg_routing",   "توجيه إلى {platform}... 🔄", platform=platform)
+    msg_complete  = settings.get("msg_complete",     "تم التحميل! جاري الرفع... 📤")
+    msg_error     = settings.template("msg_error",   "فشل التحميل ({platform}) ❌")
+    msg_caption   = settings.render("msg_caption",   "المصدر: {platform}", platform=platform)
+    msg_queued    = settings.template("msg_queued",  "⏳ أنت رقم {position} في الطابور (حوالي {eta} ثانية)...")
+
+    async def _status(text: str) -> None:
+        try:
+            await bot.edit_message_text(chat_id=chat_id, message_id=status_id, text=text)
+        except Exception as e:
+            logger.debug("Could not edit status message: %s", e)
+
+    async def _drop_status() -> None:
+        try:
+            await bot.delete_message(chat_id=chat_id, message_id=status_id)
+        except Exception as e:
+            logger.debug("Could not delete status message: %s", e)
+
+    # ----- ربما رُفع المنشور بالفعل (مهمة مكررة أو إعادة محاولة بعد انقطاع) -----
+    cached = await asyncio.to_thread(media_cache.get, cache_key)
+    if cached:
+        try:
+            await _send_cached(bot, chat_id, cached, reply_to)
+            await _drop_status()
+            return
+        except Exception as e:
+            logger.warning("⚠️ Cached file_id rejected, downloading again: %s", e)
+            await asyncio.to_thread(media_cache.invalidate, cache_key)
+
+    # ----- Single-flight: نفس الرابط قيد التحميل في مهمة أخرى -----
+    flight = _inflight.get(cache_key)
+    if flight is not None:
+        try:
+            entry = await asyncio.shield(flight)
+        except jobs.Defer as e:
+            # المهمة الأصلية أُعيدت للطابور (ضغط مؤقت أو محاولة غير أخيرة): نعود معها
+            raise jobs.Defer(e.delay)
+        except sizing.MediaTooLarge as e:
+            await _status(_too_large_text(e))
+            return
+        except Exception as e:
+            await _status(msg_error.render(platform=platform, error=e))
+            return
+        try:
+            await _send_cached(bot, chat_id, entry, reply_to)
+            await _drop_status()
+            logger.info("🔗 Coalesced duplicate request: %s", cache_key)
+        except Exception as e:
+            await _status(msg_error.render(platform=platform, error=e))
+        return
+
+    flight = asyncio.get_running_loop().create_future()
+    # تعليم الاستثناء كمقروء حتى لا يظهر تحذير إذا لم ينتظره أحد
+    flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight[cache_key] = flight
+
+    try:
+        await _status(msg_routing)
+
+        try:
+            ticket = scheduler.submit(platform, p["user_id"], _priority(p["whitelisted"]))
+        except scheduler.QueueFull:
+            # ضغط مؤقت وليس فشلاً: تُعاد المهمة للطابور دون احتساب محاولة
+            raise jobs.Defer(config.JOB_DEFER_DELAY)
+        await _announce_queue(_status, ticket, msg_queued)
+
+        async with ticket:
+            results = None
+            meta    = {}
             try:
-                results = None
-                loop      = asyncio.get_running_loop()
-                stats_dict = await loop.run_in_executor(
-                    EXECUTOR, downloader.download_video, url
-                )
-                
+                stats_dict = await downloader.download_video_async(url, EXECUTOR)
+
                 results     = stats_dict.get("results")
                 description = stats_dict.get("description", "")
 
-                await context.bot.edit_message_text(
-                    chat_id=chat_id, message_id=status_msg.message_id, text=msg_complete
-                )
+                if not results:
+                    # لا وسائط في المنشور: فشل نهائي لا تفيده إعادة المحاولة
+                    flight.set_exception(ValueError("No downloadable media found"))
+                    await _status(msg_error.render(platform=platform, error="No downloadable media found"))
+                    return
+
+                # Remux / ضغط ما تجاوز الحد، ثم احتياط أخير: لا نحاول رفع ما سيرفضه Telegram
+                results, meta = await _prepare_videos(results)
+                sizing.check_files(results)
+
+                await _status(msg_complete)
 
                 final_caption = f"{description}\n\n{msg_caption}" if description else msg_caption
                 if len(final_caption) > 1024:
                     final_caption = final_caption[:1020] + "..."
 
-                if not results:
-                      error_msg_replaced = msg_error.replace("{error}", "No downloadable media found")
-                      await context.bot.edit_message_text(chat_id=chat_id, message_id=status_msg.message_id, text=error_msg_replaced)
-                      return
-
+                sent = None
                 if isinstance(results, list):
                     from telegram import InputMediaPhoto, InputMediaVideo
                     media = []
@@ -236,61 +444,85 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                         for item in results[:10]:
                             f = open(item, 'rb')
                             opened_files.append(f)
-                            if item.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+                            if item.lower().endswith(_IMAGE_EXTS):
                                 media.append(InputMediaPhoto(media=f, caption=final_caption if not media else ""))
                             else:
-                                media.append(InputMediaVideo(media=f, caption=final_caption if not media else ""))
-                        
+                                media.append(InputMediaVideo(
+                                    media=f, caption=final_caption if not media else "",
+                                    **_video_extras(meta.get(item), opened_files),
+                                ))
+
                         if media:
-                            await context.bot.send_media_group(chat_id=chat_id, media=media, reply_to_message_id=update.message.message_id)
-                            await context.bot.delete_message(chat_id=chat_id, message_id=status_msg.message_id)
+                            sent = await bot.send_media_group(chat_id=chat_id, media=media, reply_to_message_id=reply_to)
                     finally:
                         for f in opened_files:
                             f.close()
+                elif results.lower().endswith(_IMAGE_EXTS):
+                    with open(results, 'rb') as f:
+                        sent = await bot.send_photo(
+                            chat_id=chat_id, photo=f, caption=final_caption, reply_to_message_id=reply_to
+                        )
                 else:
-                    if results.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
-                        with open(results, 'rb') as f:
-                            await context.bot.send_photo(
-                                chat_id=chat_id,
-                                photo=f,
-                                caption=final_caption,
-                                reply_to_message_id=update.message.message_id
-                            )
-                    else:
+                    opened_files = []
+                    try:
                         with open(results, 'rb') as f:
-                            await context.bot.send_video(
-                                chat_id=chat_id,
-                                video=f,
-                                caption=final_caption,
-                                reply_to_message_id=update.message.message_id
+                            sent = await bot.send_video(
+                                chat_id=chat_id, video=f, caption=final_caption, reply_to_message_id=reply_to,
+                                **_video_extras(meta.get(results), opened_files),
                             )
-                    await context.bot.delete_message(chat_id=chat_id, message_id=status_msg.message_id)
+                    finally:
+                        for f in opened_files:
+                            f.close()
+                await _drop_status()
 
+                items = _extract_file_ids(sent) if sent else []
+                if items:
+                    await asyncio.to_thread(media_cache.put, cache_key, items, final_caption)
+                    flight.set_result({"items": items, "caption": final_caption})
+                else:
+                    flight.set_exception(ValueError("No downloadable media found"))
+
+            except sizing.MediaTooLarge as e:
+                # فشل نهائي: الحجم لن يتغير بإعادة المحاولة
+                flight.set_exception(e)
+                logger.info("📏 Rejected oversize media %s: %s", cache_key, e)
+                await _status(_too_large_text(e))
             except Exception as e:
+                # قبل المحاولة الأخيرة يُترك المنتظرون لـ finally (يُعادون للطابور مع المهمة)
+                if last_try and not flight.done():
+                    flight.set_exception(e)
                 logger.error(f"Download Error: {e}", exc_info=True)
-                database.log_error(user_id=user.id, platform=platform, url=url, error_msg=str(e))
-                error_msg_replaced = msg_error.replace("{error}", str(e))
-                await context.bot.edit_message_text(chat_id=chat_id, message_id=status_msg.message_id, text=error_msg_replaced)
+                if last_try:
+                    database.log_error(user_id=p["user_id"], platform=platform, url=url, error_msg=str(e))
+                    await _status(msg_error.render(platform=platform, error=e))
+                raise
             finally:
                 if results:
                     try:
                         downloader.cleanup(results)
+                        downloader.cleanup(_thumbs(meta))
                     except: pass
-    except Exception as e:
-        logger.error(f"FATAL error in handle_message: {e}", exc_info=True)
+    finally:
+        _inflight.pop(cache_key, None)
+        if not flight.done():
+            # Defer أو فشل سيُعاد أو انقطاع: ليس نهائياً، فالمنتظرون يعودون للطابور أيضاً
+            flight.set_exception(jobs.Defer(config.JOB_DEFER_DELAY))
+
+
+jobs.worker.register("download", run_download_job)
 
 
 # ─── دوال مساعدة ─────────────────────────────────────────────────────────────
-async def _check_subscriptions(update, context, user_id: int, chat_id: int) -> bool:
+async def _check_subscriptions(update, context, user_id: int, chat_id: int,
+                               settings: database.SettingsSnapshot) -> bool:
     """فحص اشتراك القنوات المطلوبة. يُعيد True إذا اجتاز المستخدم الفحص."""
-    required_str = database.get_setting("required_channels", "")
-    if not required_str.strip():
+    channels = settings.required_channels
+    if not channels:
         return True
 
-    channels   = [c.strip() for c in required_str.split(",") if c.strip()]
     not_joined = []
     results = await asyncio.gather(
-        *[_is_member(context, chat_id=ch, user_id=user_id) for ch in channels],
+        *[membership.is_member(context.bot, ch, user_id) for ch in channels],
         return_exceptions=True,
     )
     for ch, joined in zip(channels, results):
@@ -298,19 +530,22 @@ async def _check_subscriptions(update, context, user_id: int, chat_id: int) -> b
             not_joined.append(ch)
 
     if not_joined:
+        # الفحص التالي (بعد الانضمام) يجب أن يكون فعلياً لا من الذاكرة
+        membership.invalidate(user_id, not_joined)
         channels_list = "\n".join(f"👉 {ch}" for ch in not_joined)
-        msg = database.get_setting("msg_force_sub", "يجب الاشتراك في:\n{channels}").replace("{channels}", channels_list)
+        msg = settings.render("msg_force_sub", "يجب الاشتراك في:\n{channels}", channels=channels_list)
         await update.message.reply_text(msg)
         return False
     return True
 
 
-async def _is_member(context, chat_id: str, user_id: int) -> bool:
-    try:
-        member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-        return member.status not in ("left", "kicked")
-    except Exception:
-        return False
+async def _fetch_tt_videos(username: str) -> list:
+    return await asyncio.get_running_loop().run_in_executor(EXECUTOR, _tiktok.get_user_videos, username)
+
+
+async def _tt_listing(context, username: str) -> list | None:
+    """قائمة المقاطع التي عُرضت للمستخدم، أو القائمة المشتركة (بعد إعادة التشغيل)."""
+    return context.user_data.get(f"tt_videos_{username}") or await asyncio.to_thread(profile_cache.peek, username)
 
 
 async def _handle_tt_videos_from_callback(
@@ -322,8 +557,7 @@ async def _handle_tt_videos_from_callback(
         f"🔍 جاري جلب أحدث مقاطع الحساب @{username} على تيك توك..."
     )
     try:
-        loop = asyncio.get_running_loop()
-        videos = await loop.run_in_executor(EXECUTOR, _tiktok.get_user_videos, username)
+        videos = await profile_cache.get_videos(username, _fetch_tt_videos)
 
         if not videos:
             await status_msg.edit_text(
@@ -340,7 +574,7 @@ async def _handle_tt_videos_from_callback(
             duration = v.get("duration", 0)
             dur_str  = f" ({duration}s)" if duration else ""
             btn_text = f"🎵 {i+1}. {title}{dur_str}"[:40]
-            cb_data  = f"ttv:{username}:{i}"[:64]
+            cb_data  = f"ttv:{username}:{i}:{v.get('id', '')}"[:64]
             keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=cb_data)])
         keyboard.append([InlineKeyboardButton(
             text="📥 تحميل الكل", callback_data=f"ttvall:{username}"[:64]
@@ -359,6 +593,115 @@ async def _handle_tt_videos_from_callback(
         await status_msg.edit_text("عذراً، حدث خطأ. يرجى المحاولة لاحقاً ❌")
 
 
+# ─── "تحميل الكل" لحساب تيك توك ──────────────────────────────────────────────
+_ALBUM_SIZE = 10   # حد send_media_group
+
+
+async def _tt_fetch(video: dict, user_id: int, priority: int, gate: asyncio.Semaphore) -> tuple[list[str], dict]:
+    """تحميل مقطع واحد من الدفعة تحت حد التوازي وجدولة القبول، ثم مرحلة ffmpeg."""
+    async with gate:
+        async with scheduler.submit("TikTok", user_id, priority):
+            result = await _tiktok.download_video_async(video["play_url"], EXECUTOR)
+    paths = result.get("results")
+    if not paths:
+        raise ValueError("No downloadable media found")
+    paths = paths if isinstance(paths, list) else [paths]
+    meta: dict = {}
+    try:
+        paths, meta = await _prepare_videos(paths)
+        sizing.check_files(paths)
+    except BaseException:
+        # عند النجاح تنتقل الملفات للمستدعي؛ غير ذلك تُحذف هنا مع الصور المصغرة
+        _tiktok.cleanup(paths)
+        _tiktok.cleanup(_thumbs(meta))
+        raise
+    return paths, meta
+
+
+async def _tt_send_album(bot, chat_id: int, batch: list[tuple[str, dict | None, str]]) -> int:
+    """رفع دفعة (حتى 10 عناصر) كألبوم واحد بالترتيب الأصلي ثم حذف ملفاتها. يعيد عدد المرسل."""
+    from telegram import InputMediaPhoto, InputMediaVideo
+    opened = []
+    try:
+        if len(batch) == 1:
+            path, info, caption = batch[0]
+            fh = open(path, "rb")
+            opened.append(fh)
+            if path.lower().endswith(_IMAGE_EXTS):
+                await bot.send_photo(chat_id=chat_id, photo=fh, caption=caption)
+            else:
+                await bot.send_video(chat_id=chat_id, video=fh, caption=caption, **_video_extras(info, opened))
+            return 1
+
+        media = []
+        for path, info, caption in batch:
+            fh = open(path, "rb")
+            opened.append(fh)
+            if path.lower().endswith(_IMAGE_EXTS):
+                media.append(InputMediaPhoto(media=fh, caption=caption))
+            else:
+                media.append(InputMediaVideo(media=fh, caption=caption, **_video_extras(info, opened)))
+        await bot.send_media_group(chat_id=chat_id, media=media)
+        return len(media)
+    except Exception as e:
+        logger.error("Error uploading TikTok album (%d items): %s", len(batch), e)
+        return 0
+    finally:
+        for fh in opened:
+            fh.close()
+        _tiktok.cleanup([path for path, _, _ in batch])
+        _tiktok.cleanup([info["thumb"] for _, info, _ in batch if info and info.get("thumb")])
+
+
+async def _tt_download_all(bot, chat_id: int, user_id: int, username: str, videos: list, status_msg) -> None:
+    """تحميل كل مقاطع الحساب بتوازٍ محدود (TT_BATCH_CONCURRENCY) تحت جدولة القبول، ورفعها
+    كألبومات من 10 عناصر بالترتيب الأصلي. الرفع يتداخل مع التحميل: بينما يُرفع ألبوم
+    تستمر تحميلات المقاطع التالية."""
+    priority = _priority(database.get_whitelisted(user_id) is not None)
+    # لا فائدة من تجاوز حد طلبات المستخدم في طابور الجدولة
+    gate  = asyncio.Semaphore(max(1, min(config.TT_BATCH_CONCURRENCY, config.SCHED_MAX_PER_USER)))
+    tasks = [asyncio.create_task(_tt_fetch(v, user_id, priority, gate)) for v in videos]
+    batch: list[tuple[str, dict | None, str]] = []
+    sent  = 0
+    try:
+        for i, (video, task) in enumerate(zip(videos, tasks)):
+            if not task.done():
+                try:
+                    await status_msg.edit_text(f"📥 تحميل {i+1}/{len(videos)}...")
+                except Exception as e:
+                    logger.debug("Could not edit status message: %s", e)
+            try:
+                paths, meta = await task
+            except Exception as e:
+                logger.error("Error downloading TikTok video %d for @%s: %s", i, username, e)
+                continue
+
+            caption = f"👤 @{username}\n📝 {video.get('title', '')}"
+            for j, path in enumerate(paths):
+                batch.append((path, meta.get(path), caption if j == 0 else ""))
+                if len(batch) == _ALBUM_SIZE:
+                    sent += await _tt_send_album(bot, chat_id, batch)
+                    batch = []
+        if batch:
+            sent += await _tt_send_album(bot, chat_id, batch)
+            batch = []
+    finally:
+        for task in tasks:
+            task.cancel()
+        # ملفات حُمّلت ولم تُرفع (إلغاء أو خطأ غير متوقع)
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                paths, meta = task.result()
+                _tiktok.cleanup(paths)
+                _tiktok.cleanup(_thumbs(meta))
+        _tiktok.cleanup([path for path, _, _ in batch])
+
+    if sent:
+        await status_msg.delete()
+    else:
+        await status_msg.edit_text("عذراً، حدث خطأ أثناء التحميل ❌")
+
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query   = update.callback_query
     await query.answer()
@@ -367,8 +710,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     chat_id = query.message.chat_id
     user_id = query.from_user.id
 
-    db_user = database.get_user(user_id)
-    if db_user and db_user["is_banned"]:
+    if database.is_banned(user_id):
         return
 
     # ── اختيار المنصة (تيك توك فقط) ────────────────────────────────────────
@@ -386,22 +728,37 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         parts    = data.split(":")
         username = parts[1]
         index    = int(parts[2])
-
-        videos = context.user_data.get(f"tt_videos_{username}")
-        if not videos or index >= len(videos):
+        video_id = parts[3] if len(parts) > 3 else ""
+
+        videos = await _tt_listing(context, username) or []
+        # القائمة المشتركة قد تكون تحدثت منذ عرض الأزرار: المعرف أدق من الترتيب
+        video  = next((v for v in videos if video_id and v.get("id") == video_id), None)
+        if video is None and index < len(videos) and not video_id:
+            video = videos[index]
+        if video is None:
             await query.edit_message_text("❌ انتهت صلاحية القائمة. يرجى إرسال اسم المستخدم مجدداً.")
             return
 
-        video      = videos[index]
         status_msg = await query.message.reply_text("📥 جاري تحميل المقطع...")
+        settings   = database.get_settings_snapshot()
+        file_path  = None
+        meta       = {}
         try:
-            loop        = asyncio.get_running_loop()
-            result_dict = await loop.run_in_executor(
-                EXECUTOR, _tiktok.download_video, video["play_url"]
-            )
+            try:
+                ticket = scheduler.submit("TikTok", user_id, _priority(database.get_whitelisted(user_id) is not None))
+            except scheduler.QueueFull:
+                await status_msg.edit_text(settings.get("msg_busy", "⚠️ البوت مشغول جداً حالياً، يرجى المحاولة بعد قليل."))
+                return
+            await _announce_queue(status_msg.edit_text, ticket, settings.template(
+                "msg_queued", "⏳ أنت رقم {position} في الطابور (حوالي {eta} ثانية)..."
+            ))
+            async with ticket:
+                result_dict = await _tiktok.download_video_async(video["play_url"], EXECUTOR)
             file_path = result_dict.get("results")
             if not file_path:
                 raise ValueError("لم يتم التحميل بنجاح")
+            file_path, meta = await _prepare_videos(file_path)
+            sizing.check_files(file_path)
 
             await status_msg.edit_text("📤 جاري الرفع إلى تليجرام...")
             caption = f"👤 @{username}\n📝 {video.get('title', '')}"
@@ -417,28 +774,45 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                         if item.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
                             media.append(InputMediaPhoto(media=fh, caption=caption if not media else ""))
                         else:
-                            media.append(InputMediaVideo(media=fh, caption=caption if not media else ""))
+                            media.append(InputMediaVideo(
+                                media=fh, caption=caption if not media else "",
+                                **_video_extras(meta.get(item), opened_files),
+                            ))
                     if media:
                         await context.bot.send_media_group(chat_id=chat_id, media=media)
                 finally:
                     for fh in opened_files:
                         fh.close()
             else:
-                with open(file_path, "rb") as fh:
-                    await context.bot.send_video(chat_id=chat_id, video=fh, caption=caption)
+                opened_files = []
+                try:
+                    with open(file_path, "rb") as fh:
+                        await context.bot.send_video(
+                            chat_id=chat_id, video=fh, caption=caption,
+                            **_video_extras(meta.get(file_path), opened_files),
+                        )
+                finally:
+                    for fh in opened_files:
+                        fh.close()
 
             await status_msg.delete()
-            _tiktok.cleanup(file_path)
+        except sizing.MediaTooLarge as e:
+            await status_msg.edit_text(_too_large_text(e))
         except Exception as e:
             logger.error("Error downloading TikTok video: %s", e)
             database.log_error(user_id=user_id, platform="TikTok User Videos",
                                url=f"@{username}", error_msg=str(e))
             await status_msg.edit_text("عذراً، حدث خطأ أثناء التحميل ❌")
+        finally:
+            # أياً كانت النتيجة (إرسال أو خطأ Telegram أو ffmpeg) لا يبقى شيء في مجلد التحميل
+            if file_path:
+                _tiktok.cleanup(file_path)
+                _tiktok.cleanup(_thumbs(meta))
 
     # ── تحميل جميع مقاطع تيك توك ────────────────────────────────────────────
     elif data.startswith("ttvall:"):
         _, username = data.split(":", 1)
-        videos      = context.user_data.get(f"tt_videos_{username}")
+        videos      = await _tt_listing(context, username)
         if not videos:
             await query.edit_message_text("❌ انتهت صلاحية القائمة. يرجى إرسال اسم المستخدم مجدداً.")
             return
@@ -446,36 +820,4 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         status_msg = await query.message.reply_text(
             f"📥 جاري تحميل {len(videos)} مقطع... قد يستغرق هذا بعض الوقت."
         )
-        downloaded = []
-        for i, video in enumerate(videos):
-            try:
-                await status_msg.edit_text(f"📥 تحميل {i+1}/{len(videos)}...")
-                loop        = asyncio.get_running_loop()
-                result_dict = await loop.run_in_executor(
-                    EXECUTOR, _tiktok.download_video, video["play_url"]
-                )
-                file_path = result_dict.get("results")
-                if not file_path:
-                    continue
-                caption = f"👤 @{username}\n📝 {video.get('title', '')}"
-                if isinstance(file_path, list):
-                    for item in file_path:
-                        if item.lower().endswith((".mp4",)):
-                            with open(item, "rb") as fh:
-                                await context.bot.send_video(chat_id=chat_id, video=fh, caption=caption)
-                        else:
-                            with open(item, "rb") as fh:
-                                await context.bot.send_photo(chat_id=chat_id, photo=fh, caption=caption)
-                    _tiktok.cleanup(file_path)
-                else:
-                    with open(file_path, "rb") as fh:
-                        await context.bot.send_video(chat_id=chat_id, video=fh, caption=caption)
-                    _tiktok.cleanup(file_path)
-                downloaded.append(video)
-            except Exception as e:
-                logger.error("Error downloading TikTok video %d for @%s: %s", i, username, e)
-
-        if downloaded:
-            await status_msg.delete()
-        else:
-            await status_msg.edit_text("عذراً، حدث خطأ أثناء التحميل ❌")
+        await _tt_download_all(context.bot, chat_id, user_id, username, videos, status_msg)
@@ -0,0 +1,140 @@
+"""
+bot/media_cache.py - ذاكرة نتائج الرفع (file_id) حسب رابط الوسائط
+────────────────────────────────────────
+  - تربط كل منشور (بمفتاح downloaders.urls.canonicalize) بمعرفات file_id التي أعادها Telegram
+  - إعادة الإرسال عند التطابق تتم بالمعرف مباشرة بدون تحميل أو رفع
+  - تخزين دائم في SQLite (WAL) مع انتهاء صلاحية (TTL) وطرد الأقدم استخداماً (LRU)
+  - الإصابة قراءة فقط؛ last_used / hits تُكتب مرة كل MEDIA_CACHE_TOUCH_INTERVAL لكل مفتاح
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_conn: sqlite3.Connection | None = None
+_lock = threading.Lock()
+
+_pending_hits: dict[str, int] = {}   # إصابات لم تُكتب بعد في عمود hits
+
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0, "touches": 0}
+
+
+def _get_conn() -> sqlite3.Connection:
+    """فتح قاعدة الذاكرة مرة واحدة وإعادة استخدامها (يجب استدعاؤها داخل القفل)."""
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(config.MEDIA_CACHE_PATH), exist_ok=True)
+        _conn = sqlite3.connect(config.MEDIA_CACHE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS media_cache ("
+            " key TEXT PRIMARY KEY,"
+            " items TEXT NOT NULL,"
+            " caption TEXT NOT NULL DEFAULT '',"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_media_cache_last_used ON media_cache(last_used)")
+        _conn.commit()
+    return _conn
+
+
+def get(key: str) -> dict | None:
+    """جلب نتيجة مخزنة: {"items": [{"type", "file_id"}], "caption"} أو None."""
+    now = time.time()
+    try:
+        with _lock:
+            conn = _get_conn()
+            row = conn.execute(
+                "SELECT items, caption, created_at, last_used FROM media_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[2] > config.MEDIA_CACHE_TTL:
+                conn.execute("DELETE FROM media_cache WHERE key = ?", (key,))
+                conn.commit()
+                _stats["evictions"] += 1
+                row = None
+            if not row:
+                _stats["misses"] += 1
+                return None
+            hits = _pending_hits.pop(key, 0) + 1
+            if now - row[3] >= config.MEDIA_CACHE_TOUCH_INTERVAL:
+                # دقة LRU بالدقائق تكفي؛ الكتابة مع كل إصابة كانت أبطأ من التحميل الذي توفره
+                conn.execute(
+                    "UPDATE media_cache SET last_used = ?, hits = hits + ? WHERE key = ?", (now, hits, key)
+                )
+                conn.commit()
+                _stats["touches"] += 1
+            else:
+                _pending_hits[key] = hits
+            _stats["hits"] += 1
+            return {"items": json.loads(row[0]), "caption": row[1]}
+    except Exception as e:
+        logger.warning("⚠️ Media cache read failed: %s", e)
+        return None
+
+
+def put(key: str, items: list[dict], caption: str = "") -> None:
+    """تخزين معرفات الملفات المرفوعة لمنشور معين مع طرد الأقدم عند تجاوز الحد."""
+    if not items:
+        return
+    now = time.time()
+    try:
+        with _lock:
+            conn = _get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO media_cache (key, items, caption, created_at, last_used, hits)"
+                " VALUES (?, ?, ?, ?, ?, 0)",
+                (key, json.dumps(items), caption or "", now, now),
+            )
+            _pending_hits.pop(key, None)
+            _stats["stores"] += 1
+
+            count = conn.execute("SELECT COUNT(*) FROM media_cache").fetchone()[0]
+            overflow = count - config.MEDIA_CACHE_MAX_ENTRIES
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM media_cache WHERE key IN ("
+                    " SELECT key FROM media_cache ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                _stats["evictions"] += overflow
+            conn.commit()
+    except Exception as e:
+        logger.warning("⚠️ Media cache write failed: %s", e)
+
+
+def invalidate(key: str) -> None:
+    """حذف مدخل (مثلاً عند رفض Telegram لمعرف ملف قديم)."""
+    try:
+        with _lock:
+            conn = _get_conn()
+            conn.execute("DELETE FROM media_cache WHERE key = ?", (key,))
+            conn.commit()
+            _pending_hits.pop(key, None)
+            _stats["invalidations"] += 1
+    except Exception as e:
+        logger.warning("⚠️ Media cache invalidate failed: %s", e)
+
+
+def stats() -> dict:
+    """إحصائيات الذاكرة للوحة التحكم."""
+    entries = 0
+    try:
+        with _lock:
+            entries = _get_conn().execute("SELECT COUNT(*) FROM media_cache").fetchone()[0]
+    except Exception:
+        pass
+    total = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "entries":  entries,
+        "hit_rate": round(_stats["hits"] / total * 100, 1) if total else 0.0,
+    }
@@ -0,0 +1,51 @@
+"""
+bot/membership.py - ذاكرة فحص الاشتراك في القنوات الإجبارية
+────────────────────────────────────────
+  - كل رسالة كانت تستدعي get_chat_member لكل قناة مطلوبة (يستهلك حدود Flood في Bot API)
+  - النتيجة تُخزن لكل (مستخدم، قناة): المشترك لمدة MEMBERSHIP_TTL_POSITIVE،
+    وغير المشترك لمدة أقصر MEMBERSHIP_TTL_NEGATIVE
+  - عند مطالبة المستخدم بالاشتراك تُحذف نتائجه السلبية حتى يُفحص فعلياً بعد انضمامه
+  - عدادات الإصابة والاستدعاءات الموفرة للوحة التحكم
+"""
+import logging
+
+import config
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_cache = TTLCache(maxsize=config.MEMBERSHIP_CACHE_SIZE, ttl=config.MEMBERSHIP_TTL_POSITIVE)
+_stats = {"api_calls": 0, "api_errors": 0, "saved_calls": 0, "invalidations": 0}
+
+
+async def is_member(bot, channel: str, user_id: int) -> bool:
+    """هل المستخدم مشترك في القناة؟ (من الذاكرة إن أمكن)."""
+    key    = (user_id, channel)
+    cached = _cache.get(key)
+    if cached is not None:
+        _stats["saved_calls"] += 1
+        return cached
+
+    _stats["api_calls"] += 1
+    try:
+        member = await bot.get_chat_member(chat_id=channel, user_id=user_id)
+    except Exception as e:
+        # الخطأ لا يُخزن: قد يكون عابراً (Flood أو انقطاع)
+        _stats["api_errors"] += 1
+        logger.debug("get_chat_member failed for %s in %s: %s", user_id, channel, e)
+        return False
+    joined = member.status not in ("left", "kicked")
+    _cache.set(key, joined, None if joined else config.MEMBERSHIP_TTL_NEGATIVE)
+    return joined
+
+
+def invalidate(user_id: int, channels: list[str]) -> None:
+    """حذف نتائج المستخدم لهذه القنوات (بعد مطالبته بالاشتراك)."""
+    for channel in channels:
+        if _cache.pop((user_id, channel), None) is not None:
+            _stats["invalidations"] += 1
+
+
+def stats() -> dict:
+    """إحصائيات الذاكرة للوحة التحكم."""
+    return {**_stats, **_cache.stats()}
@@ -0,0 +1,177 @@
+"""
+bot/profile_cache.py - ذاكرة مشتركة لقوائم مقاطع حسابات تيك توك
+────────────────────────────────────────
+  - القائمة تُجلب مرة واحدة لكل حساب وتُشارك بين كل المستخدمين (بدل طلب TikWM لكل مستخدم)
+  - طازجة حتى PROFILE_CACHE_TTL، ثم تُقدَّم قديمة حتى PROFILE_CACHE_STALE مع تحديث في الخلفية
+  - الطلبات المتزامنة لنفس الحساب تنتظر جلباً واحداً (Single-flight)
+  - تخزين دائم في SQLite مع طرد الأقدم استخداماً؛ أزرار ttv / ttvall تعمل بعد إعادة التشغيل
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable
+
+import config
+
+logger = logging.getLogger(__name__)
+
+Fetcher = Callable[[str], Awaitable[list]]
+
+_conn: sqlite3.Connection | None = None
+_lock = threading.Lock()
+_inflight: dict[str, asyncio.Future] = {}
+_refreshing: set[asyncio.Task] = set()
+
+_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0,
+          "refresh_errors": 0, "evictions": 0}
+
+
+def _key(username: str) -> str:
+    return username.strip().lstrip("@").lower()
+
+
+def _get_conn() -> sqlite3.Connection:
+    """فتح قاعدة الذاكرة مرة واحدة وإعادة استخدامها (يجب استدعاؤها داخل القفل)."""
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(config.PROFILE_CACHE_PATH), exist_ok=True)
+        _conn = sqlite3.connect(config.PROFILE_CACHE_PATH, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS tt_profiles ("
+            " username TEXT PRIMARY KEY,"
+            " videos TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_tt_profiles_last_used ON tt_profiles(last_used)")
+        _conn.commit()
+    return _conn
+
+
+def _read(username: str) -> tuple[list, float] | None:
+    """القائمة وعمرها بالثواني، أو None إذا لم تكن موجودة أو تجاوزت نافذة التقديم."""
+    now = time.time()
+    try:
+        with _lock:
+            conn = _get_conn()
+            row = conn.execute(
+                "SELECT videos, fetched_at FROM tt_profiles WHERE username = ?", (username,)
+            ).fetchone()
+            if not row:
+                return None
+            age = now - row[1]
+            if age > config.PROFILE_CACHE_TTL + config.PROFILE_CACHE_STALE:
+                conn.execute("DELETE FROM tt_profiles WHERE username = ?", (username,))
+                conn.commit()
+                _stats["evictions"] += 1
+                return None
+            conn.execute("UPDATE tt_profiles SET last_used = ? WHERE username = ?", (now, username))
+            conn.commit()
+            return json.loads(row[0]), age
+    except Exception as e:
+        logger.warning("⚠️ Profile cache read failed: %s", e)
+        return None
+
+
+def _write(username: str, videos: list) -> None:
+    now = time.time()
+    try:
+        with _lock:
+            conn = _get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO tt_profiles (username, videos, fetched_at, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                (username, json.dumps(videos, ensure_ascii=False), now, now),
+            )
+            count = conn.execute("SELECT COUNT(*) FROM tt_profiles").fetchone()[0]
+            overflow = count - config.PROFILE_CACHE_MAX_ENTRIES
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM tt_profiles WHERE username IN ("
+                    " SELECT username FROM tt_profiles ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                _stats["evictions"] += overflow
+            conn.commit()
+    except Exception as e:
+        logger.warning("⚠️ Profile cache write failed: %s", e)
+
+
+async def _fetch(username: str, fetch: Fetcher) -> list:
+    """جلب واحد لكل حساب مهما تعدد الطالبون؛ النتائج الفارغة لا تُخزن."""
+    flight = _inflight.get(username)
+    if flight is not None:
+        _stats["coalesced"] += 1
+        return await asyncio.shield(flight)
+
+    flight = asyncio.get_running_loop().create_future()
+    flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight[username] = flight
+    try:
+        videos = await fetch(username)
+        if videos:
+            await asyncio.to_thread(_write, username, videos)
+        flight.set_result(videos)
+        return videos
+    except BaseException as e:
+        flight.set_exception(e if isinstance(e, Exception) else RuntimeError("Fetch was interrupted"))
+        raise
+    finally:
+        _inflight.pop(username, None)
+
+
+async def _refresh(username: str, fetch: Fetcher) -> None:
+    try:
+        await _fetch(username, fetch)
+        _stats["refreshes"] += 1
+    except Exception as e:
+        _stats["refresh_errors"] += 1
+        logger.warning("⚠️ Background refresh of @%s failed: %s", username, e)
+
+
+async def get_videos(username: str, fetch: Fetcher) -> list:
+    """قائمة مقاطع الحساب من الذاكرة، أو بجلبها عبر fetch(username) عند غيابها.
+    القائمة القديمة (بعد TTL) تُعاد فوراً ويُجدول تحديثها في الخلفية."""
+    key    = _key(username)
+    cached = await asyncio.to_thread(_read, key)
+    if cached is not None:
+        videos, age = cached
+        if age <= config.PROFILE_CACHE_TTL:
+            _stats["hits"] += 1
+        else:
+            _stats["stale_hits"] += 1
+            if key not in _inflight:
+                task = asyncio.create_task(_refresh(key, fetch))
+                _refreshing.add(task)
+                task.add_done_callback(_refreshing.discard)
+        return videos
+
+    _stats["misses"] += 1
+    return await _fetch(key, fetch)
+
+
+def peek(username: str) -> list | None:
+    """القائمة المخزنة دون جلب (لأزرار ttv / ttvall عندما لا تتوفر نسخة المستخدم)."""
+    cached = _read(_key(username))
+    return cached[0] if cached else None
+
+
+def stats() -> dict:
+    """إحصائيات الذاكرة للوحة التحكم."""
+    entries = 0
+    try:
+        with _lock:
+            entries = _get_conn().execute("SELECT COUNT(*) FROM tt_profiles").fetchone()[0]
+    except Exception:
+        pass
+    served = _stats["hits"] + _stats["stale_hits"]
+    total  = served + _stats["misses"]
+    return {
+        **_stats,
+        "entries":  entries,
+        "hit_rate": round(served / total * 100, 1) if total else 0.0,
+    }
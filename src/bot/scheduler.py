@@ -0,0 +1,256 @@
+"""
+bot/scheduler.py - جدولة قبول التحميلات (بدل Semaphore واحد للجميع)
+────────────────────────────────────────
+  - مجمع تزامن مستقل لكل منصة: تحميل Facebook بطيء لا يحجز مكان Instagram سريع
+  - حد أعلى إجمالي لحماية الذاكرة
+  - فئات أولوية: القائمة البيضاء أولاً
+  - عدالة بين المستخدمين داخل نفس الفئة (Round-robin) وحد لطلبات المستخدم في الطابور
+  - طابور محدود يرفض الزائد فوراً، مع تقدير الترتيب وزمن الانتظار
+  - مقاييس عمق الطابور وأزمنة الانتظار للوحة التحكم
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict, defaultdict, deque
+
+import config
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_WHITELIST = 0
+PRIORITY_NORMAL    = 1
+
+_DEFAULT_SERVICE_TIME = 20.0   # تقدير مبدئي لزمن التحميل قبل توفر قياسات
+
+
+class QueueFull(Exception):
+    """الطابور ممتلئ (أو تجاوز المستخدم حد طلباته المنتظرة)."""
+
+
+class Ticket:
+    """تذكرة انتظار؛ تُستخدم كـ async context manager يحجز مكاناً في مجمع المنصة."""
+
+    def __init__(self, platform: str, user_id: int, priority: int):
+        self.platform   = platform
+        self.user_id    = user_id
+        self.priority   = priority
+        self.seq        = next(_seq)
+        self.queued_at  = time.monotonic()
+        self.granted_at: float | None = None
+        self._granted   = asyncio.get_running_loop().create_future()
+
+    @property
+    def waiting(self) -> bool:
+        return not self._granted.done()
+
+    def position(self) -> int:
+        """عدد الطلبات التي ستُخدم قبل هذه التذكرة في مجمع منصتها (0 = التالي)."""
+        return _position(self)
+
+    def estimated_wait(self) -> float:
+        """تقدير زمن الانتظار بالثواني."""
+        if not self.waiting:
+            return 0.0
+        limit = _limit(self.platform)
+        rounds = self.position() // limit + 1
+        return rounds * _service_time[self.platform]
+
+    def abandon(self) -> None:
+        """تحرير المكان أو الخروج من الطابور لتذكرة لن تدخل async with
+        (إلغاء أو خطأ بين submit والدخول)؛ آمنة للاستدعاء أكثر من مرة."""
+        if self._granted.done() and not self._granted.cancelled():
+            _release(self)
+        else:
+            self._granted.cancel()
+            _remove(self)
+
+    async def __aenter__(self) -> "Ticket":
+        try:
+            await self._granted
+        except asyncio.CancelledError:
+            if self._granted.done() and not self._granted.cancelled():
+                _release(self)
+            else:
+                _remove(self)
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        _release(self)
+
+
+# ─── الحالة ──────────────────────────────────────────────────────────────────
+_seq = itertools.count()
+_active: dict[str, int] = defaultdict(int)
+_active_total = 0
+# المنصة ← الأولوية ← (المستخدم ← تذاكره بالترتيب)؛ ترتيب المستخدمين = دور الـ Round-robin
+_queues: dict[str, dict[int, "OrderedDict[int, deque[Ticket]]"]] = defaultdict(
+    lambda: defaultdict(OrderedDict)
+)
+_waiting_total = 0
+_service_time: dict[str, float] = defaultdict(lambda: _DEFAULT_SERVICE_TIME)
+_wait_samples: dict[str, deque] = defaultdict(lambda: deque(maxlen=200))
+_counters = {"admitted": 0, "enqueued": 0, "rejected": 0, "completed": 0}
+
+
+def _limit(platform: str) -> int:
+    return config.SCHED_PLATFORM_LIMITS.get(platform, config.SCHED_PLATFORM_LIMITS.get("Generic", 2))
+
+
+def _user_waiting(user_id: int) -> int:
+    return sum(
+        len(users.get(user_id, ()))
+        for classes in _queues.values()
+        for users in classes.values()
+    )
+
+
+def submit(platform: str, user_id: int, priority: int = PRIORITY_NORMAL) -> Ticket:
+    """تسجيل طلب؛ يُمنح مكاناً فوراً إن أمكن وإلا يدخل الطابور. يرفع QueueFull عند الامتلاء."""
+    global _waiting_total
+    ticket = Ticket(platform, user_id, priority)
+    _dispatch()
+    if _can_admit(platform) and not _has_waiting(platform):
+        _grant(ticket)
+        return ticket
+
+    if _waiting_total >= config.SCHED_MAX_QUEUE or _user_waiting(user_id) >= config.SCHED_MAX_PER_USER:
+        _counters["rejected"] += 1
+        raise QueueFull(platform)
+
+    users = _queues[platform][priority]
+    users.setdefault(user_id, deque()).append(ticket)
+    _waiting_total += 1
+    _counters["enqueued"] += 1
+    return ticket
+
+
+def _can_admit(platform: str) -> bool:
+    return _active_total < config.SCHED_MAX_ACTIVE and _active[platform] < _limit(platform)
+
+
+def _has_waiting(platform: str) -> bool:
+    return any(users for users in _queues[platform].values())
+
+
+def _grant(ticket: Ticket) -> None:
+    global _active_total
+    _active[ticket.platform] += 1
+    _active_total += 1
+    ticket.granted_at = time.monotonic()
+    _wait_samples[ticket.platform].append(ticket.granted_at - ticket.queued_at)
+    _counters["admitted"] += 1
+    ticket._granted.set_result(None)
+
+
+def _head(platform: str) -> tuple[int, int, Ticket] | None:
+    """التذكرة التالية في مجمع المنصة: أعلى فئة أولوية، ثم دور المستخدم."""
+    for priority in sorted(_queues[platform]):
+        users = _queues[platform][priority]
+        if users:
+            user_id = next(iter(users))
+            return priority, user_id, users[user_id][0]
+    return None
+
+
+def _dispatch() -> None:
+    """منح الأماكن الشاغرة؛ بين المنصات يُختار الأعلى أولوية ثم الأقدم."""
+    global _waiting_total
+    while _active_total < config.SCHED_MAX_ACTIVE:
+        candidates = [
+            head for platform in list(_queues)
+            if _active[platform] < _limit(platform) and (head := _head(platform))
+        ]
+        if not candidates:
+            return
+        priority, user_id, ticket = min(candidates, key=lambda h: (h[0], h[2].seq))
+        users = _queues[ticket.platform][priority]
+        users[user_id].popleft()
+        if users[user_id]:
+            users.move_to_end(user_id)   # دور المستخدم التالي
+        else:
+            del users[user_id]
+        _waiting_total -= 1
+        if ticket._granted.cancelled():
+            continue
+        _grant(ticket)
+
+
+def _remove(ticket: Ticket) -> None:
+    """إزالة تذكرة أُلغيت قبل منحها."""
+    global _waiting_total
+    users = _queues[ticket.platform][ticket.priority]
+    pending = users.get(ticket.user_id)
+    if pending and ticket in pending:
+        pending.remove(ticket)
+        if not pending:
+            del users[ticket.user_id]
+        _waiting_total -= 1
+
+
+def _release(ticket: Ticket) -> None:
+    global _active_total
+    if ticket.granted_at is None:
+        return
+    _active[ticket.platform] -= 1
+    _active_total -= 1
+    elapsed = time.monotonic() - ticket.granted_at
+    ticket.granted_at = None
+    _service_time[ticket.platform] = 0.8 * _service_time[ticket.platform] + 0.2 * elapsed
+    _counters["completed"] += 1
+    _dispatch()
+
+
+def _position(ticket: Ticket) -> int:
+    if not ticket.waiting:
+        return 0
+    classes = _queues[ticket.platform]
+    ahead = sum(
+        len(q) for priority, users in classes.items() if priority < ticket.priority
+        for q in users.values()
+    )
+    users = classes[ticket.priority]
+    mine = users.get(ticket.user_id)
+    if not mine or ticket not in mine:
+        return ahead
+    k = mine.index(ticket)
+    before_me = True
+    for user_id, q in users.items():
+        if user_id == ticket.user_id:
+            before_me = False
+            ahead += k
+        else:
+            # Round-robin: المستخدمون قبلي يُخدمون k+1 مرة قبل تذكرتي، ومن بعدي k مرة
+            ahead += min(len(q), k + 1 if before_me else k)
+    return ahead
+
+
+def _p95(samples) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def stats() -> dict:
+    """عمق الطابور وأزمنة الانتظار لكل منصة."""
+    platforms = {}
+    for platform in sorted(set(_queues) | set(_active) | set(config.SCHED_PLATFORM_LIMITS)):
+        waits = _wait_samples.get(platform, ())
+        platforms[platform] = {
+            "limit":        _limit(platform),
+            "active":       _active.get(platform, 0),
+            "queued":       sum(len(q) for users in _queues[platform].values() for q in users.values()),
+            "avg_wait":     round(sum(waits) / len(waits), 2) if waits else 0.0,
+            "p95_wait":     round(_p95(waits), 2),
+            "service_time": round(_service_time[platform], 2),
+        }
+    return {
+        **_counters,
+        "active":     _active_total,
+        "max_active": config.SCHED_MAX_ACTIVE,
+        "queued":     _waiting_total,
+        "max_queue":  config.SCHED_MAX_QUEUE,
+        "platforms":  platforms,
+    }
@@ -0,0 +1,121 @@
+"""
+bot/user_profiles.py - تحديث بيانات المستخدم (الاسم والصورة) عند الحاجة فقط
+────────────────────────────────────────
+  - كل رسالة كانت تكلف استدعاءين لـ Bot API (الصور ثم الملف) وقراءة من Firestore
+  - ذاكرة لكل مستخدم: لا تحديث قبل مرور USER_PROFILE_REFRESH ما لم يتغير الاسم أو المعرف
+  - التحديثات تُجمع وتُنفذ في الخلفية على دفعات بتوازٍ محدود
+  - عدادات للتحديثات المنفذة والمتخطاة للوحة التحكم
+"""
+import asyncio
+import logging
+
+import config
+from data import database
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# المستخدم ← (username, first_name) عند آخر تحديث؛ انتهاء الصلاحية = موعد التحديث التالي
+_seen = TTLCache(maxsize=config.USER_PROFILE_CACHE_SIZE, ttl=config.USER_PROFILE_REFRESH)
+_pending: dict[int, tuple[str | None, str | None]] = {}
+_wakeup: asyncio.Event | None = None
+_task: asyncio.Task | None = None
+
+_stats = {"touched": 0, "skipped": 0, "queued": 0, "refreshed": 0, "photo_errors": 0, "batches": 0}
+
+
+async def _get_photo(bot, user_id: int) -> tuple[str | None, str | None]:
+    try:
+        photos = await bot.get_user_profile_photos(user_id, limit=1)
+        if photos.total_count > 0:
+            photo_size = photos.photos[0][0]
+            f = await bot.get_file(photo_size.file_id)
+            return f.file_path, photo_size.file_id
+    except Exception as e:
+        _stats["photo_errors"] += 1
+        # إعادة المحاولة مع الرسالة التالية بدل انتظار دورة كاملة
+        _seen.pop(user_id)
+        logger.debug("Could not fetch profile photo for %s: %s", user_id, e)
+    return None, None
+
+
+def _upsert_all(rows: list[dict]) -> None:
+    for row in rows:
+        try:
+            database.upsert_user(**row)
+        except Exception as e:
+            logger.warning("⚠️ Profile upsert failed for %s: %s", row["user_id"], e)
+
+
+async def _refresh_batch(bot, batch: dict[int, tuple[str | None, str | None]]) -> None:
+    gate = asyncio.Semaphore(config.USER_PROFILE_CONCURRENCY)
+
+    async def _row(user_id: int, identity: tuple[str | None, str | None]) -> dict:
+        async with gate:
+            photo_url, photo_file_id = await _get_photo(bot, user_id)
+        return {
+            "user_id":       user_id,
+            "username":      identity[0],
+            "first_name":    identity[1],
+            "photo_url":     photo_url,
+            "photo_file_id": photo_file_id,
+        }
+
+    rows = await asyncio.gather(*(_row(uid, identity) for uid, identity in batch.items()))
+    await asyncio.to_thread(_upsert_all, rows)
+    _stats["refreshed"] += len(rows)
+    _stats["batches"]   += 1
+
+
+async def _worker(bot) -> None:
+    while True:
+        await _wakeup.wait()
+        # مهلة قصيرة لتجميع الرسائل المتقاربة في دفعة واحدة
+        await asyncio.sleep(config.USER_PROFILE_BATCH_DELAY)
+        _wakeup.clear()
+        user_ids = list(_pending)[:config.USER_PROFILE_BATCH_SIZE]
+        batch    = {uid: _pending.pop(uid) for uid in user_ids}
+        if _pending:
+            _wakeup.set()
+        try:
+            await _refresh_batch(bot, batch)
+        except Exception as e:
+            logger.error("❌ Profile refresh batch failed: %s", e)
+
+
+def _ensure_worker(bot) -> None:
+    global _wakeup, _task
+    if _task is None or _task.done():
+        _wakeup = asyncio.Event()
+        _task   = asyncio.create_task(_worker(bot))
+
+
+async def touch(bot, user, wait: bool = False) -> None:
+    """تسجيل نشاط مستخدم؛ يُحدَّث فقط إذا انتهت صلاحية ذاكرته أو تغير اسمه.
+    wait=True ينفذ التحديث فوراً (مثل /start: المستخدم الجديد يظهر في لوحة التحكم مباشرة)."""
+    _stats["touched"] += 1
+    identity = (user.username, user.first_name)
+    if _seen.get(user.id) == identity:
+        _stats["skipped"] += 1
+        return
+    _seen.set(user.id, identity)
+
+    if wait:
+        _pending.pop(user.id, None)
+        await _refresh_batch(bot, {user.id: identity})
+        return
+    _pending[user.id] = identity
+    _stats["queued"] += 1
+    _ensure_worker(bot)
+    _wakeup.set()
+
+
+def stats() -> dict:
+    """إحصائيات التحديث للوحة التحكم."""
+    touched = _stats["touched"]
+    return {
+        **_stats,
+        "pending":   len(_pending),
+        "cached":    len(_seen),
+        "skip_rate": round(_stats["skipped"] / touched * 100, 1) if touched else 0.0,
+    }
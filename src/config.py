@@ -52,8 +52,140 @@ WEBHOOK_PORT: int   = int(os.environ.get("PORT", 8080))
 # ─── Database ─────────────────────────────────────────────────────────────────
 DB_PATH: str = os.path.join(BASE_DIR, "data", "users.db")
 
+# ─── Firestore Usage Tracking (تجميع في الذاكرة ثم كتابة دفعة واحدة) ────────
+USAGE_FLUSH_INTERVAL: int  = int(os.environ.get("USAGE_FLUSH_INTERVAL", 30))
+USAGE_FLUSH_THRESHOLD: int = int(os.environ.get("USAGE_FLUSH_THRESHOLD", 500))
+USAGE_SHARDS: int          = int(os.environ.get("USAGE_SHARDS", 4))
+
+# ─── Settings Replication (مستمع Firestore، والاستطلاع عند انقطاعه) ──────────
+SETTINGS_POLL_INTERVAL: int  = int(os.environ.get("SETTINGS_POLL_INTERVAL", 15))
+
+# ─── User / Access Cache (ذاكرة حالة المستخدمين والمحظورين والقائمة البيضاء) ──
+USER_CACHE_SIZE: int         = int(os.environ.get("USER_CACHE_SIZE", 20000))
+USER_CACHE_TTL: int          = int(os.environ.get("USER_CACHE_TTL", 1800))
+ACCESS_REFRESH_INTERVAL: int = int(os.environ.get("ACCESS_REFRESH_INTERVAL", 60))
+ACCESS_FULL_SYNC: int        = int(os.environ.get("ACCESS_FULL_SYNC", 3600))
+
 # ─── Downloads ────────────────────────────────────────────────────────────────
 DOWNLOADS_DIR: str = os.path.join(BASE_DIR, "..", "downloads")
+# حد الرفع في Bot API (50MB؛ يصل إلى 2000MB مع خادم Bot API محلي)
+TELEGRAM_UPLOAD_LIMIT_MB: float = float(os.environ.get("TELEGRAM_UPLOAD_LIMIT_MB", 50))
+# خيوط yt-dlp فقط (بقية التحميلات غير متزامنة)
+YTDLP_THREADS: int = int(os.environ.get("YTDLP_THREADS", 6))
+# تشغيل استخراج yt-dlp في مجمع عمليات منفصل بدل الخيوط (اختياري)
+YTDLP_PROCESS_POOL: bool        = os.environ.get("YTDLP_PROCESS_POOL", "0") in ("1", "true", "True")
+YTDLP_PROCESS_WORKERS: int      = int(os.environ.get("YTDLP_PROCESS_WORKERS", min(4, os.cpu_count() or 1)))
+YTDLP_MAX_TASKS_PER_WORKER: int = int(os.environ.get("YTDLP_MAX_TASKS_PER_WORKER", 50))
+YTDLP_WORKER_RSS_MB: int        = int(os.environ.get("YTDLP_WORKER_RSS_MB", 512))
+# مرحلة ffmpeg بعد التحميل (Remux +faststart / ضغط / صورة مصغرة)
+FFMPEG_ENABLED: bool      = os.environ.get("FFMPEG_ENABLED", "1") in ("1", "true", "True")
+FFMPEG_WORKERS: int       = int(os.environ.get("FFMPEG_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+FFMPEG_TIMEOUT: float     = float(os.environ.get("FFMPEG_TIMEOUT", 300))
+# أقصى حجم يُحمّل بقصد الضغط (مضاعف لحد الرفع)
+COMPRESS_MAX_RATIO: float = float(os.environ.get("COMPRESS_MAX_RATIO", 4))
+# عدد صور الألبوم (Slideshow) التي تُحمّل بالتوازي لكل منشور
+SLIDESHOW_CONCURRENCY: int = int(os.environ.get("SLIDESHOW_CONCURRENCY", 6))
+# عدد مقاطع "تحميل الكل" لحساب تيك توك التي تُحمّل بالتوازي (ضمن SCHED_MAX_PER_USER)
+TT_BATCH_CONCURRENCY: int  = int(os.environ.get("TT_BATCH_CONCURRENCY", 3))
+
+# ─── Download Scheduler (مجمع لكل منصة + أولوية + طابور محدود) ─────────────
+SCHED_MAX_ACTIVE: int   = int(os.environ.get("SCHED_MAX_ACTIVE", 6))
+SCHED_PLATFORM_LIMITS: dict[str, int] = {
+    name.strip(): int(limit)
+    for name, limit in (
+        item.split(":", 1) for item in os.environ.get(
+            "SCHED_PLATFORM_LIMITS", "Instagram:4,TikTok:4,Facebook:2,Generic:2"
+        ).split(",") if ":" in item
+    )
+}
+SCHED_MAX_QUEUE: int    = int(os.environ.get("SCHED_MAX_QUEUE", 100))
+SCHED_MAX_PER_USER: int = int(os.environ.get("SCHED_MAX_PER_USER", 3))
+
+# ─── Job Queue (طابور تحميل دائم منفصل عن الـ Webhook) ──────────────────────
+JOB_QUEUE_BACKEND: str        = os.environ.get("JOB_QUEUE_BACKEND", "sqlite")
+JOB_QUEUE_PATH: str           = os.path.join(BASE_DIR, "data", "jobs.db")
+# عدد العمّال داخل عملية البوت (0 = العمّال في عملية مستقلة: python src/worker.py)
+JOB_WORKERS: int              = int(os.environ.get("JOB_WORKERS", 8))
+JOB_MAX_ATTEMPTS: int         = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_VISIBILITY_TIMEOUT: int   = int(os.environ.get("JOB_VISIBILITY_TIMEOUT", 600))
+JOB_RETRY_DELAY: float        = float(os.environ.get("JOB_RETRY_DELAY", 10))
+JOB_POLL_INTERVAL: float      = float(os.environ.get("JOB_POLL_INTERVAL", 2))
+JOB_RETENTION: int            = int(os.environ.get("JOB_RETENTION", 24 * 3600))
+# مهلة إعادة المهمة للطابور عند امتلاء طابور المجدول (لا تُحتسب محاولة)
+JOB_DEFER_DELAY: float        = float(os.environ.get("JOB_DEFER_DELAY", 5))
+# أقصى عدد مهام معلقة لكل مستخدم في الطابور الدائم (يحفظ العدالة بين المستخدمين)
+JOB_MAX_PENDING_PER_USER: int = int(os.environ.get("JOB_MAX_PENDING_PER_USER", 5))
+
+# ─── Hedged Strategies (تشغيل الاستراتيجية التالية بالتوازي عند التأخر) ───────
+HEDGE_ENABLED: bool        = os.environ.get("HEDGE_ENABLED", "1") not in ("0", "false", "False")
+HEDGE_DEFAULT_DELAY: float = float(os.environ.get("HEDGE_DEFAULT_DELAY", 8))
+HEDGE_MIN_DELAY: float     = float(os.environ.get("HEDGE_MIN_DELAY", 2))
+HEDGE_MIN_SAMPLES: int     = int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+
+# ─── Adaptive Ordering (ترتيب المحاولات حسب النجاح والزمن الحي) ────────────────
+SCOREBOARD_ALPHA: float      = float(os.environ.get("SCOREBOARD_ALPHA", 0.2))
+SCOREBOARD_MIN_SAMPLES: int  = int(os.environ.get("SCOREBOARD_MIN_SAMPLES", 5))
+SCOREBOARD_EXPLORE: float    = float(os.environ.get("SCOREBOARD_EXPLORE", 0.05))
+
+# ─── Media Cache (إعادة الإرسال بـ file_id بدون تحميل) ───────────────────────
+MEDIA_CACHE_PATH: str        = os.path.join(BASE_DIR, "data", "media_cache.db")
+MEDIA_CACHE_TTL: int         = int(os.environ.get("MEDIA_CACHE_TTL", 7 * 24 * 3600))
+MEDIA_CACHE_MAX_ENTRIES: int = int(os.environ.get("MEDIA_CACHE_MAX_ENTRIES", 5000))
+MEDIA_CACHE_TOUCH_INTERVAL: int = int(os.environ.get("MEDIA_CACHE_TOUCH_INTERVAL", 300))
+
+# ─── Message Log (سجل الرسائل المحلي للوحة التحكم) ───────────────────────────
+MESSAGE_LOG_PATH: str           = os.path.join(BASE_DIR, "data", "messages.db")
+MESSAGE_LOG_RETENTION_DAYS: int = int(os.environ.get("MESSAGE_LOG_RETENTION_DAYS", 30))
+MESSAGE_LOG_MAX_ROWS: int       = int(os.environ.get("MESSAGE_LOG_MAX_ROWS", 200000))
+
+# ─── User Profiles (تحديث الاسم والصورة عند انتهاء المدة فقط، على دفعات) ──────
+USER_PROFILE_REFRESH: int      = int(os.environ.get("USER_PROFILE_REFRESH", 3600))
+USER_PROFILE_CACHE_SIZE: int   = int(os.environ.get("USER_PROFILE_CACHE_SIZE", 50000))
+USER_PROFILE_BATCH_SIZE: int   = int(os.environ.get("USER_PROFILE_BATCH_SIZE", 50))
+USER_PROFILE_BATCH_DELAY: float = float(os.environ.get("USER_PROFILE_BATCH_DELAY", 2))
+USER_PROFILE_CONCURRENCY: int  = int(os.environ.get("USER_PROFILE_CONCURRENCY", 5))
+
+# ─── Membership Cache (نتائج فحص الاشتراك في القنوات الإجبارية) ────────────────
+MEMBERSHIP_TTL_POSITIVE: int = int(os.environ.get("MEMBERSHIP_TTL_POSITIVE", 900))
+MEMBERSHIP_TTL_NEGATIVE: int = int(os.environ.get("MEMBERSHIP_TTL_NEGATIVE", 30))
+MEMBERSHIP_CACHE_SIZE: int   = int(os.environ.get("MEMBERSHIP_CACHE_SIZE", 100000))
+
+# ─── Profile Cache (قوائم مقاطع حسابات تيك توك المشتركة بين المستخدمين) ────────
+PROFILE_CACHE_PATH: str        = os.path.join(BASE_DIR, "data", "profile_cache.db")
+PROFILE_CACHE_TTL: int         = int(os.environ.get("PROFILE_CACHE_TTL", 600))
+PROFILE_CACHE_STALE: int       = int(os.environ.get("PROFILE_CACHE_STALE", 6 * 3600))
+PROFILE_CACHE_MAX_ENTRIES: int = int(os.environ.get("PROFILE_CACHE_MAX_ENTRIES", 2000))
+
+# ─── HTTP Connection Pool (مشترك بين وحدات التحميل) ─────────────────────────
+HTTP_POOL_MAX_CONNECTIONS: int = int(os.environ.get("HTTP_POOL_MAX_CONNECTIONS", 100))
+HTTP_POOL_MAX_KEEPALIVE: int   = int(os.environ.get("HTTP_POOL_MAX_KEEPALIVE", 20))
+HTTP_POOL_HOSTS: int           = int(os.environ.get("HTTP_POOL_HOSTS", 32))
+HTTP_POOL_IDLE_SECONDS: int    = int(os.environ.get("HTTP_POOL_IDLE_SECONDS", 90))
+DNS_CACHE_TTL: int             = int(os.environ.get("DNS_CACHE_TTL", 300))
+
+# ─── Segmented Downloads (نطاقات Range متوازية لملفات CDN الكبيرة) ─────────────
+DOWNLOAD_SEGMENTS: int        = int(os.environ.get("DOWNLOAD_SEGMENTS", 4))
+DOWNLOAD_SEGMENT_MIN_KB: int  = int(os.environ.get("DOWNLOAD_SEGMENT_MIN_KB", 2048))
+DOWNLOAD_SEGMENT_RETRIES: int = int(os.environ.get("DOWNLOAD_SEGMENT_RETRIES", 3))
+DOWNLOAD_CHUNK_KB: int        = int(os.environ.get("DOWNLOAD_CHUNK_KB", 64))
+
+# ─── Proxy Pool (فحص البروكسيات في الخلفية واختيار موزون بالنقاط) ─────────────
+PROXY_PROBE_INTERVAL: int       = int(os.environ.get("PROXY_PROBE_INTERVAL", 120))
+PROXY_PROBE_TIMEOUT: float      = float(os.environ.get("PROXY_PROBE_TIMEOUT", 6))
+PROXY_PROBE_CONCURRENCY: int    = int(os.environ.get("PROXY_PROBE_CONCURRENCY", 20))
+PROXY_PROBE_TARGETS: list[str]  = [
+    t.strip() for t in os.environ.get(
+        "PROXY_PROBE_TARGETS", "https://snapreels.net,https://www.tiktok.com,https://www.instagram.com"
+    ).split(",") if t.strip()
+]
+PROXY_EWMA_ALPHA: float         = float(os.environ.get("PROXY_EWMA_ALPHA", 0.3))
+PROXY_BREAKER_THRESHOLD: int    = int(os.environ.get("PROXY_BREAKER_THRESHOLD", 3))
+PROXY_BREAKER_COOLDOWN: int     = int(os.environ.get("PROXY_BREAKER_COOLDOWN", 300))
+# محاولة half-open بلا نتيجة مسجلة (أُلغيت أو سبقتها استراتيجية أخرى) تسقط بعد هذه المهلة
+PROXY_TRIAL_TIMEOUT: int        = int(os.environ.get("PROXY_TRIAL_TIMEOUT", 60))
+# فحص البروكسيات من لوحة التحكم
+PROXY_CHECK_CONCURRENCY: int    = int(os.environ.get("PROXY_CHECK_CONCURRENCY", 200))
+PROXY_CHECK_TIMEOUT: float      = float(os.environ.get("PROXY_CHECK_TIMEOUT", 8))
 
 # ─── Cookies (في data/cookies/ حتى يصلها Docker) ─────────────────────────────
 COOKIES_DIR: str      = os.path.join(BASE_DIR, "data", "cookies")
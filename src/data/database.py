@@ -1,18 +1,26 @@
+import atexit
 import datetime
 import logging
 import threading
+import time
 import os
+import random
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping
 
 import config
+from data import message_log
 from google.cloud import firestore
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 # ─── Firestore Client (Singleton) ────────────────────────────────────────────
 _db: firestore.Client | None = None
 _db_lock    = threading.Lock()
-_cache_lock = threading.Lock()
-_settings_cache: dict = {}
 
 
 def _get_db() -> firestore.Client:
@@ -53,40 +61,110 @@ def _col_whitelist(): return _get_col("whitelist")
 def _col_usage():     return _get_col("usage_stats")
 
 
-# ─── عداد الاستهلاك (Quota Tracking) ──────────────────────────────────────────
+# ─── عدادات الاستهلاك (Write-behind) ─────────────────────────────────────────
+# - _track_usage يجمع في الذاكرة فقط؛ التفريغ كتابة Batch واحدة كل USAGE_FLUSH_INTERVAL
+#   أو عند تجاوز USAGE_FLUSH_THRESHOLD عملية، وعند إيقاف العملية
+# - عداد اليوم موزع على USAGE_SHARDS مستند (<date>، <date>_1، ...) لتفادي حد الكتابة
+#   المستمرة على مستند واحد؛ get_usage_today يجمعها بقراءة واحدة (get_all)
+_usage_lock    = threading.Lock()
+_usage_wakeup  = threading.Event()
+_usage_pending: dict[str, dict[str, int]] = {}   # اليوم ← {"reads", "writes", "deletes"}
+_usage_thread: threading.Thread | None = None
+_usage_stats   = {"flushes": 0, "flushed_ops": 0, "flush_errors": 0}
+
+
+def _usage_day() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d")
+
+
+def _usage_shard_ids(day: str) -> list[str]:
+    # الجزء 0 يحمل اسم اليوم نفسه (متوافق مع المستندات السابقة)
+    return [day] + [f"{day}_{i}" for i in range(1, max(1, config.USAGE_SHARDS))]
+
+
 def _track_usage(reads: int = 0, writes: int = 0, deletes: int = 0):
-    """تتبع استهلاك العمليات في Firestore لليوم الحالي بشكل محصن."""
+    """تسجيل استهلاك العمليات في Firestore لليوم الحالي (في الذاكرة؛ يُفرَّغ لاحقاً)."""
+    global _usage_thread
+    with _usage_lock:
+        counts = _usage_pending.setdefault(_usage_day(), {"reads": 0, "writes": 0, "deletes": 0})
+        counts["reads"]   += reads
+        counts["writes"]  += writes
+        counts["deletes"] += deletes
+        pending = sum(sum(c.values()) for c in _usage_pending.values())
+        if _usage_thread is None:
+            _usage_thread = threading.Thread(target=_usage_flusher, name="usage-flush", daemon=True)
+            _usage_thread.start()
+    if pending >= config.USAGE_FLUSH_THRESHOLD:
+        _usage_wakeup.set()
+
+
+def _usage_flusher() -> None:
+    while True:
+        _usage_wakeup.wait(config.USAGE_FLUSH_INTERVAL)
+        _usage_wakeup.clear()
+        flush_usage()
+
+
+def flush_usage() -> None:
+    """كتابة العدادات المتراكمة دفعة واحدة؛ عند الفشل تعود للذاكرة لتُكتب في التفريغ التالي."""
+    with _usage_lock:
+        pending = {day: c for day, c in _usage_pending.items() if any(c.values())}
+        _usage_pending.clear()
+    if not pending:
+        return
+    db = _get_db()
+    if db is None:
+        return
     try:
-        col = _col_usage()
-        if not col: return
-        
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
-        doc_ref = col.document(today)
-        
-        data = {}
-        if reads > 0:   data["reads"]   = firestore.Increment(reads)
-        if writes > 0:  data["writes"]  = firestore.Increment(writes)
-        if deletes > 0: data["deletes"] = firestore.Increment(deletes)
-        
-        if data:
+        col   = _col_usage()
+        batch = db.batch()
+        for day, counts in pending.items():
+            data = {k: firestore.Increment(v) for k, v in counts.items() if v}
             data["last_update"] = firestore.SERVER_TIMESTAMP
-            doc_ref.set(data, merge=True)
+            batch.set(col.document(random.choice(_usage_shard_ids(day))), data, merge=True)
+        batch.commit()
+        _usage_stats["flushes"]     += 1
+        _usage_stats["flushed_ops"] += sum(sum(c.values()) for c in pending.values())
     except Exception as e:
-        logger.debug(f"Usage tracking skipped: {e}")
+        _usage_stats["flush_errors"] += 1
+        logger.debug(f"Usage flush failed, keeping counters: {e}")
+        with _usage_lock:
+            for day, counts in pending.items():
+                merged = _usage_pending.setdefault(day, {"reads": 0, "writes": 0, "deletes": 0})
+                for k, v in counts.items():
+                    merged[k] += v
+
+
+atexit.register(flush_usage)
+
 
 def get_usage_today() -> dict:
-    """جلب إحصائيات الاستهلاك لليوم الحالي."""
-    col = _col_usage()
-    if not col: return {"reads": 0, "writes": 0, "deletes": 0}
-    
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
+    """إحصائيات الاستهلاك لليوم الحالي: مجموع الأجزاء + ما لم يُفرَّغ بعد في هذه النسخة."""
+    today = _usage_day()
+    with _usage_lock:
+        usage = dict(_usage_pending.get(today) or {"reads": 0, "writes": 0, "deletes": 0})
+    db = _get_db()
+    if db is None:
+        return usage
     try:
-        doc = col.document(today).get()
-        if doc.exists:
-            return doc.to_dict()
-    except:
+        col = _col_usage()
+        for doc in db.get_all([col.document(i) for i in _usage_shard_ids(today)]):
+            if not doc.exists:
+                continue
+            data = doc.to_dict() or {}
+            for k in ("reads", "writes", "deletes"):
+                usage[k] += int(data.get(k) or 0)
+    except Exception:
         pass
-    return {"reads": 0, "writes": 0, "deletes": 0}
+    return usage
+
+
+def usage_tracking_stats() -> dict:
+    """حالة التجميع (للوحة التحكم)."""
+    with _usage_lock:
+        pending = sum(sum(c.values()) for c in _usage_pending.values())
+    return {**_usage_stats, "pending_ops": pending, "shards": config.USAGE_SHARDS,
+            "interval": config.USAGE_FLUSH_INTERVAL}
 
 
 # ─── SQLite (تم استبداله بـ JSON) ──────────────────────────────────────────
@@ -103,6 +181,9 @@ _DEFAULTS = {
     "msg_stories_error": "عذراً، حدث خطأ بسبب زخم المستخدمين. يرجى المحاولة لاحقاً ❌",
     "msg_banned":        "⛔ عذراً، أنت محظور من استخدام البوت.",
     "msg_caption":       "المصدر: {platform}",
+    "msg_queued":        "⏳ أنت رقم {position} في الطابور (حوالي {eta} ثانية)...",
+    "msg_busy":          "⚠️ البوت مشغول جداً حالياً، يرجى المحاولة بعد قليل.",
+    "msg_too_large":     "⚠️ حجم الملف ({size}) أكبر من الحد المسموح للرفع في تيليجرام ({limit} MB).",
     "required_channels": "",
     "msg_force_sub":     "🚫 يجب الاشتراك في:\n\n{channels}\n\nثم أرسل الرابط مرة أخرى.",
     "share_msg":          "هذا هو البوت الاحترافي للتحميل من منصات التواصل الاجتماعي! استعمله الآن مجاناً 🚀\n\n@ir4qibot",
@@ -190,20 +271,147 @@ def init_db() -> None:
         logger.info("✅ Database initialized (Firestore)")
     except Exception as e:
         logger.error(f"Error during init_db: {e}")
+    # تحميل الإعدادات والمحظورين والقائمة البيضاء قبل أول رسالة
+    _load_settings()
+    _ensure_access()
     logger.info("✅ Firestore جاهز")
 
 
+# ─── ذاكرة حالة المستخدمين والصلاحيات (داخل العملية) ─────────────────────────
+# - مستند كل مستخدم في ذاكرة محدودة الحجم، تُحدّث عند الكتابة (upsert_user و ban_user)
+# - المحظورون والقائمة البيضاء مجموعات مقيمة: تحميل كامل مرة، ثم ما تغير فقط منذ آخر مزامنة
+#   (access_updated_at / updated_at) كل ACCESS_REFRESH_INTERVAL في خيط خلفي
+# - الحذف من القائمة البيضاء في نسخة أخرى يظهر مع المزامنة الكاملة الدورية (ACCESS_FULL_SYNC)
+# - المسار الساخن (كل رسالة) لا يقرأ من Firestore في الحالة المستقرة
+_ABSENT     = object()   # مستخدم غير موجود في Firestore (يُخزن حتى لا يُسأل عنه مجدداً)
+_NOT_CACHED = object()
+_user_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+_SYNC_OVERLAP = 60   # ثوانٍ تُعاد قراءتها في كل مزامنة تحسباً لفرق الساعة بين النسخ
+_access_lock  = threading.Lock()
+_sync_lock    = threading.Lock()
+_banned: set[int]           = set()
+_whitelist: dict[int, dict] = {}
+_access_state = {"loaded": False, "last_sync": None, "last_full": 0.0, "last_check": float("-inf")}
+_access_stats = {"full_syncs": 0, "incremental_syncs": 0, "changes": 0, "sync_errors": 0}
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _full_sync() -> None:
+    users_col, wl_col = _col_users(), _col_whitelist()
+    if users_col is None or wl_col is None:
+        return
+    started   = _utcnow()
+    banned    = {int(d.id) for d in users_col.where("is_banned", "==", True).stream()}
+    whitelist = {int(d.id): d.to_dict() for d in wl_col.stream()}
+    _track_usage(reads=max(1, len(banned)) + max(1, len(whitelist)))
+
+    global _banned, _whitelist
+    with _access_lock:
+        _banned, _whitelist = banned, whitelist
+        _access_state.update(loaded=True, last_sync=started, last_full=time.monotonic())
+    _access_stats["full_syncs"] += 1
+    logger.info(f"🔐 Access lists loaded: {len(banned)} banned, {len(whitelist)} whitelisted")
+
+
+def _incremental_sync() -> None:
+    users_col, wl_col = _col_users(), _col_whitelist()
+    if users_col is None or wl_col is None:
+        return
+    started = _utcnow()
+    since   = _access_state["last_sync"] - datetime.timedelta(seconds=_SYNC_OVERLAP)
+    users   = list(users_col.where("access_updated_at", ">", since).stream())
+    allowed = list(wl_col.where("updated_at", ">", since).stream())
+    _track_usage(reads=max(1, len(users)) + max(1, len(allowed)))
+
+    with _access_lock:
+        for d in users:
+            uid    = int(d.id)
+            banned = bool(d.to_dict().get("is_banned"))
+            (_banned.add if banned else _banned.discard)(uid)
+            cached = _user_cache.get(uid, _NOT_CACHED)
+            if isinstance(cached, dict):
+                cached["is_banned"] = banned
+        for d in allowed:
+            _whitelist[int(d.id)] = d.to_dict()
+        _access_state["last_sync"] = started
+    _access_stats["incremental_syncs"] += 1
+    _access_stats["changes"] += len(users) + len(allowed)
+
+
+def _refresh_access() -> None:
+    try:
+        if not _access_state["loaded"] or time.monotonic() - _access_state["last_full"] > config.ACCESS_FULL_SYNC:
+            _full_sync()
+        else:
+            _incremental_sync()
+    except Exception as e:
+        _access_stats["sync_errors"] += 1
+        logger.warning(f"⚠️ Access list sync failed: {e}")
+    finally:
+        _access_state["last_check"] = time.monotonic()
+
+
+def _refresh_access_locked() -> None:
+    try:
+        _refresh_access()
+    finally:
+        _sync_lock.release()
+
+
+def _ensure_access() -> None:
+    """التحميل الأول متزامن (ينتظره من يسأل)، وما بعده تحديث تدريجي في الخلفية."""
+    if time.monotonic() - _access_state["last_check"] < config.ACCESS_REFRESH_INTERVAL:
+        return
+    if not _access_state["loaded"]:
+        with _sync_lock:
+            if time.monotonic() - _access_state["last_check"] >= config.ACCESS_REFRESH_INTERVAL:
+                _refresh_access()
+        return
+    if _sync_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_access_locked, name="access-sync", daemon=True).start()
+
+
+def is_banned(user_id: int) -> bool:
+    """فحص الحظر من المجموعة المقيمة (بدون قراءة Firestore)."""
+    _ensure_access()
+    return user_id in _banned
+
+
+def access_cache_stats() -> dict:
+    """إحصائيات ذاكرة المستخدمين والصلاحيات للوحة التحكم."""
+    last_sync = _access_state["last_sync"]
+    return {
+        **_access_stats,
+        "banned":        len(_banned),
+        "whitelisted":   len(_whitelist),
+        "loaded":        _access_state["loaded"],
+        "sync_age":      round((_utcnow() - last_sync).total_seconds(), 1) if last_sync else None,
+        "user_cache":    _user_cache.stats(),
+    }
+
+
 # ─── المستخدمون ──────────────────────────────────────────────────────────────
 def get_user(user_id: int) -> dict | None:
+    cached = _user_cache.get(user_id, _NOT_CACHED)
+    if cached is _ABSENT:
+        return None
+    if cached is not _NOT_CACHED:
+        return {**cached, "user_id": user_id}
+
     col = _col_users()
     if col is None: return None
     _track_usage(reads=1)
     doc = col.document(str(user_id)).get()
     if not doc.exists:
+        _user_cache.set(user_id, _ABSENT)
         return None
     data = doc.to_dict()
-    data["user_id"] = user_id
-    return data
+    _user_cache.set(user_id, data)
+    return {**data, "user_id": user_id}
 
 
 def upsert_user(user_id: int, username: str, first_name: str, photo_url: str = "", photo_file_id: str = "") -> None:
@@ -214,10 +422,15 @@ def upsert_user(user_id: int, username: str, first_name: str, photo_url: str = "
     now_str = now_dt.strftime("%Y-%m-%d %H:%M:%S")
     doc_ref = col.document(str(user_id))
     try:
-        _track_usage(reads=1)
-        doc = doc_ref.get()
-        if doc.exists:
-            data = doc.to_dict()
+        cached = _user_cache.get(user_id, _NOT_CACHED)
+        if cached is _NOT_CACHED:
+            _track_usage(reads=1)
+            doc  = doc_ref.get()
+            data = doc.to_dict() if doc.exists else None
+        else:
+            data = None if cached is _ABSENT else cached
+
+        if data is not None:
             # تحديث فوري إذا كان هناك تغيير في الاسم أو الصورة أو مر وقت كافٍ
             needs_update = (
                 data.get("username") != username or 
@@ -240,18 +453,20 @@ def upsert_user(user_id: int, username: str, first_name: str, photo_url: str = "
                     needs_update = True
 
             if needs_update:
-                _track_usage(writes=1)
-                doc_ref.update({
+                fields = {
                     "username":      username,
                     "first_name":    first_name,
                     "last_active":   now_str,
                     "photo_url":     photo_url,
                     "photo_file_id": photo_file_id,
-                })
+                }
+                _track_usage(writes=1)
+                doc_ref.update(fields)
+                data.update(fields)
+            _user_cache.set(user_id, data)
         else:
             # مستخدم جديد (يظهر فوراً في لوحة التحكم)
-            _track_usage(writes=1)
-            doc_ref.set({
+            data = {
                 "user_id":       user_id,
                 "username":      username,
                 "first_name":    first_name,
@@ -260,7 +475,10 @@ def upsert_user(user_id: int, username: str, first_name: str, photo_url: str = "
                 "is_banned":     False,
                 "photo_url":     photo_url,
                 "photo_file_id": photo_file_id,
-            })
+            }
+            _track_usage(writes=1)
+            doc_ref.set(data)
+            _user_cache.set(user_id, data)
             logger.info(f"🆕 New user registered: {first_name} ({user_id})")
     except Exception as e:
         logger.error(f"Error in upsert_user: {e}")
@@ -269,7 +487,12 @@ def upsert_user(user_id: int, username: str, first_name: str, photo_url: str = "
 def ban_user(user_id: int, banned: bool) -> None:
     _track_usage(writes=1)
     col = _col_users()
-    if col: col.document(str(user_id)).update({"is_banned": banned})
+    if col: col.document(str(user_id)).update({"is_banned": banned, "access_updated_at": _utcnow()})
+    with _access_lock:
+        (_banned.add if banned else _banned.discard)(user_id)
+    cached = _user_cache.get(user_id, _NOT_CACHED)
+    if isinstance(cached, dict):
+        cached["is_banned"] = banned
 
 
 def get_all_users() -> list[dict]:
@@ -290,96 +513,171 @@ def get_all_users() -> list[dict]:
         return []
 
 
-# ─── الرسائل (JSON - محلي / مؤقت) ──────────────────────────────────────────
-_messages_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "messages.json")
-_messages_lock = threading.Lock()
-
+# ─── الرسائل (SQLite محلي - data/message_log.py) ───────────────────────────
 def log_message(user_id: int, message_type: str, message_text: str) -> None:
-    """حفظ رسالة في ملف JSON محلي (مؤقت)."""
-    import json
-    import os
-    
-    now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    new_msg = {
-        "user_id": user_id,
-        "type": message_type,
-        "text": message_text,
-        "timestamp": now_str
-    }
-    
-    with _messages_lock:
-        try:
-            os.makedirs(os.path.dirname(_messages_file), exist_ok=True)
-            msgs = []
-            if os.path.exists(_messages_file):
-                with open(_messages_file, "r", encoding="utf-8") as f:
-                    try:
-                        msgs = json.load(f)
-                    except:
-                        msgs = []
-            
-            msgs.append(new_msg)
-            # الاحتفاظ بآخر 1000 رسالة فقط لضمان الخفة
-            if len(msgs) > 1000:
-                msgs = msgs[-1000:]
-                
-            with open(_messages_file, "w", encoding="utf-8") as f:
-                json.dump(msgs, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"Error logging to JSON: {e}")
+    """تسجيل رسالة في السجل المحلي (لا يحجب: الكتابة في خيط خلفي)."""
+    message_log.log(user_id, message_type, message_text)
 
 
 def get_user_messages(user_id: int, limit: int = 50) -> list[dict]:
-    """جلب رسائل مستخدم معين من ملف JSON."""
-    import json
-    import os
-    
-    with _messages_lock:
-        if not os.path.exists(_messages_file):
-            return []
-        try:
-            with open(_messages_file, "r", encoding="utf-8") as f:
-                msgs = json.load(f)
-                user_msgs = [m for m in msgs if m["user_id"] == user_id]
-                # إرجاع النتائج بتنسيق SQLiterow المتوقع في لوحة التحكم
-                return [
-                    {
-                        "user_id": m["user_id"],
-                        "message_type": m["type"],
-                        "message_text": m["text"],
-                        "timestamp": m["timestamp"]
-                    }
-                    for m in user_msgs[-limit:]
-                ]
-        except:
-            return []
-
-
-# ─── الإعدادات ───────────────────────────────────────────────────────────────
-def get_setting(key: str, default: str = "") -> str:
-    # التحقق من الكاش أولاً
-    with _cache_lock:
-        if key in _settings_cache:
-            return _settings_cache[key]
-    
-    # محاولة الجلب من Firestore
-    col = _col_settings()
-    val = default
-    if col:
+    """جلب آخر رسائل مستخدم معين من السجل المحلي."""
+    return message_log.get_user_messages(user_id, limit)
+
+
+# ─── الإعدادات (نسخة مكررة في كل نسخة من الخدمة) ────────────────────────────
+# - تحميل كل مستندات settings باستعلام واحد عند الإقلاع
+# - مستمع on_snapshot يستبدل النسخة عند أي تغيير (من لوحة التحكم في أي نسخة)؛
+#   إذا توقف المستمع يُعاد الاشتراك ويُستطلع المجموعة كل SETTINGS_POLL_INTERVAL حتى يعود
+# - بدون Firestore تُستخدم القيم الافتراضية من الكود كبديل محلي
+# - كل تغيير ينشر نسخة جديدة ثابتة (Immutable) برقم إصدار؛ القراءة بحث في dict بدون أقفال
+# - القوالب ({platform} / {channels} / ...) تُحلل مرة واحدة لكل نسخة، وقائمة القنوات الإجبارية كذلك
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class Template:
+    """قالب رسالة محلل مسبقاً: نصوص ثابتة وأسماء متغيرات بالتناوب."""
+    __slots__ = ("text", "_parts")
+
+    def __init__(self, text: str):
+        self.text   = text
+        self._parts = tuple(_PLACEHOLDER.split(text))
+
+    def render(self, **values) -> str:
+        """تعويض المتغيرات المعطاة؛ غير المعطاة تبقى كما هي ({name})."""
+        parts = self._parts
+        if len(parts) == 1:
+            return self.text
+        out = [parts[0]]
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            out.append(str(values[name]) if name in values else "{" + name + "}")
+            out.append(parts[i + 1])
+        return "".join(out)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+@lru_cache(maxsize=256)
+def _compile(text: str) -> Template:
+    return Template(text)
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    version:   int
+    values:    Mapping[str, str]
+    source:    str                    # firestore / listener / poll / local
+    loaded_at: float = field(default_factory=time.time)
+    templates: Mapping[str, Template] = field(init=False, repr=False)
+    required_channels: tuple[str, ...] = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "templates", MappingProxyType(
+            {k: _compile(v) for k, v in self.values.items() if isinstance(v, str)}
+        ))
+        channels = self.values.get("required_channels") or ""
+        object.__setattr__(self, "required_channels", tuple(
+            c.strip() for c in str(channels).split(",") if c.strip()
+        ))
+
+    def get(self, key: str, default: str = "") -> str:
+        return self.values.get(key, default)
+
+    def template(self, key: str, default: str = "") -> Template:
+        """القالب المحلل للمفتاح، أو للنص الافتراضي إذا لم يكن المفتاح موجوداً."""
+        compiled = self.templates.get(key)
+        if compiled is not None:
+            return compiled
+        return _compile(str(self.values.get(key, default)))
+
+    def render(self, key: str, default: str = "", **values) -> str:
+        return self.template(key, default).render(**values)
+
+
+_settings: SettingsSnapshot | None = None
+_settings_lock  = threading.Lock()
+_settings_watch = None
+_settings_stats = {"listener_events": 0, "polls": 0, "resubscribes": 0, "errors": 0}
+
+
+def _publish_settings(values: dict, source: str) -> SettingsSnapshot:
+    """استبدال النسخة الحالية بنسخة جديدة إذا تغيرت القيم (يجب استدعاؤها داخل القفل)."""
+    global _settings
+    current = _settings
+    if current is not None and dict(current.values) == values:
+        return current
+    _settings = SettingsSnapshot(
+        version=(current.version + 1) if current else 1,
+        values=MappingProxyType(dict(values)),
+        source=source,
+    )
+    if current is not None:
+        logger.info(f"⚙️ Settings updated to v{_settings.version} ({source})")
+    return _settings
+
+
+def _read_all_settings(col) -> dict:
+    docs = list(col.stream())
+    _track_usage(reads=max(1, len(docs)))
+    return {d.id: (d.to_dict() or {}).get("value", "") for d in docs}
+
+
+def _on_settings_snapshot(docs, changes, read_time) -> None:
+    _settings_stats["listener_events"] += 1
+    _track_usage(reads=max(1, len(changes)))
+    values = {d.id: (d.to_dict() or {}).get("value", "") for d in docs}
+    with _settings_lock:
+        _publish_settings(values, "listener")
+
+
+def _settings_supervisor(col) -> None:
+    """إبقاء المستمع حياً؛ أثناء انقطاعه تُستطلع المجموعة دورياً حتى تتقارب النسخ."""
+    global _settings_watch
+    first = True
+    while True:
+        if _settings_watch is None or not _settings_watch.is_active:
+            try:
+                if not first:
+                    values = _read_all_settings(col)
+                    _settings_stats["polls"] += 1
+                    with _settings_lock:
+                        _publish_settings(values, "poll")
+                    _settings_stats["resubscribes"] += 1
+                _settings_watch = col.on_snapshot(_on_settings_snapshot)
+            except Exception as e:
+                _settings_stats["errors"] += 1
+                logger.warning(f"⚠️ Settings listener unavailable, polling: {e}")
+        first = False
+        time.sleep(config.SETTINGS_POLL_INTERVAL)
+
+
+def _load_settings() -> SettingsSnapshot:
+    """التحميل الأول (مرة واحدة لكل عملية) وتشغيل المستمع."""
+    with _settings_lock:
+        if _settings is not None:
+            return _settings
+        col = _col_settings()
+        if col is None:
+            return _publish_settings(dict(_DEFAULTS), "local")
         try:
-            _track_usage(reads=1)
-            doc = col.document(key).get()
-            if doc.exists:
-                val = doc.to_dict().get("value", default)
+            snapshot = _publish_settings(_read_all_settings(col), "firestore")
         except Exception as e:
-            logger.error(f"Firestore get_setting error: {e}")
-    else:
-        # إذا لم يتوفر Firestore، نستخدم القيم الافتراضية من الكود
-        val = _DEFAULTS.get(key, default)
+            logger.error(f"Firestore settings load error: {e}")
+            return _publish_settings(dict(_DEFAULTS), "local")
+    threading.Thread(target=_settings_supervisor, args=(col,), name="settings-sync", daemon=True).start()
+    logger.info(f"⚙️ Loaded {len(snapshot.values)} settings (v{snapshot.version})")
+    return snapshot
+
+
+def get_settings_snapshot() -> SettingsSnapshot:
+    """النسخة الحالية من الإعدادات (ثابتة؛ تُستبدل كاملة عند أي تغيير).
+    للمعالجات: استدعاء واحد لكل طلب ثم snapshot.get / snapshot.render بدل عدة get_setting."""
+    return _settings or _load_settings()
 
-    with _cache_lock:
-        _settings_cache[key] = val
-    return val
+
+def get_setting(key: str, default: str = "") -> str:
+    return (_settings or _load_settings()).values.get(key, default)
 
 
 def set_setting(key: str, value: str) -> bool:
@@ -388,14 +686,30 @@ def set_setting(key: str, value: str) -> bool:
         try:
             _track_usage(writes=1)
             col.document(key).set({"value": value})
-            with _cache_lock:
-                _settings_cache[key] = value
+            # القراءة بعد الكتابة في هذه النسخة فوراً؛ بقية النسخ عبر المستمع
+            with _settings_lock:
+                current = _settings.values if _settings else {}
+                _publish_settings({**current, key: value}, "local")
             return True
         except Exception as e:
             logger.error(f"Firestore set_setting error: {e}")
     return False
 
 
+def settings_stats() -> dict:
+    """حالة نسخة الإعدادات للوحة التحكم."""
+    snapshot = _settings
+    watch    = _settings_watch
+    return {
+        **_settings_stats,
+        "version":         snapshot.version if snapshot else 0,
+        "source":          snapshot.source if snapshot else None,
+        "keys":            len(snapshot.values) if snapshot else 0,
+        "age":             round(time.time() - snapshot.loaded_at, 1) if snapshot else None,
+        "listener_active": bool(watch is not None and watch.is_active),
+    }
+
+
 # ─── الإحصائيات ──────────────────────────────────────────────────────────────
 # ─── تخزين مؤقت للإحصائيات (Stats Caching) ──────────────────────────────────
 _stats_cache: dict | None = None
@@ -506,8 +820,6 @@ def get_proxies() -> list[str]:
 
 def set_proxies(proxies: list[str]) -> None:
     unique = list(dict.fromkeys(p.strip() for p in proxies if p.strip()))
-    with _cache_lock:
-        _settings_cache.pop(_PROXY_KEY, None)
     set_setting(_PROXY_KEY, "\n".join(unique))
 
 
@@ -518,23 +830,25 @@ def remove_proxy(proxy: str) -> None:
         set_proxies(updated)
 # ─── القائمة البيضاء ──────────────────────────────────────────────────────────
 def get_whitelisted(user_id: int) -> dict | None:
-    col = _col_whitelist()
-    if col:
-        _track_usage(reads=1)
-        doc = col.document(str(user_id)).get()
-        return doc.to_dict() if doc.exists else None
-    return None
+    """مدخل القائمة البيضاء من النسخة المقيمة (بدون قراءة Firestore)."""
+    _ensure_access()
+    entry = _whitelist.get(user_id)
+    return dict(entry) if entry is not None else None
 
 
 def add_to_whitelist(user_id: int, custom_reply: str = "") -> None:
     col = _col_whitelist()
     if col:
-        _track_usage(writes=1)
-        col.document(str(user_id)).set({
+        entry = {
             "user_id":      user_id,
             "custom_reply": custom_reply,
-            "added_at":     datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+            "added_at":     datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "updated_at":   _utcnow(),
+        }
+        _track_usage(writes=1)
+        col.document(str(user_id)).set(entry)
+        with _access_lock:
+            _whitelist[user_id] = entry
 
 
 def remove_from_whitelist(user_id: int) -> None:
@@ -542,14 +856,13 @@ def remove_from_whitelist(user_id: int) -> None:
     if col:
         _track_usage(deletes=1)
         col.document(str(user_id)).delete()
+        with _access_lock:
+            _whitelist.pop(user_id, None)
 
 
 def is_whitelisted(user_id: int) -> bool:
-    col = _col_whitelist()
-    if col:
-        _track_usage(reads=1)
-        return col.document(str(user_id)).get().exists
-    return False
+    _ensure_access()
+    return user_id in _whitelist
 
 
 def get_all_whitelist() -> list[dict]:
@@ -0,0 +1,183 @@
+"""
+data/message_log.py - سجل رسائل المستخدمين (SQLite بوضع WAL، إلحاق فقط)
+────────────────────────────────────────
+  - log() يضع الرسالة في طابور بالذاكرة ويعود فوراً (لا قراءة ولا إعادة كتابة للملف على الـ loop)
+  - خيط كاتب واحد يجمع الرسائل المتراكمة ويكتبها في معاملة واحدة
+  - فهرس (user_id, id): سجل مستخدم في لوحة التحكم بحث مفهرس بدل قراءة السجل كاملاً
+  - الاحتفاظ: حذف ما تجاوز MESSAGE_LOG_RETENTION_DAYS أو الحد الأقصى للصفوف، ساعةً بساعة
+  - ترحيل messages.json القديم مرة واحدة عند أول فتح
+"""
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_LEGACY_FILE    = os.path.join(os.path.dirname(os.path.abspath(__file__)), "messages.json")
+_TS_FORMAT      = "%Y-%m-%d %H:%M:%S"
+_BATCH_SIZE     = 500
+_PRUNE_INTERVAL = 3600
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_conn: sqlite3.Connection | None = None
+_lock = threading.Lock()
+_writer: threading.Thread | None = None
+_last_prune = 0.0
+
+_stats = {"logged": 0, "written": 0, "batches": 0, "pruned": 0, "migrated": 0, "write_errors": 0}
+
+
+def _migrate_legacy(conn: sqlite3.Connection) -> None:
+    """استيراد messages.json (السجل السابق) ثم إعادة تسميته حتى لا يُستورد مجدداً."""
+    if not os.path.exists(_LEGACY_FILE):
+        return
+    try:
+        with open(_LEGACY_FILE, "r", encoding="utf-8") as f:
+            msgs = json.load(f)
+        rows = []
+        for m in msgs:
+            try:
+                ts = datetime.datetime.strptime(m["timestamp"], _TS_FORMAT).timestamp()
+            except (KeyError, ValueError):
+                ts = time.time()
+            rows.append((int(m["user_id"]), m.get("type", ""), m.get("text", ""), ts))
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (user_id, type, text, created_at) VALUES (?, ?, ?, ?)", rows
+            )
+        os.replace(_LEGACY_FILE, _LEGACY_FILE + ".migrated")
+        _stats["migrated"] = len(rows)
+        logger.info("📦 Migrated %d messages from messages.json", len(rows))
+    except Exception as e:
+        logger.warning("⚠️ messages.json migration failed: %s", e)
+
+
+def _get_conn() -> sqlite3.Connection:
+    """فتح قاعدة السجل مرة واحدة وإعادة استخدامها (يجب استدعاؤها داخل القفل)."""
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(config.MESSAGE_LOG_PATH), exist_ok=True)
+        conn = sqlite3.connect(config.MESSAGE_LOG_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id INTEGER NOT NULL,"
+            " type TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_created ON messages(created_at)")
+        conn.commit()
+        _migrate_legacy(conn)
+        _conn = conn
+    return _conn
+
+
+def _prune(conn: sqlite3.Connection) -> None:
+    """حذف الرسائل الأقدم من مدة الاحتفاظ، ثم الأقدم فيما تجاوز الحد الأقصى للصفوف."""
+    cutoff = time.time() - config.MESSAGE_LOG_RETENTION_DAYS * 86400
+    pruned = conn.execute("DELETE FROM messages WHERE created_at < ?", (cutoff,)).rowcount
+    pruned += conn.execute(
+        "DELETE FROM messages WHERE id <= (SELECT id FROM messages ORDER BY id DESC LIMIT 1 OFFSET ?)",
+        (config.MESSAGE_LOG_MAX_ROWS,),
+    ).rowcount
+    _stats["pruned"] += pruned
+
+
+def _write(batch: list[tuple]) -> None:
+    global _last_prune
+    try:
+        with _lock:
+            conn = _get_conn()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO messages (user_id, type, text, created_at) VALUES (?, ?, ?, ?)", batch
+                )
+                if time.time() - _last_prune > _PRUNE_INTERVAL:
+                    _prune(conn)
+                    _last_prune = time.time()
+        _stats["written"] += len(batch)
+        _stats["batches"] += 1
+    except Exception as e:
+        _stats["write_errors"] += 1
+        logger.error("Error writing message log: %s", e)
+
+
+def _drain(first: tuple | None = None) -> list[tuple]:
+    batch = [first] if first else []
+    try:
+        while len(batch) < _BATCH_SIZE:
+            batch.append(_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+def _run_writer() -> None:
+    while True:
+        _write(_drain(_queue.get()))
+
+
+def log(user_id: int, message_type: str, message_text: str) -> None:
+    """تسجيل رسالة (إلحاق في الطابور فقط؛ الكتابة في خيط الكاتب)."""
+    global _writer
+    _queue.put((user_id, message_type, message_text or "", time.time()))
+    _stats["logged"] += 1
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_run_writer, name="message-log", daemon=True)
+                _writer.start()
+
+
+def get_user_messages(user_id: int, limit: int = 50) -> list[dict]:
+    """آخر رسائل المستخدم بترتيب زمني (بحث مفهرس)."""
+    try:
+        with _lock:
+            rows = _get_conn().execute(
+                "SELECT type, text, created_at FROM messages WHERE user_id = ?"
+                " ORDER BY id DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+    except Exception as e:
+        logger.error("Error reading message log: %s", e)
+        return []
+    return [
+        {
+            "user_id":      user_id,
+            "message_type": message_type,
+            "message_text": text,
+            "timestamp":    datetime.datetime.fromtimestamp(created_at).strftime(_TS_FORMAT),
+        }
+        for message_type, text, created_at in reversed(rows)
+    ]
+
+
+def stats() -> dict:
+    """إحصائيات السجل للوحة التحكم."""
+    rows = 0
+    try:
+        with _lock:
+            rows = _get_conn().execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    except Exception:
+        pass
+    return {**_stats, "queued": _queue.qsize(), "rows": rows,
+            "retention_days": config.MESSAGE_LOG_RETENTION_DAYS}
+
+
+@atexit.register
+def _flush() -> None:
+    # ما بقي في الطابور عند الإيقاف يُكتب قبل الخروج
+    while not _queue.empty():
+        _write(_drain())
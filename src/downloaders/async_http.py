@@ -0,0 +1,224 @@
+"""
+downloaders/async_http.py - محرك HTTP غير متزامن لوحدات التحميل (بدون yt-dlp)
+────────────────────────────────────────
+  - عملاء httpx.AsyncClient المشتركة من downloaders.http_pool مع تدفق الملفات إلى القرص
+  - مئات التحميلات المتزامنة = Coroutines وليس خيوط نظام
+  - مجمع الخيوط يبقى متفرغاً لـ yt-dlp فقط
+  - التحميل المجزأ: إذا دعم الخادم Range يُقسم الملف الكبير إلى نطاقات متوازية تُكتب
+    بمواضعها (pwrite) في ملف محجوز مسبقاً، وكل نطاق يُستأنف من آخر بايت عند الانقطاع
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+import httpx
+
+import config
+from .http_pool import USER_AGENT, get_client, normalize_proxy, use_client
+from .sizing import MediaTooLarge, check_content_length
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["USER_AGENT", "get_client", "normalize_proxy", "stream_to_file", "stats", "use_client"]
+
+_stats = {"downloads": 0, "segmented": 0, "bytes": 0, "resumes": 0, "fallbacks": 0}
+_throughput: deque = deque(maxlen=200)   # MB/s لكل تحميل
+
+# مواضع البايتات في النطاقات تخص المحتوى غير المضغوط
+_identity = {"Accept-Encoding": "identity"}
+
+
+class _RangeIgnored(Exception):
+    """الخادم أعلن دعم النطاقات ثم أعاد الملف كاملاً لطلب نطاق لاحق."""
+
+
+def _chunk_size() -> int:
+    return max(4096, config.DOWNLOAD_CHUNK_KB * 1024)
+
+
+async def _open(client: httpx.AsyncClient, url: str, headers: dict, timeout: float) -> httpx.Response:
+    resp = await client.send(client.build_request("GET", url, headers=headers, timeout=timeout), stream=True)
+    try:
+        resp.raise_for_status()
+    except BaseException:
+        await resp.aclose()
+        raise
+    return resp
+
+
+def _range_total(resp: httpx.Response) -> int | None:
+    """الحجم الكلي من Content-Range (bytes 0-1023/4096) إذا استجاب الخادم بنطاق."""
+    value = resp.headers.get("content-range", "")
+    if resp.status_code != 206 or "/" not in value:
+        return None
+    total = value.rsplit("/", 1)[1]
+    return int(total) if total.isdigit() else None
+
+
+def _split(total: int, parts: int) -> list[tuple[int, int]]:
+    if total <= 0:
+        return []
+    size = -(-total // max(1, parts))
+    return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+def _retryable(err: Exception) -> bool:
+    if isinstance(err, httpx.HTTPStatusError):
+        return err.response.status_code >= 500
+    return isinstance(err, httpx.TransportError)
+
+
+async def _fetch_range(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: dict | None,
+    timeout: float,
+    fd: int,
+    start: int,
+    end: int,
+    resp: httpx.Response | None = None,
+) -> None:
+    """تحميل النطاق [start, end] إلى موضعه في الملف؛ يُستأنف من آخر بايت مكتوب عند الانقطاع.
+    resp: استجابة مفتوحة تبدأ من start (يُعاد استخدام اتصال الفحص للنطاق الأول)."""
+    pos      = start
+    failures = 0
+    while pos <= end:
+        try:
+            if resp is None:
+                resp = await _open(client, url, {**(headers or {}), **_identity, "Range": f"bytes={pos}-{end}"}, timeout)
+                if resp.status_code != 206:
+                    raise _RangeIgnored(f"Range request ignored (HTTP {resp.status_code})")
+            async for chunk in resp.aiter_bytes(_chunk_size()):
+                chunk = chunk[: end + 1 - pos]
+                os.pwrite(fd, chunk, pos)
+                pos += len(chunk)
+                if pos > end:
+                    break
+            if pos <= end:
+                raise httpx.RemoteProtocolError(f"Stream ended at byte {pos} of range ending {end}")
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            failures += 1
+            if failures > config.DOWNLOAD_SEGMENT_RETRIES or not _retryable(e):
+                raise
+            _stats["resumes"] += 1
+            logger.debug("↪️ Resuming range %d-%d at %d after: %s", start, end, pos, e)
+            await asyncio.sleep(0.5 * failures)
+        finally:
+            if resp is not None:
+                await resp.aclose()
+                resp = None
+
+
+async def _stream_whole(resp: httpx.Response, path: str, max_bytes: int | None) -> int:
+    """تدفق عادي على اتصال واحد (الخادم لا يدعم Range)."""
+    written = 0
+    with open(path, "wb") as f:
+        async for chunk in resp.aiter_bytes(_chunk_size()):
+            f.write(chunk)
+            written += len(chunk)
+            if max_bytes and written > max_bytes:
+                raise MediaTooLarge(None, max_bytes)
+    return written
+
+
+async def _fetch_segments(client, url, headers, timeout, path, total, first: httpx.Response) -> int:
+    """تحميل الملف على نطاقات متوازية في ملف محجوز مسبقاً؛ يعيد عدد النطاقات."""
+    min_bytes = max(config.DOWNLOAD_SEGMENT_MIN_KB * 1024, config.DOWNLOAD_SEGMENTS)
+    parts     = _split(total, config.DOWNLOAD_SEGMENTS if total >= min_bytes else 1)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            os.posix_fallocate(fd, 0, total)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, total)
+        tasks = [
+            asyncio.create_task(_fetch_range(client, url, headers, timeout, fd, s, e, first if i == 0 else None))
+            for i, (s, e) in enumerate(parts)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # لا يُغلق الملف قبل توقف كل النطاقات عن الكتابة
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    finally:
+        os.close(fd)
+    return len(parts)
+
+
+async def stream_to_file(
+    url: str,
+    path: str,
+    headers: dict | None = None,
+    proxy: str | None = None,
+    timeout: float = 60,
+    max_bytes: int | None = None,
+) -> int:
+    """تحميل ملف بالتدفق إلى المسار المحدد وإرجاع عدد البايتات. يحذف الملف الجزئي عند الفشل.
+    الطلب الأول يحمل Range مفتوحاً: استجابة 206 تعني دعم النطاقات (تحميل مجزأ)، و 200 تعني
+    اتصالاً واحداً كالسابق — دون طلب فحص إضافي.
+    max_bytes: يُرفض الملف من Content-Range / Content-Length قبل التدفق، أو أثناءه إن لم يُرسل الخادم الحجم."""
+    async with use_client(proxy) as client:
+        started = time.monotonic()
+        resp    = None
+        try:
+            resp  = await _open(client, url, {**(headers or {}), **_identity, "Range": "bytes=0-"}, timeout)
+            total = _range_total(resp)
+            # ملف فارغ (bytes */0) لا يُقسم: يُكمل على نفس الاتصال
+            if not total:
+                if max_bytes:
+                    check_content_length(resp.headers, max_bytes)
+                written = await _stream_whole(resp, path, max_bytes)
+                parts   = 1
+            else:
+                if max_bytes and total > max_bytes:
+                    raise MediaTooLarge(total, max_bytes)
+                try:
+                    parts   = await _fetch_segments(client, url, headers, timeout, path, total, resp)
+                    written = total
+                except _RangeIgnored as e:
+                    # اتصال واحد من البداية كالخوادم التي لا تدعم Range
+                    _stats["fallbacks"] += 1
+                    logger.info("↩️ %s, falling back to a single stream: %s", e, url)
+                    resp = await _open(client, url, {**(headers or {}), **_identity}, timeout)
+                    if max_bytes:
+                        check_content_length(resp.headers, max_bytes)
+                    written = await _stream_whole(resp, path, max_bytes)
+                    parts   = 1
+        except BaseException:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+        finally:
+            if resp is not None:
+                await resp.aclose()
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    mbps    = written / 1048576 / elapsed
+    _stats["downloads"] += 1
+    _stats["bytes"]     += written
+    if parts > 1:
+        _stats["segmented"] += 1
+    _throughput.append(mbps)
+    logger.log(logging.INFO if parts > 1 else logging.DEBUG,
+               "⬇️ %.1f MB in %.2fs (%.2f MB/s, %d connections)", written / 1048576, elapsed, mbps, parts)
+    return written
+
+
+def stats() -> dict:
+    """إحصائيات التحميل المباشر (عدد التحميلات المجزأة والاستئنافات ومتوسط السرعة)."""
+    samples = sorted(_throughput)
+    return {
+        **_stats,
+        "segments": config.DOWNLOAD_SEGMENTS,
+        "chunk_kb": config.DOWNLOAD_CHUNK_KB,
+        "avg_mbps": round(sum(samples) / len(samples), 2) if samples else 0.0,
+        "p50_mbps": round(samples[len(samples) // 2], 2) if samples else 0.0,
+    }
@@ -4,21 +4,21 @@ downloaders/base.py - الفئة الأساسية لوحدات التحميل
   - socket_timeout و retries لتقليل الانتظار
   - حذف البيانات الوصفية غير الضرورية
   - noprogress لتقليل الـ I/O
+  - اختيار الصيغة حسب حد الرفع في Telegram (downloaders.sizing)
 """
-import yt_dlp
+import asyncio
 import os
+import time
 import uuid
 import logging
-import random
 
 import config
-from data import database
+from . import proxy_pool, scoreboard, sizing, ytdlp_pool
 
 logger = logging.getLogger(__name__)
 
 # ─── خيارات yt-dlp الأساسية المحسّنة للسرعة ─────────────────────────────────
 _BASE_OPTS = {
-    "format":           "best[ext=mp4]/best",
     "noplaylist":       True,
     "quiet":            True,
     "no_warnings":      True,
@@ -34,6 +34,9 @@ _BASE_OPTS = {
 class BaseDownloader:
     """الفئة الأساسية لجميع وحدات التحميل."""
 
+    # اسم المنصة في لوحة النتائج (downloaders.scoreboard)
+    platform = "Generic"
+
     def __init__(self, download_path: str = None):
         self.download_path = download_path or config.DOWNLOADS_DIR
         os.makedirs(self.download_path, exist_ok=True)
@@ -43,32 +46,25 @@ class BaseDownloader:
         base_opts = {
             **_BASE_OPTS,
             "outtmpl": f"{self.download_path}/{filename}.%(ext)s",
+            # أفضل صيغة mp4 تحت حد الرفع، أو رفض مبكر قبل التحميل
+            "format":  sizing.ytdlp_format(),
         }
         if extra_opts:
             base_opts.update(extra_opts)
 
-        # جلب قائمة البروكسيات من قاعدة البيانات
-        proxies = []
-        try:
-            proxies = database.get_proxies()
-        except Exception as pe:
-            logger.warning("⚠️ Error fetching proxies from database: %s", pe)
+        # تجهيز محاولات الاتصال: بروكسيين من مجمع البروكسيات (اختيار موزون بالصحة) + اتصال مباشر
+        # الترتيب بين المجموعتين يُختار حسب لوحة النتائج الحية (افتراضياً البروكسي أولاً)
+        proxy_attempts = proxy_pool.choose(k=2, host=proxy_pool.host_of(url))
 
-        # تجهيز محاولات الاتصال بالترتيب
-        # محاولتين ببروكسيات عشوائية + محاولة أخيرة بدون بروكسي (اتصال مباشر)
         attempts = []
-        if proxies:
-            sampled = random.sample(proxies, min(len(proxies), 2))
-            for p in sampled:
-                p_str = p.strip()
-                if p_str:
-                    if not p_str.startswith(("http://", "https://", "socks5://", "socks4://")):
-                        p_str = f"http://{p_str}"
-                    attempts.append(p_str)
-        attempts.append(None) # الاتصال المباشر
+        for backend in scoreboard.order(self.platform, ["ytdlp-proxy", "ytdlp-direct"]):
+            if backend == "ytdlp-proxy":
+                attempts.extend(("ytdlp-proxy", p) for p in proxy_attempts)
+            else:
+                attempts.append(("ytdlp-direct", None))
 
         last_error = None
-        for i, proxy in enumerate(attempts):
+        for i, (backend, proxy) in enumerate(attempts):
             opts = base_opts.copy()
             if proxy:
                 opts["proxy"] = proxy
@@ -76,17 +72,30 @@ class BaseDownloader:
             else:
                 logger.info("📡 [yt-dlp] Attempt %d: Using direct connection (no proxy)", i + 1)
 
+            started_at = time.monotonic()
             try:
-                with yt_dlp.YoutubeDL(opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    file_path = ydl.prepare_filename(info)
-                    description = info.get("description") or info.get("title") or ""
-                    return {
-                        "results": file_path,
-                        "description": description
-                    }
+                if ytdlp_pool.enabled():
+                    # مجمع العمليات: يعود المسار والبيانات الوصفية فقط عبر IPC
+                    result = ytdlp_pool.run(url, opts)
+                else:
+                    result = ytdlp_pool.extract_and_download(url, opts)
+                elapsed = time.monotonic() - started_at
+                scoreboard.record(self.platform, backend, True, elapsed)
+                if proxy:
+                    proxy_pool.report(proxy, True, elapsed, host=proxy_pool.host_of(url))
+                return {
+                    "results": result["results"],
+                    "description": result["description"]
+                }
+            except sizing.MediaTooLarge:
+                # الحجم لا يتغير بتغيير البروكسي
+                raise
             except Exception as exc:
                 last_error = exc
+                elapsed = time.monotonic() - started_at
+                scoreboard.record(self.platform, backend, False, elapsed)
+                if proxy:
+                    proxy_pool.report(proxy, False, elapsed, host=proxy_pool.host_of(url))
                 logger.warning("⚠️ [yt-dlp] Attempt %d failed: %s", i + 1, exc)
 
         # إذا فشلت جميع المحاولات
@@ -101,8 +110,17 @@ class BaseDownloader:
     def download_video(self, url: str) -> dict:
         return self._download(url)
 
-    def cleanup(self, file_path: str) -> None:
-        """حذف الملف فوراً بعد الإرسال."""
+    async def download_video_async(self, url: str, executor=None) -> dict:
+        """المسار غير المتزامن؛ yt-dlp متزامن لذا يعمل في مجمع الخيوط المخصص له."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.download_video, url)
+
+    def cleanup(self, file_path: str | list[str]) -> None:
+        """حذف الملف (أو ملفات الألبوم) فوراً بعد الإرسال."""
+        if isinstance(file_path, list):
+            for path in file_path:
+                self.cleanup(path)
+            return
         if file_path and os.path.exists(file_path):
             try:
                 os.remove(file_path)
@@ -21,6 +21,8 @@ _USER_AGENT = (
 class FacebookDownloader(BaseDownloader):
     """وحدة تحميل مقاطع وقصص Facebook."""
 
+    platform = "Facebook"
+
     def download_video(self, url: str) -> dict:
         opts = {"user_agent": _USER_AGENT}
 
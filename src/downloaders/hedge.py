@@ -0,0 +1,172 @@
+"""
+downloaders/hedge.py - تنفيذ الاستراتيجيات بالتحوّط (Hedged Requests)
+────────────────────────────────────────
+  - تبدأ الاستراتيجية الأساسية، وإذا لم تُنتج البيانات الوصفية خلال تأخير
+    مبني على p95 لزمنها السابق تبدأ الاستراتيجية التالية بالتوازي
+  - أول نتيجة صالحة تفوز، والخاسر يُلغى أو تُحذف ملفاته عند انتهائه
+  - عامة: أي وحدة تحميل تستطيع تمرير قائمة استراتيجياتها
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable
+
+import config
+from . import scoreboard
+
+logger = logging.getLogger(__name__)
+
+# الاستراتيجية: (الاسم، دالة تستقبل Event تُضبط عند جاهزية البيانات الوصفية)
+Strategy = tuple[str, Callable[[asyncio.Event], Awaitable[dict]]]
+
+# ─── أزمنة الوصول للبيانات الوصفية لكل استراتيجية ──────────────────────────
+_latencies: dict[str, deque] = defaultdict(lambda: deque(maxlen=200))
+
+
+def record_latency(key: str, seconds: float) -> None:
+    _latencies[key].append(seconds)
+
+
+def p95(key: str) -> float | None:
+    samples = _latencies.get(key)
+    if not samples or len(samples) < config.HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def hedge_delay(key: str) -> float:
+    """تأخير التحوّط: p95 التاريخي للاستراتيجية أو القيمة الافتراضية من config."""
+    value = p95(key)
+    if value is None:
+        return config.HEDGE_DEFAULT_DELAY
+    return max(config.HEDGE_MIN_DELAY, value)
+
+
+async def run_in_thread(executor, fn, *args, on_orphan: Callable[[object], None] | None = None):
+    """تشغيل دالة متزامنة في الـ Executor مع دعم الإلغاء:
+    الخيط لا يمكن إيقافه، لذا تُمرر نتيجته المتأخرة إلى on_orphan (للحذف)."""
+    loop = asyncio.get_running_loop()
+    fut  = loop.run_in_executor(executor, fn, *args)
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        if on_orphan:
+            def _done(f):
+                if not f.cancelled() and f.exception() is None:
+                    on_orphan(f.result())
+            fut.add_done_callback(_done)
+        raise
+
+
+async def hedged(
+    strategies: list[Strategy],
+    *,
+    platform: str,
+    is_valid: Callable[[dict], bool] = bool,
+    cleanup: Callable[[dict], None] | None = None,
+    fatal: tuple[type[Exception], ...] = (),
+) -> dict:
+    """تشغيل الاستراتيجيات بالتحوّط وإرجاع أول نتيجة صالحة.
+    fatal: استثناءات تنهي الكل فوراً لأن بقية الاستراتيجيات ستفشل مثلها (مثل تجاوز الحجم)."""
+    if not strategies:
+        raise ValueError("No strategies to run")
+
+    pending_strategies = list(strategies)
+    running: dict[asyncio.Task, tuple[str, asyncio.Event, float]] = {}
+    last_error: Exception | None = None
+
+    def _launch() -> None:
+        name, fn = pending_strategies.pop(0)
+        ready = asyncio.Event()
+        started_at = time.monotonic()
+
+        async def _mark_ready() -> None:
+            await ready.wait()
+            record_latency(f"{platform}:{name}", time.monotonic() - started_at)
+
+        watcher = asyncio.ensure_future(_mark_ready())
+        task = asyncio.ensure_future(fn(ready))
+        task.add_done_callback(lambda _: watcher.cancel())
+        running[task] = (name, ready, started_at)
+        logger.info("🏁 [%s] Starting strategy: %s", platform, name)
+
+    def _discard(task: asyncio.Task) -> None:
+        """التخلص من استراتيجية خاسرة: إلغاء، وحذف نتيجتها إن اكتملت."""
+        if not task.done():
+            task.cancel()
+        if cleanup:
+            def _done(t: asyncio.Task) -> None:
+                if not t.cancelled() and t.exception() is None and t.result():
+                    cleanup(t.result())
+            task.add_done_callback(_done)
+        else:
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    _launch()
+    try:
+        while running:
+            # التحوّط ينتظر فقط الاستراتيجية الأحدث التي لم تُنتج بياناتها الوصفية بعد
+            newest_task = next(reversed(running))
+            name, ready, started_at = running[newest_task]
+            timeout = None
+            if pending_strategies and config.HEDGE_ENABLED and not ready.is_set():
+                delay   = hedge_delay(f"{platform}:{name}")
+                timeout = max(0.0, started_at + delay - time.monotonic())
+
+            waiters = set(running)
+            if timeout is not None:
+                ready_waiter = asyncio.ensure_future(ready.wait())
+                waiters.add(ready_waiter)
+            done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if timeout is not None:
+                ready_waiter.cancel()
+                done.discard(ready_waiter)
+
+            if not done:
+                if not ready.is_set():
+                    logger.info("⏱️ [%s] %s is slow (> %.1fs), hedging with next strategy", platform, name, timeout)
+                    _launch()
+                continue
+
+            finished = list(done)
+            for i, task in enumerate(finished):
+                task_name, task_ready, task_started = running.pop(task)
+                elapsed = time.monotonic() - task_started
+                try:
+                    result = task.result()
+                except fatal:
+                    for other in list(running) + finished[i + 1:]:
+                        _discard(other)
+                    running.clear()
+                    raise
+                except Exception as exc:
+                    last_error = exc
+                    logger.warning("⚠️ [%s] Strategy %s failed: %s", platform, task_name, exc)
+                    result = None
+                ok = bool(result) and is_valid(result)
+                scoreboard.record(platform, task_name, ok, elapsed)
+                if ok:
+                    if not task_ready.is_set():
+                        record_latency(f"{platform}:{task_name}", elapsed)
+                    logger.info("✅ [%s] Strategy %s won", platform, task_name)
+                    for other in list(running):
+                        _discard(other)
+                    running.clear()
+                    for extra in finished[i + 1:]:
+                        _discard(extra)
+                    return result
+                if result is not None:
+                    last_error = ValueError(f"{task_name} returned no valid results")
+                    if cleanup:
+                        cleanup(result)
+                # فشلت هذه الاستراتيجية: نبدأ التالية فوراً بدلاً من انتظار مهلة التحوّط
+                if pending_strategies:
+                    _launch()
+    except asyncio.CancelledError:
+        for task in list(running):
+            _discard(task)
+        raise
+
+    raise last_error or ValueError("All strategies failed")
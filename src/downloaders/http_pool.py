@@ -0,0 +1,246 @@
+"""
+downloaders/http_pool.py - سجل مركزي لاتصالات HTTP المشتركة بين وحدات التحميل
+────────────────────────────────────────
+  - عميل httpx غير متزامن لكل (event loop, proxy) و requests.Session لكل proxy؛ الاستدعاء
+    المتزامن عبر run_sync يغلق عملاء الـ loop المؤقت قبل انتهائه
+  - Keep-alive لكل مضيف مع أحجام مجمعات قابلة للضبط من config
+  - إغلاق العملاء/الجلسات الخاملة (بروكسيات لم تعد مستخدمة)؛ المحجوز عبر use_client / use_session
+    (تدفق ملف كبير مثلاً) لا يُغلق مهما طال استخدامه
+  - ذاكرة DNS لتفادي استعلام الأسماء مع كل اتصال جديد
+  - إحصائيات إعادة استخدام الاتصالات لكل مضيف
+"""
+import asyncio
+import contextlib
+import logging
+import socket
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+_lock = threading.Lock()
+
+# ─── إحصائيات لكل مضيف (للمسار غير المتزامن) ────────────────────────────────
+_host_stats: dict[str, dict] = defaultdict(lambda: {"requests": 0, "new_connections": 0})
+
+
+def normalize_proxy(proxy: str | None) -> str | None:
+    if not proxy:
+        return None
+    p = proxy.strip()
+    if not p.startswith(("http://", "https://", "socks5://", "socks4://")):
+        p = f"http://{p}"
+    return p
+
+
+# ─── ذاكرة DNS ───────────────────────────────────────────────────────────────
+_dns_cache = TTLCache(maxsize=1024, ttl=config.DNS_CACHE_TTL)
+_orig_getaddrinfo = socket.getaddrinfo
+
+
+def _cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    key = (host, port, family, type, proto, flags)
+    result = _dns_cache.get(key)
+    if result is None:
+        result = _orig_getaddrinfo(host, port, family, type, proto, flags)
+        _dns_cache.set(key, result)
+    return result
+
+
+def install_dns_cache() -> None:
+    """استبدال socket.getaddrinfo بنسخة مخزنة (يشمل httpx و requests و yt-dlp)."""
+    if socket.getaddrinfo is not _cached_getaddrinfo and config.DNS_CACHE_TTL > 0:
+        socket.getaddrinfo = _cached_getaddrinfo
+        logger.info("🧭 DNS cache enabled (TTL %ss)", config.DNS_CACHE_TTL)
+
+
+# ─── العملاء غير المتزامنين ──────────────────────────────────────────────────
+# AsyncClient مرتبط بالـ loop الذي أُنشئ فيه، لذا نحتفظ بمجموعة منفصلة لكل loop
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+async def _trace_request(request: httpx.Request) -> None:
+    host = request.url.host
+    _host_stats[host]["requests"] += 1
+
+    async def trace(event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.started":
+            _host_stats[host]["new_connections"] += 1
+
+    request.extensions["trace"] = trace
+
+
+def _idle(entries: dict, now: float) -> list:
+    """البروكسيات الخاملة: غير مستخدمة منذ HTTP_POOL_IDLE_SECONDS ولا يحجزها أحد."""
+    return [
+        p for p, e in entries.items()
+        if p is not None and not e["users"] and now - e["last_used"] > config.HTTP_POOL_IDLE_SECONDS
+    ]
+
+
+def _client_entry(proxy: str | None) -> dict:
+    loop = asyncio.get_running_loop()
+    proxy = normalize_proxy(proxy)
+    now = time.monotonic()
+    with _lock:
+        per_loop = _clients.setdefault(loop, {})
+        entry = per_loop.get(proxy)
+        if entry is None or entry["client"].is_closed:
+            client = httpx.AsyncClient(
+                proxy=proxy,
+                follow_redirects=True,
+                timeout=httpx.Timeout(20, connect=10),
+                headers={"User-Agent": USER_AGENT},
+                limits=httpx.Limits(
+                    max_connections=config.HTTP_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.HTTP_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=config.HTTP_POOL_IDLE_SECONDS,
+                ),
+                event_hooks={"request": [_trace_request]},
+            )
+            entry = per_loop[proxy] = {"client": client, "last_used": now, "users": 0}
+        entry["last_used"] = now
+        stale = [per_loop.pop(p)["client"] for p in _idle(per_loop, now)]
+    for client in stale:
+        loop.create_task(client.aclose())
+    return entry
+
+
+def get_client(proxy: str | None = None) -> httpx.AsyncClient:
+    """إرجاع العميل المشترك للـ loop الحالي والبروكسي المحدد (للطلبات القصيرة)."""
+    return _client_entry(proxy)["client"]
+
+
+@contextlib.asynccontextmanager
+async def use_client(proxy: str | None = None):
+    """حجز العميل طوال الاستخدام (تدفق طويل) حتى لا يُغلق كخامل أثناءه."""
+    entry = _client_entry(proxy)
+    with _lock:
+        entry["users"] += 1
+    try:
+        yield entry["client"]
+    finally:
+        with _lock:
+            entry["users"]    -= 1
+            entry["last_used"] = time.monotonic()
+
+
+async def aclose_all() -> None:
+    """إغلاق عملاء الـ loop الحالي (عند الإيقاف)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _clients.pop(loop, {})
+    for entry in per_loop.values():
+        await entry["client"].aclose()
+
+
+def run_sync(coro):
+    """تشغيل Coroutine من كود متزامن في loop مؤقت؛ عملاء ذلك الـ loop يُغلقون قبل انتهائه
+    (وإلا بقي لكل استدعاء عميل واتصالات مفتوحة لا يعود إليها أحد)."""
+    async def _main():
+        try:
+            return await coro
+        finally:
+            await aclose_all()
+    return asyncio.run(_main())
+
+
+# ─── الجلسات المتزامنة (requests) ────────────────────────────────────────────
+_sessions: dict[str | None, dict] = {}
+
+
+def _session_entry(proxy: str | None) -> dict:
+    proxy = normalize_proxy(proxy)
+    now = time.monotonic()
+    with _lock:
+        entry = _sessions.get(proxy)
+        if entry is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=config.HTTP_POOL_HOSTS,
+                pool_maxsize=config.HTTP_POOL_MAX_KEEPALIVE,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"User-Agent": USER_AGENT})
+            if proxy:
+                session.proxies = {"http": proxy, "https": proxy}
+            entry = _sessions[proxy] = {"session": session, "last_used": now, "users": 0}
+        entry["last_used"] = now
+        stale = [_sessions.pop(p)["session"] for p in _idle(_sessions, now)]
+    for session in stale:
+        session.close()
+    return entry
+
+
+def get_session(proxy: str | None = None) -> requests.Session:
+    """جلسة requests مشتركة لكل بروكسي مع مجمع اتصالات Keep-alive لكل مضيف (للطلبات القصيرة)."""
+    return _session_entry(proxy)["session"]
+
+
+@contextlib.contextmanager
+def use_session(proxy: str | None = None):
+    """حجز الجلسة طوال الاستخدام حتى لا تُغلق كخاملة أثناءه."""
+    entry = _session_entry(proxy)
+    with _lock:
+        entry["users"] += 1
+    try:
+        yield entry["session"]
+    finally:
+        with _lock:
+            entry["users"]    -= 1
+            entry["last_used"] = time.monotonic()
+
+
+def _session_host_stats() -> dict[str, dict]:
+    """قراءة عدادات urllib3 (num_requests / num_connections) لكل مضيف."""
+    result: dict[str, dict] = defaultdict(lambda: {"requests": 0, "new_connections": 0})
+    with _lock:
+        sessions = [e["session"] for e in _sessions.values()]
+    for session in sessions:
+        adapter = session.get_adapter("https://")
+        for pool_key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(pool_key)
+            if pool is None:
+                continue
+            result[pool.host]["requests"]        += pool.num_requests
+            result[pool.host]["new_connections"] += pool.num_connections
+    return result
+
+
+def stats() -> dict:
+    """إحصائيات إعادة استخدام الاتصالات لكل مضيف + حالة الذاكرة."""
+    merged: dict[str, dict] = defaultdict(lambda: {"requests": 0, "new_connections": 0})
+    for source in (dict(_host_stats), _session_host_stats()):
+        for host, s in source.items():
+            merged[host]["requests"]        += s["requests"]
+            merged[host]["new_connections"] += s["new_connections"]
+
+    hosts = {}
+    for host, s in sorted(merged.items(), key=lambda kv: -kv[1]["requests"]):
+        reused = max(s["requests"] - s["new_connections"], 0)
+        hosts[host] = {
+            **s,
+            "reused":     reused,
+            "reuse_rate": round(reused / s["requests"] * 100, 1) if s["requests"] else 0.0,
+        }
+    with _lock:
+        async_clients = sum(len(v) for v in _clients.values())
+        sync_sessions = len(_sessions)
+    return {
+        "hosts":         hosts,
+        "async_clients": async_clients,
+        "sessions":      sync_sessions,
+        "dns_cache":     _dns_cache.stats(),
+    }
@@ -1,35 +1,67 @@
 """
 downloaders/instagram.py - وحدة تحميل Instagram باستخدام SnapReels API.
 تعتمد على جلب رابط التحميل وفك تشفير JWT Token للحصول على رابط Instagram CDN المباشر والتحميل منه.
+جميع الطلبات غير متزامنة (httpx) عبر downloaders.async_http.
 """
 import os
 import re
 import json
 import base64
 import logging
-import requests
-import random
+import time
 import uuid
 from urllib.parse import urlparse, parse_qs
 
 import config
-from data import database
 from .base import BaseDownloader
+from . import async_http, http_pool, proxy_pool, scoreboard, sizing, urls
 
 logger = logging.getLogger(__name__)
 
+
+_API_HOST = "snapreels.net"
+
+_API_HEADERS = {
+    "User-Agent": async_http.USER_AGENT,
+    "Referer": "https://snapreels.net/en",
+    "Origin": "https://snapreels.net",
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "sec-fetch-site": "same-origin",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-dest": "empty",
+}
+
+_CDN_HEADERS = {
+    "User-Agent": async_http.USER_AGENT,
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "identity",
+    "Referer": "https://www.instagram.com/",
+    "sec-fetch-dest": "video",
+    "sec-fetch-mode": "no-cors",
+    "sec-fetch-site": "cross-site",
+    "Range": "bytes=0-",
+}
+
+
 class InstagramDownloader(BaseDownloader):
     """وحدة تحميل مقاطع Instagram باستخدام SnapReels."""
 
-    def get_download_link(self, video_url: str, session: requests.Session) -> str:
+    platform = "Instagram"
+
+    async def get_download_link(self, video_url: str, proxy: str | None = None) -> str:
         """
-        يجلب رابط تحميل الفيديو من snapreels.net باستخدام requests.
+        يجلب رابط تحميل الفيديو من snapreels.net.
         """
+        client = async_http.get_client(proxy)
+
         # الخطوة 1: احصل على JWT Token
         logger.info("[1/3] Getting JWT Token from /api/userverify...")
-        verify_resp = session.post(
+        verify_resp = await client.post(
             "https://snapreels.net/api/userverify",
             data={"url": video_url},
+            headers=_API_HEADERS,
             timeout=15
         )
         verify_resp.raise_for_status()
@@ -43,7 +75,7 @@ class InstagramDownloader(BaseDownloader):
 
         # الخطوة 2: جلب رابط التحميل
         logger.info("[2/3] Fetching download link from /api/ajaxSearch...")
-        search_resp = session.post(
+        search_resp = await client.post(
             "https://snapreels.net/api/ajaxSearch",
             data={
                 "q": video_url,
@@ -52,6 +84,7 @@ class InstagramDownloader(BaseDownloader):
                 "v": "v2",
                 "cftoken": jwt_token,
             },
+            headers=_API_HEADERS,
             timeout=20
         )
         search_resp.raise_for_status()
@@ -98,140 +131,91 @@ class InstagramDownloader(BaseDownloader):
 
         return real_url
 
-    def _is_proxy_working(self, proxy: str) -> bool:
-        """يتحقق مما إذا كان البروكسي يعمل حالياً عبر طلب سريع لـ snapreels.net."""
-        p_str = proxy.strip()
-        if not p_str.startswith(("http://", "https://", "socks4://", "socks5://")):
-            p_str = f"http://{p_str}"
-        try:
-            resp = requests.get(
-                "https://snapreels.net",
-                proxies={"http": p_str, "https": p_str},
-                timeout=4
-            )
-            return resp.status_code == 200
-        except Exception:
-            return False
+    def _find_working_proxy(self) -> str | None:
+        """اختيار أفضل بروكسي لـ snapreels.net من مجمع البروكسيات (بدون فحص على مسار الطلب)."""
+        picked = proxy_pool.choose(k=1, host=_API_HOST)
+        return picked[0] if picked else None
 
-    def download_video(self, url: str) -> dict:
+    async def download_video_async(self, url: str, executor=None) -> dict:
         """
         يجلب رابط التحميل ويفك التشفير ويحمل الفيديو من Instagram CDN مباشرة.
         """
         # استخراج معرف المنشور/الريل كاسم للملف
-        parts = [p for p in url.split("/") if p]
-        shortcode = "video"
-        for i, p in enumerate(parts):
-            if p in ("p", "reels", "reel") and i + 1 < len(parts):
-                shortcode = parts[i+1].split("?")[0]
-                break
+        shortcode = urls.extract_media_id(url, "Instagram") or "video"
+        shortcode = shortcode.replace(":", "_")
 
         filename = f"insta_{shortcode}_{uuid.uuid4().hex[:8]}.mp4"
         filepath = os.path.join(self.download_path, filename)
 
-        session = requests.Session()
-        session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Referer": "https://snapreels.net/en",
-            "Origin": "https://snapreels.net",
-            "Accept": "*/*",
-            "Accept-Language": "en-US,en;q=0.9",
-            "sec-fetch-site": "same-origin",
-            "sec-fetch-mode": "cors",
-            "sec-fetch-dest": "empty",
-        })
-
-        # المحاولة الأولى: اتصال مباشر بدون بروكسي
-        # في حال الفشل فقط، نجلب البروكسيات ونفحصها
-        all_proxies = []
-
-        # بناء المحاولات: مباشر أولاً
-        attempts = [None]
-
+        # الترتيب الافتراضي: اتصال مباشر ثم بروكسي عامل، ويُعاد ترتيبهما حسب لوحة النتائج
         last_error = None
-        for proxy in attempts:
-            if proxy:
-                if not proxy.startswith(("http://", "https://", "socks5://", "socks4://")):
-                    p_str = f"http://{proxy}"
-                else:
-                    p_str = proxy
-                session.proxies = {"http": p_str, "https": p_str}
-                logger.info(f"📡 Using proxy: {p_str}")
+        for backend in scoreboard.order(self.platform, ["direct", "proxy"]):
+            started_at = time.monotonic()
+            proxy = None
+            if backend == "proxy":
+                proxy = self._find_working_proxy()
+                if not proxy:
+                    logger.warning("⚠️ No working proxies found. Skipping proxy attempt.")
+                    continue
+                logger.info(f"📡 Using proxy: {async_http.normalize_proxy(proxy)}")
             else:
-                session.proxies = {}
                 logger.info("📡 Using direct connection")
 
             try:
                 # 1. الحصول على رابط التحميل
-                dl_link = self.get_download_link(url, session)
-                
+                link_started = time.monotonic()
+                try:
+                    dl_link = await self.get_download_link(url, proxy)
+                except Exception:
+                    if proxy:
+                        proxy_pool.report(proxy, False, time.monotonic() - link_started, host=_API_HOST)
+                    raise
+                if proxy:
+                    proxy_pool.report(proxy, True, time.monotonic() - link_started, host=_API_HOST)
+
                 # 2. فك التشفير والتحميل
                 logger.info("[3/3] Decoding JWT to extract real Instagram CDN URL...")
                 real_url = self.decode_jwt_url(dl_link)
                 logger.info(f"Instagram CDN URL extracted: {real_url[:80]}...")
 
-                # 3. تحميل الفيديو
-                with requests.get(
-                    real_url,
-                    stream=True,
-                    timeout=60,
-                    headers={
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                        "Accept": "*/*",
-                        "Accept-Language": "en-US,en;q=0.9",
-                        "Accept-Encoding": "identity",
-                        "Referer": "https://www.instagram.com/",
-                        "sec-fetch-dest": "video",
-                        "sec-fetch-mode": "no-cors",
-                        "sec-fetch-site": "cross-site",
-                        "Range": "bytes=0-",
-                    }
-                ) as resp:
-                    resp.raise_for_status()
-                    with open(filepath, "wb") as f:
-                        for chunk in resp.iter_content(chunk_size=65536):
-                            if chunk:
-                                f.write(chunk)
+                # 3. تحميل الفيديو (CDN مباشرة بدون بروكسي)
+                await async_http.stream_to_file(
+                    real_url, filepath, headers=_CDN_HEADERS, timeout=60, max_bytes=sizing.download_budget()
+                )
 
                 # التأكد من صحة الملف وحجمه
                 if os.path.exists(filepath) and os.path.getsize(filepath) > 1024:
                     logger.info("✅ Instagram video downloaded successfully via SnapReels API.")
+                    scoreboard.record(self.platform, backend, True, time.monotonic() - started_at)
                     return {"results": filepath, "description": ""}
                 else:
                     if os.path.exists(filepath):
                         os.remove(filepath)
                     raise Exception("Downloaded file is too small or corrupted.")
 
+            except sizing.MediaTooLarge:
+                raise
             except Exception as e:
                 last_error = e
-                logger.warning(f"⚠️ Attempt failed ({('proxy: ' + p_str) if proxy else 'direct'}): {e}")
+                scoreboard.record(self.platform, backend, False, time.monotonic() - started_at)
+                logger.warning(f"⚠️ Attempt failed ({('proxy: ' + proxy) if proxy else 'direct'}): {e}")
                 if os.path.exists(filepath):
                     try:
                         os.remove(filepath)
                     except:
                         pass
 
-                # إذا كانت هذه المحاولة المباشرة (بدون بروكسي) وفشلت، نجلب البروكسيات ونفحصها
-                if proxy is None and not all_proxies:
-                    try:
-                        all_proxies = database.get_proxies()
-                    except:
-                        pass
-                    if all_proxies:
-                        logger.info(f"🔍 Direct failed. Found {len(all_proxies)} proxies. Testing...")
-                        random.shuffle(all_proxies)
-                        for p in all_proxies:
-                            if self._is_proxy_working(p):
-                                logger.info(f"✅ Proxy works: {p}")
-                                attempts.append(p)
-                                break
-                            else:
-                                logger.warning(f"❌ Proxy dead: {p}")
-                        if not any(a for a in attempts if a is not None):
-                            logger.warning("⚠️ No working proxies found. Giving up.")
-
         raise Exception(f"⚠️ فشل تحميل الفيديو: {last_error}")
 
+    def download_video(self, url: str) -> dict:
+        """واجهة متزامنة للتوافق (تُشغّل المسار غير المتزامن في loop مستقل)."""
+        return http_pool.run_sync(self.download_video_async(url))
+
     def cleanup(self, path):
+        if isinstance(path, list):
+            for p in path:
+                self.cleanup(p)
+            return
         if path and os.path.exists(path):
             try:
                 os.remove(path)
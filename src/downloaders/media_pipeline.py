@@ -0,0 +1,282 @@
+"""
+downloaders/media_pipeline.py - مرحلة ffmpeg بعد التحميل (Remux / ضغط / بيانات وصفية)
+────────────────────────────────────────
+  - Remux إلى MP4 مع +faststart (moov في البداية) حتى يبدأ التشغيل في Telegram قبل اكتمال التحميل
+  - إعادة ترميز (H.264/AAC) بمعدل بت محسوب من المدة إذا تجاوز الملف حد الرفع أو لم يكن الترميز متوافقاً
+  - استخراج المدة والأبعاد وصورة مصغرة لتمريرها إلى send_video
+  - المهام تعمل في مجمع عمليات محدود (FFMPEG_WORKERS) وخيوط ffmpeg موزعة على الأنوية،
+    ولكل أمر مهلة (FFMPEG_TIMEOUT) يُقتل بعدها
+"""
+import asyncio
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+from . import sizing
+
+logger = logging.getLogger(__name__)
+
+# ترميزات يعرضها Telegram داخل MP4 دون إعادة ترميز
+_COPY_VCODECS = ("h264", "hevc")
+_COPY_ACODECS = ("aac", "mp3")
+_AUDIO_BITRATE = 96_000
+_MIN_VIDEO_BITRATE = 150_000
+_THUMB_WIDTH = 320
+
+
+# ─── داخل العملية العاملة ────────────────────────────────────────────────────
+class _Deadline:
+    """مهلة واحدة للمهمة كلها موزعة على أوامر ffprobe / ffmpeg المتتالية."""
+
+    def __init__(self, seconds: float):
+        self.end = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        left = self.end - time.monotonic()
+        if left <= 0:
+            raise subprocess.TimeoutExpired("ffmpeg", 0)
+        return left
+
+
+def _run(cmd: list[str], deadline: _Deadline) -> subprocess.CompletedProcess:
+    # subprocess.run يقتل ffmpeg عند انتهاء المهلة
+    return subprocess.run(cmd, capture_output=True, check=True, timeout=deadline.remaining())
+
+
+def _probe(path: str, deadline: _Deadline) -> dict:
+    out = _run([
+        "ffprobe", "-v", "error", "-print_format", "json",
+        "-show_format", "-show_streams", path,
+    ], deadline).stdout
+    data   = json.loads(out or b"{}")
+    video  = next((s for s in data.get("streams", []) if s.get("codec_type") == "video"), {})
+    audio  = next((s for s in data.get("streams", []) if s.get("codec_type") == "audio"), {})
+    fmt    = data.get("format", {})
+    try:
+        duration = float(fmt.get("duration") or video.get("duration") or 0)
+    except ValueError:
+        duration = 0.0
+    return {
+        "duration": duration,
+        "width":    int(video.get("width") or 0),
+        "height":   int(video.get("height") or 0),
+        "vcodec":   video.get("codec_name"),
+        "acodec":   audio.get("codec_name"),
+        "format":   fmt.get("format_name", ""),
+    }
+
+
+def _is_faststart(path: str) -> bool:
+    """هل يسبق moov الـ mdat؟ (فحص الصناديق العليا في ملف MP4 دون قراءته كاملاً)."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, kind = struct.unpack(">I4s", header)
+                if kind == b"moov":
+                    return True
+                if kind == b"mdat":
+                    return False
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0] - 8
+                elif size == 0:
+                    return False
+                f.seek(size - 8, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return False
+
+
+def _video_bitrate(limit: int, duration: float) -> int:
+    """معدل بت الفيديو الذي يجعل الملف الناتج تحت الحد (مع هامش 5% للحاوية)."""
+    return int(limit * 8 * 0.95 / duration) - _AUDIO_BITRATE
+
+
+def _scale_height(bitrate: int, height: int) -> int:
+    if bitrate < 600_000:
+        return min(height, 480)
+    if bitrate < 1_500_000:
+        return min(height, 720)
+    return height
+
+
+def _transcode(src: str, dst: str, info: dict, limit: int, threads: int, deadline: _Deadline) -> None:
+    cmd = ["ffmpeg", "-y", "-v", "error", "-i", src, "-map", "0:v:0", "-map", "0:a:0?",
+           "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+           "-c:a", "aac", "-b:a", str(_AUDIO_BITRATE), "-threads", str(threads)]
+    size = os.path.getsize(src)
+    if size > limit:
+        if not info["duration"]:
+            raise sizing.MediaTooLarge(size, limit)
+        bitrate = _video_bitrate(limit, info["duration"])
+        if bitrate < _MIN_VIDEO_BITRATE:
+            # الجودة الناتجة لن تكون قابلة للمشاهدة
+            raise sizing.MediaTooLarge(size, limit)
+        cmd += ["-b:v", str(bitrate), "-maxrate", str(bitrate), "-bufsize", str(bitrate * 2)]
+        height = _scale_height(bitrate, info["height"])
+        if info["height"] and height < info["height"]:
+            cmd += ["-vf", f"scale=-2:{height}"]
+    else:
+        cmd += ["-crf", "23"]
+    _run(cmd + ["-movflags", "+faststart", dst], deadline)
+
+
+def _remux(src: str, dst: str, deadline: _Deadline) -> None:
+    _run(["ffmpeg", "-y", "-v", "error", "-i", src, "-map", "0", "-c", "copy",
+          "-movflags", "+faststart", dst], deadline)
+
+
+def _thumbnail(src: str, duration: float, deadline: _Deadline) -> str | None:
+    thumb = os.path.splitext(src)[0] + ".thumb.jpg"
+    try:
+        _run(["ffmpeg", "-y", "-v", "error", "-ss", f"{min(1.0, duration / 2):.2f}", "-i", src,
+              "-frames:v", "1", "-vf", f"scale={_THUMB_WIDTH}:-2", "-q:v", "5", thumb], deadline)
+    except subprocess.CalledProcessError:
+        return None
+    return thumb if os.path.exists(thumb) else None
+
+
+def _process(path: str, limit: int, threads: int, timeout: float) -> dict:
+    """تنفيذ المرحلة على ملف واحد؛ يعيد المسار النهائي والبيانات الوصفية وما تم عليه."""
+    deadline = _Deadline(timeout)
+    info     = _probe(path, deadline)
+    if not info["vcodec"]:
+        return {"path": path, "action": "skipped"}
+
+    compatible = info["vcodec"] in _COPY_VCODECS and info["acodec"] in (*_COPY_ACODECS, None)
+    oversize   = os.path.getsize(path) > limit
+    is_mp4     = path.lower().endswith(".mp4")
+
+    root, _ = os.path.splitext(path)
+    tmp     = root + ".ff.mp4"
+    try:
+        if oversize or not compatible:
+            action = "transcoded"
+            _transcode(path, tmp, info, limit, threads, deadline)
+        elif not is_mp4 or not _is_faststart(path):
+            action = "remuxed"
+            _remux(path, tmp, deadline)
+        else:
+            action = "unchanged"
+            tmp    = None
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    final = path
+    if tmp:
+        final = root + ".mp4"
+        os.replace(tmp, final)
+        if final != path:
+            os.remove(path)
+
+    # الأصل لم يعد موجوداً: فشل ما بعد الاستبدال (مهلة مثلاً) لا يُلغي الناتج،
+    # بل يُرسل بالبيانات السابقة للترميز وبدون صورة مصغرة
+    thumb = None
+    try:
+        if action == "transcoded":
+            info.update({k: v for k, v in _probe(final, deadline).items() if v})
+        thumb = _thumbnail(final, info["duration"], deadline)
+    except (subprocess.SubprocessError, OSError, ValueError):
+        partial = os.path.splitext(final)[0] + ".thumb.jpg"
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    return {
+        "path":     final,
+        "action":   action,
+        "duration": int(round(info["duration"])),
+        "width":    info["width"],
+        "height":   info["height"],
+        "thumb":    thumb,
+    }
+
+
+# ─── إدارة المجمع ────────────────────────────────────────────────────────────
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_stats = {"jobs": 0, "remuxed": 0, "transcoded": 0, "unchanged": 0, "skipped": 0,
+          "too_large": 0, "timeouts": 0, "failed": 0}
+
+
+def enabled() -> bool:
+    return sizing.compression_available()
+
+
+def _threads_per_job() -> int:
+    return max(1, (os.cpu_count() or 1) // max(1, config.FFMPEG_WORKERS))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=config.FFMPEG_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("🎞️ ffmpeg pool started (%d workers × %d threads)",
+                        config.FFMPEG_WORKERS, _threads_per_job())
+        return _pool
+
+
+def _reset_pool(old: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is old:
+            _pool = None
+    old.shutdown(wait=False)
+
+
+async def postprocess(path: str) -> dict | None:
+    """تمرير فيديو عبر المرحلة. يعيد {"path", "duration", "width", "height", "thumb"} أو None
+    إذا كانت المرحلة غير متاحة أو فشلت (يُرسل الملف الأصلي). MediaTooLarge يُرفع كما هو."""
+    if not enabled() or not path or not os.path.exists(path):
+        return None
+    pool = _get_pool()
+    _stats["jobs"] += 1
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(
+            pool, _process, path, sizing.upload_limit(), _threads_per_job(), config.FFMPEG_TIMEOUT
+        )
+    except sizing.MediaTooLarge:
+        _stats["too_large"] += 1
+        raise
+    except subprocess.TimeoutExpired:
+        _stats["timeouts"] += 1
+        logger.warning("⏱️ ffmpeg timed out after %ss: %s", config.FFMPEG_TIMEOUT, path)
+        return None
+    except BrokenProcessPool as e:
+        _stats["failed"] += 1
+        _reset_pool(pool)
+        logger.warning("⚠️ ffmpeg pool broken, sending original: %s", e)
+        return None
+    except Exception as e:
+        _stats["failed"] += 1
+        stderr = getattr(e, "stderr", None)
+        logger.warning("⚠️ ffmpeg failed for %s: %s %s", path, e, (stderr or b"")[-300:])
+        return None
+    _stats[result.pop("action")] += 1
+    return result
+
+
+def stats() -> dict:
+    return {**_stats, "enabled": enabled(), "workers": config.FFMPEG_WORKERS,
+            "threads_per_job": _threads_per_job(), "timeout": config.FFMPEG_TIMEOUT}
+
+
+@atexit.register
+def _shutdown() -> None:
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
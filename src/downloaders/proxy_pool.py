@@ -0,0 +1,224 @@
+"""
+downloaders/proxy_pool.py - مجمع البروكسيات مع تقييم الصحة في الخلفية
+────────────────────────────────────────
+  - فاحص غير متزامن في الخلفية (على loop البوت) يختبر كل البروكسيات دورياً
+  - لكل بروكسي: متوسط متحرك أُسّي لنسبة النجاح والزمن، وصحة منفصلة لكل مضيف هدف
+  - قاطع دائرة (Circuit Breaker): بعد فشل متتالٍ يُستبعد البروكسي، ثم يُجرَّب
+    مرة واحدة (half-open) بعد مهلة التبريد؛ المحاولة التي لا تُبلَّغ نتيجتها تسقط بعد مهلة
+  - الاختيار عشوائي موزون بالنقاط، فلا تدفع التحميلات ثمن اكتشاف بروكسي ميت
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import config
+from data import database
+from .http_pool import get_client, normalize_proxy
+
+logger = logging.getLogger(__name__)
+
+_CLOSED, _OPEN, _HALF_OPEN = "closed", "open", "half_open"
+
+_lock = threading.Lock()
+_proxies: dict[str, dict] = {}
+
+
+def _new_state() -> dict:
+    return {
+        # قيم مبدئية متحفظة للبروكسيات غير المفحوصة
+        "success":  0.5,
+        "latency":  config.PROXY_PROBE_TIMEOUT / 2,
+        "samples":  0,
+        "hosts":    {},
+        "state":    _CLOSED,
+        "failures": 0,
+        "opened_at": 0.0,
+        "trial_at": 0.0,      # بدء محاولة half-open الجارية (0 = لا محاولة)
+    }
+
+
+def host_of(url: str) -> str | None:
+    try:
+        return urlparse(url).hostname
+    except ValueError:
+        return None
+
+
+def sync_from_database() -> list[str]:
+    """مزامنة قائمة البروكسيات مع قاعدة البيانات (إضافة الجديد وحذف المحذوف)."""
+    try:
+        current = [normalize_proxy(p) for p in database.get_proxies()]
+    except Exception as exc:
+        logger.warning("⚠️ Could not load proxies: %s", exc)
+        with _lock:
+            return list(_proxies)
+    with _lock:
+        for p in current:
+            _proxies.setdefault(p, _new_state())
+        for p in set(_proxies) - set(current):
+            del _proxies[p]
+        return list(_proxies)
+
+
+# ─── تسجيل النتائج ───────────────────────────────────────────────────────────
+def report(proxy: str, ok: bool, latency: float, host: str | None = None) -> None:
+    """تسجيل نتيجة استخدام بروكسي (من الفاحص أو من تحميل فعلي).
+    يُتجاهل البروكسي غير الموجود في المجمع (مرشح قيد الفحص لم يُقبل بعد)."""
+    proxy = normalize_proxy(proxy)
+    alpha = config.PROXY_EWMA_ALPHA
+    value = 1.0 if ok else 0.0
+    with _lock:
+        s = _proxies.get(proxy)
+        if s is None:
+            return
+        if s["samples"] == 0:
+            s["success"], s["latency"] = value, latency
+        else:
+            s["success"] = (1 - alpha) * s["success"] + alpha * value
+            s["latency"] = (1 - alpha) * s["latency"] + alpha * latency
+        s["samples"] += 1
+
+        if host:
+            h = s["hosts"].get(host)
+            if h is None:
+                s["hosts"][host] = {"success": value, "latency": latency, "samples": 1}
+            else:
+                h["success"] = (1 - alpha) * h["success"] + alpha * value
+                h["latency"] = (1 - alpha) * h["latency"] + alpha * latency
+                h["samples"] += 1
+
+        # قاطع الدائرة
+        s["trial_at"] = 0.0
+        if ok:
+            s["failures"] = 0
+            if s["state"] != _CLOSED:
+                logger.info("🟢 Proxy recovered: %s", proxy)
+            s["state"] = _CLOSED
+        else:
+            s["failures"] += 1
+            if s["state"] == _HALF_OPEN or s["failures"] >= config.PROXY_BREAKER_THRESHOLD:
+                if s["state"] != _OPEN:
+                    logger.info("🔴 Proxy circuit opened: %s", proxy)
+                s["state"] = _OPEN
+                s["opened_at"] = time.monotonic()
+
+
+def _available(s: dict, now: float) -> bool:
+    """هل البروكسي متاح للاختيار؟ (ينقل المفتوح إلى half-open بعد التبريد)"""
+    if s["state"] == _OPEN and now - s["opened_at"] >= config.PROXY_BREAKER_COOLDOWN:
+        s["state"] = _HALF_OPEN
+    if s["state"] == _OPEN:
+        return False
+    # في half-open تُسمح محاولة واحدة فقط حتى تُعرف نتيجتها، أو تنتهي مهلتها إن لم يبلّغ عنها أحد
+    return not (
+        s["state"] == _HALF_OPEN and s["trial_at"]
+        and now - s["trial_at"] < config.PROXY_TRIAL_TIMEOUT
+    )
+
+
+def _score(s: dict, host: str | None) -> float:
+    success, latency = s["success"], s["latency"]
+    h = s["hosts"].get(host) if host else None
+    if h is not None:
+        success, latency = h["success"], h["latency"]
+    return (max(success, 0.01) ** 2) / max(latency, 0.1)
+
+
+def choose(k: int = 1, host: str | None = None, exclude: set[str] | None = None) -> list[str]:
+    """اختيار حتى k بروكسيات مختلفة بتوزيع موزون بالنقاط (الأفضل أكثر احتمالاً)."""
+    exclude = {normalize_proxy(p) for p in exclude or ()}
+    now = time.monotonic()
+    with _lock:
+        candidates = [
+            (p, _score(s, host)) for p, s in _proxies.items()
+            if p not in exclude and _available(s, now)
+        ]
+        picked: list[str] = []
+        while candidates and len(picked) < k:
+            total = sum(w for _, w in candidates)
+            r = random.uniform(0, total)
+            for i, (p, w) in enumerate(candidates):
+                r -= w
+                if r <= 0 or i == len(candidates) - 1:
+                    picked.append(p)
+                    candidates.pop(i)
+                    break
+        for p in picked:
+            if _proxies[p]["state"] == _HALF_OPEN:
+                _proxies[p]["trial_at"] = now
+    return picked
+
+
+# ─── الفاحص في الخلفية ──────────────────────────────────────────────────────
+async def _probe(proxy: str, target: str, sem: asyncio.Semaphore) -> None:
+    async with sem:
+        started_at = time.monotonic()
+        try:
+            resp = await get_client(proxy).get(target, timeout=config.PROXY_PROBE_TIMEOUT)
+            ok = resp.status_code < 500
+        except Exception:
+            ok = False
+        report(proxy, ok, time.monotonic() - started_at, host=host_of(target))
+
+
+async def probe_all() -> None:
+    """جولة فحص واحدة لكل البروكسيات على كل الأهداف."""
+    loop = asyncio.get_running_loop()
+    proxies = await loop.run_in_executor(None, sync_from_database)
+    if not proxies:
+        return
+    now = time.monotonic()
+    with _lock:
+        # البروكسيات المفتوحة لا تُفحص قبل انتهاء التبريد
+        proxies = [
+            p for p in proxies if p in _proxies and (
+                _proxies[p]["state"] != _OPEN
+                or now - _proxies[p]["opened_at"] >= config.PROXY_BREAKER_COOLDOWN
+            )
+        ]
+    sem = asyncio.Semaphore(config.PROXY_PROBE_CONCURRENCY)
+    await asyncio.gather(*(
+        _probe(p, target, sem) for p in proxies for target in config.PROXY_PROBE_TARGETS
+    ))
+    logger.info("🩺 Proxy probe round done (%d proxies)", len(proxies))
+
+
+async def run_prober() -> None:
+    """حلقة الفحص الدورية (تُشغّل كمهمة على loop البوت)."""
+    while True:
+        try:
+            await probe_all()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("⚠️ Proxy prober error: %s", exc)
+        await asyncio.sleep(config.PROXY_PROBE_INTERVAL)
+
+
+def stats() -> dict:
+    """حالة المجمع للوحة التحكم."""
+    with _lock:
+        items = {
+            p: {
+                "state":        s["state"],
+                "success_rate": round(s["success"] * 100, 1),
+                "latency":      round(s["latency"], 2),
+                "samples":      s["samples"],
+                "hosts": {
+                    h: {"success_rate": round(v["success"] * 100, 1), "latency": round(v["latency"], 2)}
+                    for h, v in s["hosts"].items()
+                },
+            }
+            for p, s in _proxies.items()
+        }
+    states = [v["state"] for v in items.values()]
+    return {
+        "total":     len(items),
+        "closed":    states.count(_CLOSED),
+        "open":      states.count(_OPEN),
+        "half_open": states.count(_HALF_OPEN),
+        "proxies":   items,
+    }
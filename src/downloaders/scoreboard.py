@@ -0,0 +1,75 @@
+"""
+downloaders/scoreboard.py - لوحة نتائج الاستراتيجيات لكل منصة (EWMA)
+────────────────────────────────────────
+  - نسبة النجاح وزمن الاستجابة لكل (منصة، استراتيجية) بمتوسط متحرك أُسّي
+  - ترتيب المحاولات يُختار مع كل طلب حسب التكلفة المتوقعة = الزمن / نسبة النجاح
+  - الترتيب الافتراضي في الكود يبقى للاستراتيجيات التي لم تُقس بعد
+  - نسبة استكشاف صغيرة تمنع حرمان الاستراتيجيات المتأخرة من فرصة القياس
+"""
+import logging
+import random
+import threading
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_lock   = threading.Lock()
+_scores: dict[tuple[str, str], dict] = {}
+
+
+def record(platform: str, strategy: str, ok: bool, latency: float) -> None:
+    """تسجيل نتيجة محاولة (نجاح/فشل وزمنها بالثواني)."""
+    alpha = config.SCOREBOARD_ALPHA
+    with _lock:
+        s = _scores.get((platform, strategy))
+        if s is None:
+            _scores[(platform, strategy)] = {
+                "success": 1.0 if ok else 0.0,
+                "latency": latency,
+                "samples": 1,
+            }
+            return
+        s["success"] = (1 - alpha) * s["success"] + alpha * (1.0 if ok else 0.0)
+        # زمن الفشل يُحسب أيضاً لأنه وقت ضائع على المستخدم
+        s["latency"] = (1 - alpha) * s["latency"] + alpha * latency
+        s["samples"] += 1
+
+
+def _expected_cost(platform: str, strategy: str) -> float | None:
+    s = _scores.get((platform, strategy))
+    if s is None or s["samples"] < config.SCOREBOARD_MIN_SAMPLES:
+        return None
+    return s["latency"] / max(s["success"], 0.05)
+
+
+def order(platform: str, strategies: list[str]) -> list[str]:
+    """ترتيب الاستراتيجيات من الأفضل للأسوأ لهذا الطلب.
+    الاستراتيجيات المقاسة تُرتب فيما بينها، وغير المقاسة تبقى في مواضعها الافتراضية."""
+    ranked = list(strategies)
+    with _lock:
+        costs = {name: _expected_cost(platform, name) for name in strategies}
+    slots    = [i for i, name in enumerate(ranked) if costs[name] is not None]
+    measured = sorted((ranked[i] for i in slots), key=lambda name: costs[name])
+    for i, name in zip(slots, measured):
+        ranked[i] = name
+
+    if len(ranked) > 1 and random.random() < config.SCOREBOARD_EXPLORE:
+        # استكشاف: تقديم استراتيجية عشوائية من غير الأولى
+        pick = random.choice(ranked[1:])
+        ranked.remove(pick)
+        ranked.insert(0, pick)
+    return ranked
+
+
+def snapshot() -> dict:
+    """حالة اللوحة للعرض في لوحة التحكم."""
+    with _lock:
+        result: dict[str, dict] = {}
+        for (platform, strategy), s in _scores.items():
+            result.setdefault(platform, {})[strategy] = {
+                "success_rate": round(s["success"] * 100, 1),
+                "latency":      round(s["latency"], 2),
+                "samples":      s["samples"],
+            }
+    return result
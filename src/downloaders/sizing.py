@@ -0,0 +1,107 @@
+"""
+downloaders/sizing.py - اختيار الصيغة حسب حد الرفع في Telegram قبل التحميل
+────────────────────────────────────────
+  - Bot API يرفض رفع ما يزيد عن 50MB (أو الحد المضبوط في TELEGRAM_UPLOAD_LIMIT_MB)
+  - yt-dlp: دالة اختيار صيغة تقرأ filesize / filesize_approx وتختار أفضل صيغة تحت الحد
+  - روابط CDN: يُقرأ Content-Length من رأس الاستجابة قبل تدفق المحتوى
+  - إذا توفرت مرحلة الضغط (ffmpeg) يُقبل ما يصل إلى COMPRESS_MAX_RATIO × الحد ثم يُضغط
+  - ما يتجاوز ذلك يُرفض مبكراً برسالة واضحة بدل تحميل ملف لن يُرفع
+"""
+import functools
+import logging
+import os
+import shutil
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class MediaTooLarge(Exception):
+    """حجم الوسائط يتجاوز حد الرفع (size و limit بالبايت؛ size قد يكون None إن كان تقديرياً)."""
+
+    def __init__(self, size: int | None, limit: int):
+        super().__init__(size, limit)
+        self.size  = size
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if self.size:
+            return f"Media is {self.size / 1048576:.1f} MB, upload limit is {self.limit / 1048576:.0f} MB"
+        return f"Media exceeds the {self.limit / 1048576:.0f} MB upload limit"
+
+
+def upload_limit() -> int:
+    """حد الرفع الحالي بالبايت."""
+    return int(config.TELEGRAM_UPLOAD_LIMIT_MB * 1024 * 1024)
+
+
+def compression_available() -> bool:
+    """هل مرحلة الضغط (downloaders.media_pipeline) متاحة؟"""
+    return config.FFMPEG_ENABLED and shutil.which("ffmpeg") is not None
+
+
+def download_budget() -> int:
+    """أقصى حجم يُسمح بتحميله (حد الرفع نفسه ما لم تتوفر مرحلة ضغط)."""
+    if compression_available():
+        return int(upload_limit() * config.COMPRESS_MAX_RATIO)
+    return upload_limit()
+
+
+def _size(fmt: dict) -> int | None:
+    return fmt.get("filesize") or fmt.get("filesize_approx")
+
+
+def _select_format(limit: int, budget: int, ctx: dict):
+    """دالة اختيار صيغة لـ yt-dlp (format=callable): أفضل صيغة مدمجة (صوت+صورة) تحت الحد.
+    الصيغ مرتبة من الأسوأ للأفضل؛ تُفضّل mp4، ثم الصيغ غير معروفة الحجم، ثم أصغر صيغة
+    ضمن ميزانية الضغط (تُضغط بعد التحميل)."""
+    formats = ctx.get("formats") or []
+    progressive = [
+        f for f in formats
+        if f.get("vcodec") != "none" and f.get("acodec") != "none"
+    ] or formats
+    if not progressive:
+        return
+
+    fitting = [f for f in progressive if _size(f) is not None and _size(f) <= limit]
+    unknown = [f for f in progressive if _size(f) is None]
+    for pool in (fitting, unknown):
+        if pool:
+            mp4 = [f for f in pool if f.get("ext") == "mp4"]
+            yield (mp4 or pool)[-1]
+            return
+
+    smallest = min(progressive, key=_size)
+    if _size(smallest) <= budget:
+        yield smallest
+        return
+    raise MediaTooLarge(_size(smallest), limit)
+
+
+def ytdlp_format(limit: int | None = None):
+    """قيمة خيار "format" لـ yt-dlp. functools.partial قابل للـ pickle (لمجمع العمليات)."""
+    limit = limit or upload_limit()
+    return functools.partial(_select_format, limit, max(limit, download_budget()))
+
+
+def check_content_length(headers, limit: int | None = None) -> int | None:
+    """فحص Content-Length قبل التدفق؛ يرفع MediaTooLarge إن تجاوز الحد."""
+    limit = limit or download_budget()
+    try:
+        length = int(headers.get("content-length") or 0) or None
+    except (TypeError, ValueError):
+        length = None
+    if length and length > limit:
+        raise MediaTooLarge(length, limit)
+    return length
+
+
+def check_files(paths: str | list[str], limit: int | None = None) -> None:
+    """التأكد بعد التحميل أن كل ملف ضمن حد الرفع (احتياط للصيغ غير معروفة الحجم)."""
+    limit = limit or upload_limit()
+    for path in paths if isinstance(paths, list) else [paths]:
+        if path and os.path.exists(path):
+            size = os.path.getsize(path)
+            if size > limit:
+                raise MediaTooLarge(size, limit)
@@ -2,16 +2,19 @@
 downloaders/tiktok.py - وحدة تحميل TikTok
 تستخدم ملف الكوكيز في data/cookies/tiktok_cookies.txt (إذا وُجد)
 وتدعم تحميل الصور (Slideshow) في حال فشل yt-dlp.
+الحلول البديلة (TikWM وصفحة TikTok) غير متزامنة عبر downloaders.async_http،
+وتُشغّل بالتحوّط (downloaders.hedge) إذا تأخر yt-dlp عن زمنه المعتاد.
 """
 import os
 import re
 import json
 import uuid
+import asyncio
 import logging
-import requests
 
 import config
 from .base import BaseDownloader
+from . import async_http, hedge, http_pool, scoreboard, sizing, urls
 
 logger = logging.getLogger(__name__)
 
@@ -19,8 +22,14 @@ logger = logging.getLogger(__name__)
 class TikTokDownloader(BaseDownloader):
     """وحدة تحميل مقاطع وصور TikTok."""
 
-    def download_video(self, url: str) -> dict:
+    platform = "TikTok"
+
+    def _download_ytdlp(self, url: str, on_metadata=None) -> dict:
+        """المحاولة عبر yt-dlp (متزامنة - تعمل في مجمع الخيوط).
+        on_metadata يُستدعى عند بدء التحميل الفعلي (أي بعد استخراج البيانات الوصفية)."""
         opts = {}
+        if on_metadata:
+            opts["progress_hooks"] = [lambda d: on_metadata()]
 
         if os.path.exists(config.TIKTOK_COOKIES):
             logger.info("✅ تم العثور على ملف كوكيز TikTok")
@@ -28,62 +37,108 @@ class TikTokDownloader(BaseDownloader):
         else:
             logger.info("ℹ️ ملف كوكيز TikTok غير موجود - سيتم المحاولة بدونه")
 
-        try:
-            # المحاولة الأولى باستخدام yt-dlp
-            res = self._download(url, extra_opts=opts)
-            if res and os.path.exists(res.get("results", "")) and not res.get("results", "").lower().endswith(".na"):
-                return res
-            raise ValueError("yt-dlp returned no valid results")
-        except Exception as exc:
-            logger.warning("⚠️ فشل yt-dlp في تحميل الرابط، محاولة الحل البديل عبر TikWM: %s", exc)
-            
-            # المحاولة الثانية عبر TikWM API
-            tikwm_res = self._fallback_tikwm_download(url)
-            if tikwm_res:
-                return tikwm_res
-                
-            logger.warning("⚠️ فشل الحل البديل لـ TikWM، محاولة الحل البديل للصور من الصفحة")
-            return self._fallback_photo_download(url)
+        res = self._download(url, extra_opts=opts)
+        if res and os.path.exists(res.get("results", "")) and not res.get("results", "").lower().endswith(".na"):
+            return res
+        raise ValueError("yt-dlp returned no valid results")
+
+    async def _strategy_ytdlp(self, url: str, executor, ready: asyncio.Event) -> dict:
+        loop = asyncio.get_running_loop()
 
-    def _download_url_to_file(self, url: str, ext: str = ".mp4") -> str:
+        def _on_metadata():
+            if not ready.is_set():
+                loop.call_soon_threadsafe(ready.set)
+
+        return await hedge.run_in_thread(
+            executor, self._download_ytdlp, url, _on_metadata,
+            on_orphan=self._cleanup_result,
+        )
+
+    def _is_valid_result(self, res: dict) -> bool:
+        results = res.get("results")
+        if isinstance(results, list):
+            return len(results) > 0
+        return bool(results) and os.path.exists(results)
+
+    def _cleanup_result(self, res: dict) -> None:
+        if res:
+            self.cleanup(res.get("results"))
+
+    async def download_video_async(self, url: str, executor=None) -> dict:
+        # الترتيب الافتراضي: yt-dlp ثم TikWM ثم صفحة TikTok، ويُعاد ترتيبها حسب
+        # لوحة النتائج الحية. التالية تبدأ فور فشل السابقة أو بالتوازي إذا لم
+        # تُنتج السابقة بياناتها الوصفية خلال مهلة التحوّط
+        available = {
+            "yt-dlp": lambda ready: self._strategy_ytdlp(url, executor, ready),
+            "tikwm":  lambda ready: self._fallback_tikwm_download(url, ready),
+            "page":   lambda ready: self._fallback_photo_download(url, ready),
+        }
+        strategies = [(name, available[name]) for name in scoreboard.order(self.platform, list(available))]
+        return await hedge.hedged(
+            strategies,
+            platform=self.platform,
+            is_valid=self._is_valid_result,
+            cleanup=self._cleanup_result,
+            fatal=(sizing.MediaTooLarge,),
+        )
+
+    def download_video(self, url: str) -> dict:
+        """واجهة متزامنة للتوافق (تُشغّل المسار غير المتزامن في loop مستقل)."""
+        return http_pool.run_sync(self.download_video_async(url))
+
+    async def _download_url_to_file(self, url: str, ext: str = ".mp4", max_bytes: int | None = None) -> str:
         filename = f"{uuid.uuid4()}{ext}"
         path = os.path.join(self.download_path, filename)
         headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "User-Agent": async_http.USER_AGENT,
             "Referer": "https://www.tiktok.com/",
         }
-        response = requests.get(url, headers=headers, stream=True, timeout=20)
-        response.raise_for_status()
-        with open(path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        await async_http.stream_to_file(url, path, headers=headers, timeout=20, max_bytes=max_bytes)
         return path
 
-    def _resolve_redirect(self, url: str) -> str:
-        if not re.search(r"https?://(vt|vm)\.tiktok\.com/", url, re.IGNORECASE):
-            return url
+    async def _download_images(self, image_urls: list[str], fetch) -> list[str]:
+        """تحميل صور الألبوم بالتوازي (بحد أقصى لكل منشور) مع الحفاظ على الترتيب.
+        الصور الفاشلة تُتجاهل (نجاح جزئي) والزمن الكلي ≈ زمن أبطأ صورة."""
+        semaphore = asyncio.Semaphore(config.SLIDESHOW_CONCURRENCY)
+
+        async def _fetch_one(img_url: str) -> str | None:
+            async with semaphore:
+                try:
+                    return await fetch(img_url)
+                except Exception as e:
+                    logger.warning("⚠️ فشل تحميل صورة واحدة: %s", e)
+                    return None
+
+        tasks = [asyncio.ensure_future(_fetch_one(u)) for u in image_urls]
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            }
-            response = requests.head(url, headers=headers, allow_redirects=True, timeout=10)
-            return response.url
-        except Exception as e:
-            logger.warning("⚠️ فشل في تتبع تحويل الرابط: %s", e)
-            return url
+            paths = await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # حذف ما اكتمل تحميله إذا أُلغي الطلب
+            for t in tasks:
+                t.cancel()
+                if t.done() and not t.cancelled() and t.result():
+                    self.cleanup(t.result())
+            raise
+        return [p for p in paths if p]
+
+    async def _resolve_redirect(self, url: str) -> str:
+        # الروابط المختصرة (vt/vm) تُحل مرة واحدة وتُخزن في ذاكرة urls
+        return await urls.resolve_short_link_async(url)
 
-    def _fallback_tikwm_download(self, url: str) -> dict | None:
-        resolved_url = self._resolve_redirect(url)
+    async def _fallback_tikwm_download(self, url: str, ready: asyncio.Event | None = None) -> dict | None:
+        resolved_url = await self._resolve_redirect(url)
         # إزالة معاملات الاستعلام من الرابط المحوّل لتفادي خطأ التحليل في TikWM
         if "?" in resolved_url:
             resolved_url = resolved_url.split("?")[0]
             
         logger.info("🔄 محاولة التحميل عبر TikWM API للرابط: %s (الرابط المحوّل والمُنظّف: %s)", url, resolved_url)
         try:
-            res = requests.post("https://www.tikwm.com/api/", data={"url": resolved_url}, timeout=15)
+            res = await async_http.get_client().post("https://www.tikwm.com/api/", data={"url": resolved_url}, timeout=15)
             res.raise_for_status()
             data = res.json()
             if data.get("code") == 0:
+                if ready:
+                    ready.set()
                 video_data = data.get("data") or {}
                 title = video_data.get("title") or ""
                 
@@ -91,14 +146,10 @@ class TikTokDownloader(BaseDownloader):
                 images = video_data.get("images")
                 if images and isinstance(images, list) and len(images) > 0:
                     logger.info("📸 تم اكتشاف ألبوم صور (Slideshow) عبر TikWM")
-                    file_paths = []
-                    for img_url in images:
-                        if img_url:
-                            try:
-                                path = self._download_url_to_file(img_url, ext=".jpg")
-                                file_paths.append(path)
-                            except Exception as e:
-                                logger.warning("⚠️ فشل تحميل صورة من TikWM: %s", e)
+                    file_paths = await self._download_images(
+                        [u for u in images if u],
+                        lambda u: self._download_url_to_file(u, ext=".jpg"),
+                    )
                     if file_paths:
                         return {
                             "results": file_paths,
@@ -109,18 +160,23 @@ class TikTokDownloader(BaseDownloader):
                 play_url = video_data.get("play")
                 if play_url:
                     logger.info("📹 تم العثور على رابط فيديو عبر TikWM: %s", play_url)
-                    path = self._download_url_to_file(play_url, ext=".mp4")
+                    budget = sizing.download_budget()
+                    if (video_data.get("size") or 0) > budget:
+                        raise sizing.MediaTooLarge(video_data["size"], budget)
+                    path = await self._download_url_to_file(play_url, ext=".mp4", max_bytes=budget)
                     return {
                         "results": path,
                         "description": title
                     }
             else:
                 logger.warning("⚠️ TikWM API returned error: %s", data.get("msg"))
+        except sizing.MediaTooLarge:
+            raise
         except Exception as e:
             logger.error("❌ فشل التحميل عبر TikWM API: %s", e)
         return None
 
-    def _fallback_photo_download(self, url: str) -> dict:
+    async def _fallback_photo_download(self, url: str, ready: asyncio.Event | None = None) -> dict:
         """حل بديل لتحميل صور تيك توك (Slideshow) عند فشل yt-dlp."""
         headers = {
             "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1",
@@ -129,7 +185,7 @@ class TikTokDownloader(BaseDownloader):
         }
         
         try:
-            response = requests.get(url, headers=headers, timeout=15)
+            response = await async_http.get_client().get(url, headers=headers, timeout=15)
             response.raise_for_status()
             
             # البحث عن بيانات الصفحة (Rehydration Data هو الأساس)
@@ -153,6 +209,8 @@ class TikTokDownloader(BaseDownloader):
                 raise ValueError("لم يتم العثور على بيانات الميتا (JSON) في صفحة TikTok.")
             
             data = payload
+            if ready:
+                ready.set()
             
             # استخراج الـ imagePost
             image_post = self._find_key_recursive(data, "imagePost")
@@ -173,7 +231,7 @@ class TikTokDownloader(BaseDownloader):
                 
             logger.info("📸 تم العثور على %d صورة في Slideshow", len(images))
             
-            file_paths = []
+            image_urls = []
             for img in images:
                 if not isinstance(img, dict): continue
                 
@@ -186,11 +244,9 @@ class TikTokDownloader(BaseDownloader):
                     img_url = img.get("displayLink") or img.get("downloadAddr")
                 
                 if img_url:
-                    try:
-                        path = self._download_file(img_url)
-                        file_paths.append(path)
-                    except Exception as e:
-                        logger.warning("⚠️ فشل تحميل صورة واحدة: %s", e)
+                    image_urls.append(img_url)
+
+            file_paths = await self._download_images(image_urls, self._download_file)
             
             # استخراج الوصف
             desc = self._extract_description_enhanced(data)
@@ -231,7 +287,7 @@ class TikTokDownloader(BaseDownloader):
         """جلب أحدث مقاطع فيديو مستخدم تيك توك عبر TikWM API."""
         # المحاولة الأولى: TikWM API
         try:
-            r = requests.post(
+            r = http_pool.get_session().post(
                 "https://www.tikwm.com/api/user/posts",
                 data={"unique_id": username, "count": limit, "cursor": 0, "web": 1},
                 timeout=15,
@@ -300,7 +356,7 @@ class TikTokDownloader(BaseDownloader):
             "قد يكون الحساب خاصاً أو غير موجود، يرجى المحاولة لاحقاً."
         )
 
-    def _download_file(self, url: str) -> str:
+    async def _download_file(self, url: str) -> str:
         """تحميل ملف وحفظه في مجلد التحميلات مع استخدام رؤوس طلبات صحيحة."""
         filename = f"{uuid.uuid4()}.jpg"
         path = os.path.join(self.download_path, filename)
@@ -310,10 +366,5 @@ class TikTokDownloader(BaseDownloader):
             "Referer": "https://www.tiktok.com/",
         }
         
-        response = requests.get(url, headers=headers, stream=True, timeout=10)
-        response.raise_for_status()
-        
-        with open(path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        await async_http.stream_to_file(url, path, headers=headers, timeout=10)
         return path
@@ -0,0 +1,170 @@
+"""
+downloaders/urls.py - توحيد روابط المنصات إلى مفتاح ثابت (platform, media_id)
+────────────────────────────────────────
+  - يدعم instagram.com/p|reel|reels|tv و fb.watch و m.facebook و vt/vm.tiktok
+  - الروابط المختصرة تُحل مرة واحدة وتُخزن في ذاكرة محدودة مع TTL
+  - المفتاح الناتج تستخدمه ذاكرة file_id ومنع التكرار (Single-flight)
+"""
+import logging
+import re
+from typing import NamedTuple
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit
+
+from utils.cache import TTLCache
+from . import async_http, http_pool
+
+logger = logging.getLogger(__name__)
+
+_USER_AGENT = async_http.USER_AGENT
+
+# ─── ذاكرة الروابط المختصرة المحلولة ─────────────────────────────────────────
+_redirect_cache = TTLCache(maxsize=4096, ttl=6 * 3600)
+
+
+class MediaKey(NamedTuple):
+    platform: str
+    media_id: str
+
+    def __str__(self) -> str:
+        return f"{self.platform.lower()}:{self.media_id}"
+
+
+# ─── أنماط الروابط ───────────────────────────────────────────────────────────
+_SHORT_LINK_RE = re.compile(
+    r"^https?://(?:(?:vt|vm)\.tiktok\.com/|(?:www\.)?tiktok\.com/t/|(?:www\.)?fb\.watch/"
+    r"|(?:www\.|m\.|web\.)?facebook\.com/share/)",
+    re.IGNORECASE,
+)
+
+_INSTAGRAM_RE = re.compile(r"instagram\.com/(?:[^/]+/)?(p|reels?|tv)/([A-Za-z0-9_-]+)", re.IGNORECASE)
+_INSTAGRAM_STORY_RE = re.compile(r"instagram\.com/stories/[^/]+/(\d+)", re.IGNORECASE)
+
+_TIKTOK_RE = re.compile(r"tiktok\.com/@[^/]+/(?:video|photo)/(\d+)", re.IGNORECASE)
+_TIKTOK_MOBILE_RE = re.compile(r"m\.tiktok\.com/v/(\d+)", re.IGNORECASE)
+
+_FACEBOOK_PATH_RE = re.compile(
+    r"facebook\.com/(?:reel/(\d+)|[^/]+/videos/(?:[^/]+/)?(\d+)|watch/live/\?v=(\d+)|stories/[^/]+/([A-Za-z0-9=_-]+))",
+    re.IGNORECASE,
+)
+
+
+def detect_platform(url: str) -> str:
+    """تحديد المنصة من اسم النطاق فقط (بدون اتصال)."""
+    host = urlsplit(url.strip()).netloc.lower()
+    if host.endswith("instagram.com"):
+        return "Instagram"
+    if host.endswith("facebook.com") or host.endswith("fb.watch") or host.endswith("fb.com"):
+        return "Facebook"
+    if host.endswith("tiktok.com"):
+        return "TikTok"
+    return "Generic"
+
+
+def is_short_link(url: str) -> bool:
+    return bool(_SHORT_LINK_RE.match(url.strip()))
+
+
+# معاملات تتبع لا تغيّر المحتوى؛ بقية الاستعلام قد تحمل معرف المنشور (watch?v=...)
+_TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "igsh", "si", "feature", "ref", "ref_src",
+                    "_r", "_t", "is_from_webapp", "sender_device", "mibextid"}
+
+
+def normalize_url(url: str) -> str:
+    """توحيد شكلي: إزالة البروتوكول و www/m ومعاملات التتبع والشرطة الأخيرة.
+    بقية الاستعلام تبقى (مرتبة) حتى لا يتشارك منشوران مختلفان نفس المفتاح."""
+    parts = urlsplit(url.strip())
+    host  = parts.netloc.lower()
+    for prefix in ("www.", "m.", "web.", "mbasic."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith("utm_")
+    )
+    key = f"{host}{parts.path.rstrip('/')}"
+    return f"{key}?{urlencode(query)}" if query else key
+
+
+def resolve_short_link(url: str) -> str:
+    """تتبع تحويل الرابط المختصر مع تخزين النتيجة (طلب شبكة واحد لكل رابط)."""
+    if not is_short_link(url):
+        return url
+    cached = _redirect_cache.get(url)
+    if cached:
+        return cached
+    try:
+        response = http_pool.get_session().head(url, headers={"User-Agent": _USER_AGENT}, allow_redirects=True, timeout=10)
+        resolved = response.url or url
+    except Exception as e:
+        logger.warning("⚠️ فشل في تتبع تحويل الرابط: %s", e)
+        return url
+    if resolved != url:
+        _redirect_cache.set(url, resolved)
+    return resolved
+
+
+async def resolve_short_link_async(url: str) -> str:
+    """نفس resolve_short_link لكن عبر العميل غير المتزامن (لا يحجز خيطاً)."""
+    if not is_short_link(url):
+        return url
+    cached = _redirect_cache.get(url)
+    if cached:
+        return cached
+    try:
+        response = await async_http.get_client().head(url, timeout=10)
+        resolved = str(response.url) or url
+    except Exception as e:
+        logger.warning("⚠️ فشل في تتبع تحويل الرابط: %s", e)
+        return url
+    if resolved != url:
+        _redirect_cache.set(url, resolved)
+    return resolved
+
+
+def extract_media_id(url: str, platform: str | None = None) -> str | None:
+    """استخراج معرف المنشور من رابط كامل (غير مختصر)، أو None إن لم يُعرف شكله."""
+    platform = platform or detect_platform(url)
+    if platform == "Instagram":
+        m = _INSTAGRAM_RE.search(url)
+        if m:
+            return m.group(2)
+        m = _INSTAGRAM_STORY_RE.search(url)
+        if m:
+            return f"story:{m.group(1)}"
+    elif platform == "TikTok":
+        m = _TIKTOK_RE.search(url) or _TIKTOK_MOBILE_RE.search(url)
+        if m:
+            return m.group(1)
+    elif platform == "Facebook":
+        m = _FACEBOOK_PATH_RE.search(url)
+        if m:
+            return next(g for g in m.groups() if g)
+        query = parse_qs(urlsplit(url).query)
+        for param in ("v", "story_fbid", "fbid"):
+            if query.get(param):
+                return query[param][0]
+    return None
+
+
+def canonicalize(url: str, resolve: bool = True) -> MediaKey:
+    """تحويل أي شكل مدعوم من الروابط إلى مفتاح ثابت (platform, media_id)."""
+    url = url.strip()
+    if resolve and is_short_link(url):
+        url = resolve_short_link(url)
+    platform = detect_platform(url)
+    media_id = extract_media_id(url, platform)
+    return MediaKey(platform, media_id or normalize_url(url))
+
+
+async def canonicalize_async(url: str, resolve: bool = True) -> MediaKey:
+    """مثل canonicalize لكن يحل الروابط المختصرة بدون حجز خيط."""
+    url = url.strip()
+    if resolve and is_short_link(url):
+        url = await resolve_short_link_async(url)
+    platform = detect_platform(url)
+    media_id = extract_media_id(url, platform)
+    return MediaKey(platform, media_id or normalize_url(url))
+
+
+def redirect_cache_stats() -> dict:
+    return _redirect_cache.stats()
@@ -0,0 +1,168 @@
+"""
+downloaders/ytdlp_pool.py - تشغيل yt-dlp في مجمع عمليات منفصل (اختياري)
+────────────────────────────────────────
+  - استخراج yt-dlp ثقيل على المعالج ومقيد بالـ GIL (Regex و JSON ومطابقة المستخرجات)
+  - في هذا الوضع يعمل في عمليات منفصلة حتى لا يبطئ الـ event loop وخيوط Flask
+  - العمليات تُسخّن مسبقاً (استيراد yt_dlp مرة واحدة)، وتُستبدل بعد عدد مهام محدد
+    (max_tasks_per_child) أو عند تجاوز حد الذاكرة (RSS) لاحتواء التسريبات
+  - كل عامل في منفذ مستقل (عملية واحدة)، فتجاوز RSS أو انهيار عامل يستبدله وحده
+    وتبقى بقية العمليات المسخّنة تعمل
+  - لا يعود عبر IPC إلا مسار الملف والبيانات الوصفية
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import yt_dlp
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# مفاتيح البيانات الوصفية المسموح بإرجاعها (بدل كائن info الكامل)
+_META_KEYS = ("id", "title", "duration", "width", "height", "ext", "filesize", "filesize_approx", "extractor")
+
+
+def extract_and_download(url: str, opts: dict) -> dict:
+    """استخراج وتحميل عبر yt-dlp وإرجاع المسار والوصف والبيانات الوصفية فقط."""
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+        file_path = ydl.prepare_filename(info)
+    return {
+        "results":     file_path,
+        "description": info.get("description") or info.get("title") or "",
+        "meta":        {k: info.get(k) for k in _META_KEYS if info.get(k) is not None},
+    }
+
+
+# ─── داخل العملية العاملة ────────────────────────────────────────────────────
+def _worker_init() -> None:
+    # yt_dlp مستورد أعلاه؛ نحمّل المستخرجات مسبقاً حتى لا تدفع أول مهمة ثمنها
+    try:
+        yt_dlp.extractor.gen_extractor_classes()
+    except Exception:
+        pass
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+def _worker_run(url: str, opts: dict) -> dict:
+    result = extract_and_download(url, opts)
+    try:
+        import psutil
+        rss_mb = psutil.Process().memory_info().rss / (1024 * 1024)
+    except Exception:
+        rss_mb = 0
+    result["rss_exceeded"] = rss_mb > config.YTDLP_WORKER_RSS_MB
+    return result
+
+
+# ─── إدارة المجمع ────────────────────────────────────────────────────────────
+class _Slot:
+    """عامل واحد: منفذ بعملية واحدة وعدد المهام المسندة إليه حالياً."""
+
+    def __init__(self):
+        self.executor = _new_executor()
+        self.inflight = 0
+
+
+_slots: list[_Slot] = []
+_pool_lock = threading.Lock()
+_stats = {"tasks": 0, "recycles": 0, "broken": 0}
+
+
+def enabled() -> bool:
+    return config.YTDLP_PROCESS_POOL
+
+
+def _new_executor() -> ProcessPoolExecutor:
+    executor = ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_worker_init,
+        max_tasks_per_child=config.YTDLP_MAX_TASKS_PER_WORKER,
+    )
+    # تسخين العملية مسبقاً
+    executor.submit(_worker_ping)
+    return executor
+
+
+def _ensure_slots() -> None:
+    """إنشاء العمّال عند أول استخدام (يجب استدعاؤها داخل القفل)."""
+    if not _slots:
+        _slots.extend(_Slot() for _ in range(config.YTDLP_PROCESS_WORKERS))
+        logger.info("🧵 yt-dlp process pool started (%d workers)", len(_slots))
+
+
+def _acquire() -> _Slot:
+    """العامل الأقل انشغالاً."""
+    with _pool_lock:
+        _ensure_slots()
+        slot = min(_slots, key=lambda s: s.inflight)
+        slot.inflight += 1
+        return slot
+
+
+def _retire(slot: _Slot, old: ProcessPoolExecutor, reason: str) -> None:
+    """استبدال عملية عامل واحد؛ ما أُسند إليها من مهام يكتمل ثم تُغلق."""
+    with _pool_lock:
+        if slot.executor is not old:
+            return
+        slot.executor = _new_executor()
+        _stats["recycles"] += 1
+    logger.warning("♻️ Recycling yt-dlp worker: %s", reason)
+    old.shutdown(wait=False)
+
+
+def start() -> None:
+    """تشغيل المجمع وتسخينه عند الإقلاع (إن كان مفعلاً)."""
+    if enabled():
+        with _pool_lock:
+            _ensure_slots()
+
+
+def _picklable(value) -> bool:
+    try:
+        pickle.dumps(value)
+        return True
+    except Exception:
+        return False
+
+
+def run(url: str, opts: dict) -> dict:
+    """تنفيذ مهمة yt-dlp في المجمع (دالة متزامنة تُستدعى من خيط الـ Executor)."""
+    # الدوال المحلية (progress_hooks وغيرها) لا تعبر حدود العمليات؛ functools.partial لدوال
+    # على مستوى الوحدة (مثل اختيار الصيغة في downloaders.sizing) تعبر
+    opts = {k: v for k, v in opts.items() if k != "progress_hooks" and _picklable(v)}
+    slot     = _acquire()
+    executor = slot.executor
+    try:
+        result = executor.submit(_worker_run, url, opts).result()
+    except BrokenProcessPool as exc:
+        _stats["broken"] += 1
+        _retire(slot, executor, f"worker died ({exc})")
+        raise
+    finally:
+        with _pool_lock:
+            slot.inflight -= 1
+    _stats["tasks"] += 1
+    if result.pop("rss_exceeded", False):
+        _retire(slot, executor, f"worker RSS > {config.YTDLP_WORKER_RSS_MB} MB")
+    return result
+
+
+def stats() -> dict:
+    return {**_stats, "enabled": enabled(), "workers": config.YTDLP_PROCESS_WORKERS}
+
+
+@atexit.register
+def _shutdown() -> None:
+    for slot in _slots:
+        slot.executor.shutdown(wait=False, cancel_futures=True)
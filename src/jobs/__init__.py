@@ -0,0 +1,17 @@
+"""
+jobs - طابور المهام الدائم وعمّاله
+"""
+from .queue import Defer, Job, JobBackend, PendingLimit, SQLiteBackend, enqueue, get_backend, register_backend
+from . import worker
+
+__all__ = [
+    "Defer",
+    "Job",
+    "JobBackend",
+    "PendingLimit",
+    "SQLiteBackend",
+    "enqueue",
+    "get_backend",
+    "register_backend",
+    "worker",
+]
@@ -0,0 +1,89 @@
+"""
+jobs/bench.py - قياس إنتاجية طابور المهام وزمن الاستجابة
+────────────────────────────────────────
+  - enqueue: عدد المهام المضافة في الثانية
+  - end-to-end: عمّال حقيقيون (jobs.worker) بمعالج شبه فارغ على قاعدة مؤقتة؛
+    الإنتاجية وزمن الانتظار في الطابور (p50 / p95 / p99)
+  - التشغيل: cd src && python -m jobs.bench --jobs 2000 --workers 8 --work-ms 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import config
+from . import worker
+from .queue import Job, SQLiteBackend
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+
+async def _bench(jobs: int, workers: int, work_ms: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, "bench.db"))
+
+        # 1) الإضافة فقط
+        started = time.perf_counter()
+        for i in range(jobs):
+            backend.enqueue("bench", {"i": i})
+        enqueue_secs = time.perf_counter() - started
+        print(f"enqueue      : {jobs} jobs in {enqueue_secs:.2f}s  ({jobs / enqueue_secs:,.0f} jobs/s)")
+
+        # 2) التنفيذ عبر العمّال
+        latencies: list[float] = []
+        finished = asyncio.Event()
+
+        async def _handle(bot, job: Job) -> None:
+            latencies.append(time.time() - job.created_at)
+            if work_ms:
+                await asyncio.sleep(work_ms / 1000)
+            if len(latencies) >= jobs:
+                finished.set()
+
+        worker.register("bench", _handle)
+        started = time.perf_counter()
+        worker.start(None, workers, backend=backend)
+        await finished.wait()
+        drain_secs = time.perf_counter() - started
+        await worker.stop()
+
+        print(f"drain        : {jobs} jobs in {drain_secs:.2f}s  ({jobs / drain_secs:,.0f} jobs/s) "
+              f"with {workers} workers, {work_ms}ms work each")
+        print(f"queue wait   : p50={_percentile(latencies, 0.5) * 1000:.1f}ms  "
+              f"p95={_percentile(latencies, 0.95) * 1000:.1f}ms  "
+              f"p99={_percentile(latencies, 0.99) * 1000:.1f}ms")
+
+        # 3) زمن الاستجابة لمهمة واحدة في طابور فارغ (مع الإيقاظ الفوري)
+        single: list[float] = []
+
+        async def _single(bot, job: Job) -> None:
+            single.append(time.time() - job.created_at)
+
+        worker.register("bench", _single)
+        worker.start(None, workers, backend=backend)
+        for i in range(50):
+            backend.enqueue("bench", {"i": i})
+            worker.notify()
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(0.2)
+        await worker.stop()
+        print(f"idle pickup  : p50={_percentile(single, 0.5) * 1000:.1f}ms  "
+              f"p95={_percentile(single, 0.95) * 1000:.1f}ms  (n={len(single)})")
+        print(f"final state  : {backend.stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Job queue throughput / latency benchmark")
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=config.JOB_WORKERS or 8)
+    parser.add_argument("--work-ms", type=float, default=5)
+    args = parser.parse_args()
+    asyncio.run(_bench(args.jobs, args.workers, args.work_ms))
+
+
+if __name__ == "__main__":
+    main()
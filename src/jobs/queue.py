@@ -0,0 +1,270 @@
+"""
+jobs/queue.py - طابور مهام دائم بواجهة خلفية قابلة للاستبدال
+────────────────────────────────────────
+  - المهمة تُسجَّل قبل الرد على الـ Webhook، فلا تضيع مع إعادة تشغيل البوت أو النسخة
+  - الاستلام بعقد مؤقت (Visibility timeout): المهمة التي مات عاملها تعود للطابور تلقائياً
+  - إعادة المحاولة بتأخير متزايد حتى حد أقصى، ثم تُعلَّم كمهمة ميتة
+  - JobBackend هو الواجهة؛ SQLiteBackend هو التنفيذ المحلي (WAL) ويمكن إضافة غيره
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import config
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, DEAD = "queued", "running", "done", "dead"
+
+
+class PendingLimit(Exception):
+    """للمالك (المستخدم) عدد كافٍ من المهام المعلقة في الطابور بالفعل."""
+
+
+class Defer(Exception):
+    """يرفعها معالج المهمة عند ضغط مؤقت (الطابور الداخلي ممتلئ): تُعاد المهمة للطابور بعد
+    delay ثانية دون احتساب المحاولة."""
+
+    def __init__(self, delay: float):
+        super().__init__(f"Deferred for {delay}s")
+        self.delay = delay
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+    created_at: float
+
+
+class JobBackend(ABC):
+    """واجهة التخزين الخلفي للطابور؛ التنفيذ الناقص يفشل عند إنشائه."""
+
+    @abstractmethod
+    def enqueue(self, kind: str, payload: dict, priority: int = 1, max_attempts: int | None = None,
+                owner: str | None = None, max_pending: int | None = None) -> int:
+        """إضافة مهمة. owner / max_pending: ترفع PendingLimit إذا كان للمالك هذا العدد من المهام
+        المعلقة (في الانتظار أو قيد التنفيذ)، حتى لا يحتكر مستخدم واحد الطابور."""
+
+    @abstractmethod
+    def claim(self, worker_id: str, visibility_timeout: float) -> Job | None:
+        """استلام أقدم مهمة جاهزة (بالأولوية) وحجزها حتى انتهاء مهلة الظهور."""
+
+    @abstractmethod
+    def extend(self, job_id: int, visibility_timeout: float) -> None:
+        """تمديد العقد لمهمة لا تزال قيد التنفيذ (Heartbeat)."""
+
+    @abstractmethod
+    def complete(self, job_id: int) -> None:
+        """تعليم المهمة كمنتهية بنجاح."""
+
+    @abstractmethod
+    def fail(self, job_id: int, error: str, retry_delay: float) -> bool:
+        """تسجيل فشل؛ تُعاد للطابور إن بقيت محاولات. يعيد True إذا ستُعاد المحاولة."""
+
+    @abstractmethod
+    def release(self, job_id: int, delay: float = 0) -> None:
+        """إعادة مهمة للطابور (بعد delay ثانية) دون احتساب المحاولة (عند إيقاف العامل أو Defer)."""
+
+    @abstractmethod
+    def purge(self, older_than: float) -> int:
+        """حذف المهام المنتهية والميتة الأقدم من older_than ثانية وإرجاع عددها."""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """عدد المهام حسب الحالة وعمر أقدم مهمة في الانتظار."""
+
+
+class SQLiteBackend(JobBackend):
+    """تنفيذ محلي على SQLite (وضع WAL)؛ آمن بين الخيوط وبين العمليات على نفس الجهاز."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " priority INTEGER NOT NULL DEFAULT 1,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " max_attempts INTEGER NOT NULL,"
+            " available_at REAL NOT NULL,"
+            " lease_until REAL,"
+            " worker TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " owner TEXT)"
+        )
+        # قواعد أُنشئت قبل إضافة عمود المالك
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, priority, available_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs(status, lease_until)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs(owner, status)")
+
+    def enqueue(self, kind: str, payload: dict, priority: int = 1, max_attempts: int | None = None,
+                owner: str | None = None, max_pending: int | None = None) -> int:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE: العد والإضافة ذرّيان بين العمليات
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if owner is not None and max_pending:
+                    pending = self._conn.execute(
+                        "SELECT COUNT(*) FROM jobs WHERE owner = ? AND status IN (?, ?)",
+                        (owner, QUEUED, RUNNING),
+                    ).fetchone()[0]
+                    if pending >= max_pending:
+                        raise PendingLimit(f"{owner} already has {pending} pending jobs")
+                cur = self._conn.execute(
+                    "INSERT INTO jobs (kind, payload, priority, status, max_attempts, available_at,"
+                    " created_at, owner) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, json.dumps(payload), priority, QUEUED,
+                     max_attempts or config.JOB_MAX_ATTEMPTS, now, now, owner),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cur.lastrowid
+
+    def claim(self, worker_id: str, visibility_timeout: float) -> Job | None:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE يحجز الكتابة حتى لا تستلم عمليتان نفس المهمة
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # عقد منتهٍ بلا محاولات متبقية = العامل مات أثناءها كل مرة (انهيار / OOM): لا تُعاد
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, lease_until = NULL, finished_at = ?,"
+                    " error = COALESCE(error, 'Lease expired on the last attempt')"
+                    " WHERE status = ? AND lease_until < ? AND attempts >= max_attempts",
+                    (DEAD, now, RUNNING, now),
+                )
+                row = self._conn.execute(
+                    "SELECT id, kind, payload, attempts, max_attempts, created_at FROM jobs"
+                    " WHERE (status = ? AND available_at <= ?)"
+                    " OR (status = ? AND lease_until < ? AND attempts < max_attempts)"
+                    " ORDER BY priority, id LIMIT 1",
+                    (QUEUED, now, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, worker = ?,"
+                    " started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (RUNNING, now + visibility_timeout, worker_id, now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return Job(id=row[0], kind=row[1], payload=json.loads(row[2]),
+                   attempts=row[3] + 1, max_attempts=row[4], created_at=row[5])
+
+    def extend(self, job_id: int, visibility_timeout: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?",
+                (time.time() + visibility_timeout, job_id, RUNNING),
+            )
+
+    def complete(self, job_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (DONE, time.time(), job_id),
+            )
+
+    def fail(self, job_id: int, error: str, retry_delay: float) -> bool:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            retry = row[0] < row[1]
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_until = NULL,"
+                " finished_at = ? WHERE id = ?",
+                (QUEUED if retry else DEAD, error[:1000], now + retry_delay,
+                 None if retry else now, job_id),
+            )
+            return retry
+
+    def release(self, job_id: int, delay: float = 0) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), lease_until = NULL,"
+                " available_at = ? WHERE id = ? AND status = ?",
+                (QUEUED, time.time() + delay, job_id, RUNNING),
+            )
+
+    def purge(self, older_than: float) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, DEAD, time.time() - older_than),
+            )
+            return cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall())
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+        return {
+            "queued":     counts.get(QUEUED, 0),
+            "running":    counts.get(RUNNING, 0),
+            "done":       counts.get(DONE, 0),
+            "dead":       counts.get(DEAD, 0),
+            "oldest_age": round(time.time() - oldest, 1) if oldest else 0.0,
+        }
+
+
+# ─── الواجهة الخلفية الافتراضية ─────────────────────────────────────────────
+_BACKENDS = {"sqlite": lambda: SQLiteBackend(config.JOB_QUEUE_PATH)}
+_backend: JobBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def register_backend(name: str, factory) -> None:
+    """تسجيل واجهة خلفية إضافية تُختار بـ JOB_QUEUE_BACKEND."""
+    _BACKENDS[name] = factory
+
+
+def get_backend() -> JobBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _BACKENDS[config.JOB_QUEUE_BACKEND]()
+            logger.info("📦 Job queue backend: %s", config.JOB_QUEUE_BACKEND)
+        return _backend
+
+
+def enqueue(kind: str, payload: dict, priority: int = 1,
+            owner: str | None = None, max_pending: int | None = None) -> int:
+    """إضافة مهمة للطابور الافتراضي وإرجاع رقمها (PendingLimit عند تجاوز حد المالك)."""
+    return get_backend().enqueue(kind, payload, priority, owner=owner, max_pending=max_pending)
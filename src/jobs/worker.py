@@ -0,0 +1,159 @@
+"""
+jobs/worker.py - عمّال تنفيذ مهام الطابور
+────────────────────────────────────────
+  - Coroutines تستلم المهام من الطابور وتنفذها حسب نوعها (register)
+  - Heartbeat يمدد العقد أثناء التنفيذ؛ إذا مات العامل تعود المهمة بعد انتهاء المهلة
+  - عند إيقاف العمّال (Hot reload) تُعاد المهام الجارية للطابور فوراً
+  - Defer من المعالج (ضغط مؤقت) يعيد المهمة بعد مهلة قصيرة دون احتساب المحاولة
+  - تعمل داخل عملية البوت (JOB_WORKERS) أو كعملية مستقلة: python src/worker.py
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+import config
+from .queue import Defer, Job, JobBackend, get_backend
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[object, Job], Awaitable[None]]
+
+_handlers: dict[str, JobHandler] = {}
+_tasks: list[asyncio.Task] = []
+_wakeup: asyncio.Event | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+_stats = {"processed": 0, "failed": 0, "retried": 0, "released": 0, "deferred": 0}
+_queue_latency: deque = deque(maxlen=500)   # من الإضافة حتى بدء التنفيذ
+_run_time: deque = deque(maxlen=500)        # زمن التنفيذ
+
+
+def register(kind: str, handler: JobHandler) -> None:
+    """ربط نوع مهمة بالدالة التي تنفذها: handler(bot, job)."""
+    _handlers[kind] = handler
+
+
+def notify() -> None:
+    """إيقاظ العمّال المحليين فور إضافة مهمة (بدل انتظار دورة الاستطلاع)."""
+    if _loop is not None and _wakeup is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+async def _heartbeat(backend: JobBackend, job_id: int) -> None:
+    interval = max(1.0, config.JOB_VISIBILITY_TIMEOUT / 3)
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(backend.extend, job_id, config.JOB_VISIBILITY_TIMEOUT)
+
+
+async def _run_one(bot, backend: JobBackend, job: Job) -> None:
+    handler = _handlers.get(job.kind)
+    started = time.time()
+    _queue_latency.append(started - job.created_at)
+    heartbeat = asyncio.create_task(_heartbeat(backend, job.id))
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        await handler(bot, job)
+    except asyncio.CancelledError:
+        await asyncio.shield(asyncio.to_thread(backend.release, job.id))
+        _stats["released"] += 1
+        raise
+    except Defer as e:
+        # ضغط مؤقت وليس فشلاً: لا تُحتسب المحاولة ولا تأخير متزايد
+        await asyncio.to_thread(backend.release, job.id, e.delay)
+        _stats["deferred"] += 1
+    except Exception as e:
+        _stats["failed"] += 1
+        delay = config.JOB_RETRY_DELAY * job.attempts
+        if await asyncio.to_thread(backend.fail, job.id, repr(e), delay):
+            _stats["retried"] += 1
+            logger.warning("🔁 Job %s (%s) failed, retrying in %ss: %s", job.id, job.kind, delay, e)
+        else:
+            logger.error("💀 Job %s (%s) failed permanently: %s", job.id, job.kind, e)
+    else:
+        await asyncio.to_thread(backend.complete, job.id)
+        _stats["processed"] += 1
+    finally:
+        heartbeat.cancel()
+        _run_time.append(time.time() - started)
+
+
+async def _worker_loop(bot, worker_id: str, backend: JobBackend) -> None:
+    while True:
+        try:
+            job = await asyncio.to_thread(backend.claim, worker_id, config.JOB_VISIBILITY_TIMEOUT)
+        except Exception as e:
+            logger.error("❌ Job claim failed: %s", e)
+            job = None
+        if job is None:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=config.JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await _run_one(bot, backend, job)
+
+
+async def _janitor(backend: JobBackend) -> None:
+    """حذف المهام المنتهية الأقدم من مدة الاحتفاظ."""
+    while True:
+        try:
+            removed = await asyncio.to_thread(backend.purge, config.JOB_RETENTION)
+            if removed:
+                logger.info("🧹 Purged %d finished jobs", removed)
+        except Exception as e:
+            logger.warning("⚠️ Job purge failed: %s", e)
+        await asyncio.sleep(3600)
+
+
+def start(bot, count: int | None = None, backend: JobBackend | None = None) -> None:
+    """تشغيل العمّال على الـ loop الحالي."""
+    global _wakeup, _loop
+    count = config.JOB_WORKERS if count is None else count
+    if count <= 0:
+        return
+    backend = backend or get_backend()
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    for i in range(count):
+        _tasks.append(asyncio.create_task(_worker_loop(bot, f"{prefix}:{i}", backend)))
+    _tasks.append(asyncio.create_task(_janitor(backend)))
+    logger.info("👷 Started %d job workers", count)
+
+
+async def stop() -> None:
+    """إيقاف العمّال؛ المهام الجارية تُعاد للطابور."""
+    tasks = list(_tasks)
+    _tasks.clear()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _p95(samples) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def stats() -> dict:
+    """حالة الطابور + مقاييس العمّال المحليين."""
+    try:
+        queue = get_backend().stats()
+    except Exception as e:
+        queue = {"error": str(e)}
+    return {
+        **_stats,
+        "workers":         max(len(_tasks) - 1, 0),
+        "queue":           queue,
+        "p95_queue_delay": round(_p95(_queue_latency), 3),
+        "p95_run_time":    round(_p95(_run_time), 3),
+    }
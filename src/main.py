@@ -11,6 +11,9 @@ import asyncio
 import threading
 import logging
 import os
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 print(f"🚀 [INIT] Starting application in {os.getcwd()}")
 print(f"🚀 [INIT] PORT environment: {os.environ.get('PORT', '8080 (default)')}")
@@ -18,8 +21,11 @@ print(f"🚀 [INIT] PORT environment: {os.environ.get('PORT', '8080 (default)')}
 import config
 from data import database
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, CallbackQueryHandler
+from bot import handlers as bot_handlers
 from bot.handlers import start, help_command, handle_message, status_command, handle_callback
 from web import server as web_server
+from downloaders import http_pool, proxy_pool, ytdlp_pool
+from jobs import worker as job_worker
 
 # ─── تهيئة السجلات ────────────────────────────────────────────────────────────
 try:
@@ -75,6 +81,9 @@ async def init_bot(app):
     await app.initialize()
     await app.start()
 
+    # عمّال طابور التحميل (المهام المعلقة من تشغيل سابق تُستأنف تلقائياً)
+    job_worker.start(app.bot)
+
     # إذا كنا في البيئة المحلية (وليس Cloud Run)، نستخدم Polling بدلاً من Webhook للاختبار
     if not os.environ.get("K_SERVICE"):
         try:
@@ -114,10 +123,29 @@ async def init_bot(app):
 # خزانة لمشاركة حالة إعادة التشغيل مع الخوادم الأخرى
 _restart_request = asyncio.Event()
 
+# فاحص البروكسيات في الخلفية (يُوقف ويُعاد تشغيله مع البوت كعمّال الطابور)
+_prober_task: asyncio.Task | None = None
+
+
+async def _stop_prober() -> None:
+    global _prober_task
+    task, _prober_task = _prober_task, None
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def _log_init_failure(task: asyncio.Task) -> None:
+    """init_bot تعمل كمهمة منفصلة؛ بدون هذا يضيع استثناؤها (فشل start أو set_webhook) بصمت."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("❌ Bot initialization failed: %s", task.exception(), exc_info=task.exception())
+
+
 async def bot_main_loop(initial_app):
     """الحلقة المستمرة للبوت التي تدعم إعادة التشغيل السريع."""
+    global _prober_task
     app = initial_app
-    
+
     while True:
         # إذا لم يكن هناك تطبيق (توكن مفقود مثلاً)، نحاول بناءه
         if app is None:
@@ -132,6 +160,8 @@ async def bot_main_loop(initial_app):
 
         # تهيئة وتشغيل البوت الحالي
         bot_task = asyncio.create_task(init_bot(app))
+        bot_task.add_done_callback(_log_init_failure)
+        _prober_task = asyncio.create_task(proxy_pool.run_prober())
         
         # الانتظار حتى يطلب السيرفر إعادة تشغيل (Hot Reload)
         await _restart_request.wait()
@@ -139,7 +169,12 @@ async def bot_main_loop(initial_app):
         
         logger.info("🔄 Hot Reload Triggered: Restarting Bot Application...")
         
-        # إيقاف البوت القديم بسلام
+        # إيقاف التهيئة إن لم تكتمل، ثم العمّال والفاحص (المهام الجارية تعود للطابور) ثم البوت القديم بسلام
+        if not bot_task.done():
+            bot_task.cancel()
+            await asyncio.gather(bot_task, return_exceptions=True)
+        await job_worker.stop()
+        await _stop_prober()
         if app:
             try:
                 await app.stop()
@@ -160,6 +195,15 @@ def run_bot_in_thread(initial_app):
     except Exception as exc:
         logger.error("❌ DB init failed: %s", exc)
 
+    http_pool.install_dns_cache()
+
+    # مجمع خيوط مخصص لـ yt-dlp (المسارات الأخرى تعمل كـ Coroutines على الـ loop)
+    bot_handlers.EXECUTOR = ThreadPoolExecutor(
+        max_workers=config.YTDLP_THREADS, thread_name_prefix="yt-dlp"
+    )
+    # في وضع مجمع العمليات تبقى الخيوط للانتظار فقط والاستخراج نفسه في العمليات
+    ytdlp_pool.start()
+
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     web_server.bot_loop = loop
@@ -179,10 +223,17 @@ def run_bot_in_thread(initial_app):
         loop.run_until_complete(bot_main_loop(initial_app))
     except Exception as exc:
         logger.error("❌ Bot thread failed: %s", exc)
+    finally:
+        loop.run_until_complete(job_worker.stop())
+        loop.run_until_complete(_stop_prober())
 
 
 # ─── نقطة الدخول ─────────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    # Cloud Run يرسل SIGTERM قبل الإيقاف: الخروج العادي يُشغّل دوال atexit
+    # (تفريغ عدادات الاستهلاك وإغلاق مجمعات العمليات)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
     application = build_application()
     web_server.bot_app = application
 
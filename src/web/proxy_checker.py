@@ -0,0 +1,182 @@
+"""
+web/proxy_checker.py - فحص البروكسيات للوحة التحكم كمهمة في الخلفية
+────────────────────────────────────────
+  - فحص غير متزامن (httpx) بتوازٍ محدود يتحمل آلاف البروكسيات
+  - كل بروكسي يُختبر على httpbin (الوصول) وعلى الأهداف الحقيقية (snapreels و tikwm)
+  - يُسجَّل زمن كل هدف لكل بروكسي بدل نجاح/فشل فقط، ويُغذّى مجمع البروكسيات بنتائج
+    البروكسيات الموجودة فيه فقط (المرشحون الجدد لا يدخلون التدوير قبل قبولهم)
+  - النتائج تُبث للوحة التحكم أولاً بأول عبر SSE
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+import httpx
+
+import config
+from data import database
+from downloaders import proxy_pool
+from downloaders.http_pool import USER_AGENT, normalize_proxy
+
+logger = logging.getLogger(__name__)
+
+# الأهداف: الوصول العام + الخدمات الفعلية التي تستخدم البروكسي
+_TARGETS = {
+    "httpbin":   "https://httpbin.org/ip",
+    "snapreels": "https://snapreels.net",
+    "tikwm":     "https://www.tikwm.com",
+}
+
+_jobs: dict[str, "CheckJob"] = {}
+_jobs_lock = threading.Lock()
+_MAX_JOBS = 10
+
+
+class CheckJob:
+    """مهمة فحص واحدة؛ النتائج تُضاف تباعاً ويُنبَّه المستمعون عبر Condition."""
+
+    def __init__(self, proxies: list[str], mode: str):
+        self.id       = uuid.uuid4().hex[:12]
+        self.proxies  = proxies
+        self.mode     = mode        # "current": استبدال القائمة | "add": دمج الشغالة
+        self.results: list[dict] = []
+        self.summary: dict | None = None
+        self.cond     = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.summary is not None
+
+    def add_result(self, result: dict) -> None:
+        with self.cond:
+            self.results.append(result)
+            self.cond.notify_all()
+
+    def finish(self, summary: dict) -> None:
+        with self.cond:
+            self.summary = summary
+            self.cond.notify_all()
+
+
+async def _check_target(client: httpx.AsyncClient, proxy: str, url: str) -> float | None:
+    """زمن الاستجابة بالثواني، أو None عند الفشل."""
+    started_at = time.monotonic()
+    try:
+        resp = await client.get(url)
+        # 403/407/429 ردود البروكسي نفسه غالباً (407 = يطلب مصادقة): لا تُعد وصولاً
+        ok = resp.is_success or resp.is_redirect
+    except Exception:
+        ok = False
+    latency = time.monotonic() - started_at
+    proxy_pool.report(proxy, ok, latency, host=proxy_pool.host_of(url))
+    return round(latency, 3) if ok else None
+
+
+async def check_proxy(proxy: str) -> dict:
+    """فحص بروكسي واحد على كل الأهداف بالتوازي."""
+    normalized = normalize_proxy(proxy)
+    try:
+        async with httpx.AsyncClient(
+            proxy=normalized,
+            timeout=config.PROXY_CHECK_TIMEOUT,
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+        ) as client:
+            latencies = await asyncio.gather(*(
+                _check_target(client, normalized, url) for url in _TARGETS.values()
+            ))
+    except Exception:
+        latencies = [None] * len(_TARGETS)
+
+    targets = dict(zip(_TARGETS, latencies))
+    reachable = targets["httpbin"] is not None
+    # يُعتبر شغالاً إذا وصل للإنترنت وإلى هدف حقيقي واحد على الأقل
+    ok = reachable and any(targets[name] is not None for name in _TARGETS if name != "httpbin")
+    return {"proxy": proxy, "ok": ok, "latency": targets["httpbin"], "targets": targets}
+
+
+async def _run(job: CheckJob) -> None:
+    sem = asyncio.Semaphore(config.PROXY_CHECK_CONCURRENCY)
+
+    async def _one(proxy: str) -> None:
+        async with sem:
+            job.add_result(await check_proxy(proxy))
+
+    await asyncio.gather(*(_one(p) for p in job.proxies))
+
+
+def _run_job(job: CheckJob) -> None:
+    started_at = time.monotonic()
+    completed  = False
+    try:
+        asyncio.run(_run(job))
+        completed = True
+    except BaseException as exc:
+        logger.error("❌ Proxy check job %s failed: %s", job.id, exc)
+
+    working = [r["proxy"] for r in sorted(
+        (r for r in job.results if r["ok"]), key=lambda r: r["latency"]
+    )]
+    dead_count = len(job.results) - len(working)
+    total_after = None
+    if completed:
+        # نتيجة جزئية (مهمة توقفت في منتصفها) لا تستبدل القائمة
+        try:
+            if job.mode == "current":
+                database.set_proxies(working)
+            else:
+                database.set_proxies(database.get_proxies() + working)
+            total_after = len(database.get_proxies())
+        except Exception as exc:
+            logger.error("❌ Could not save checked proxies: %s", exc)
+
+    job.finish({
+        "ok":           completed,
+        "checked":      len(job.results),
+        "working":      len(working),
+        "dead":         dead_count,
+        "total_after":  total_after,
+        "working_list": working,
+        "seconds":      round(time.monotonic() - started_at, 1),
+    })
+    logger.info("🧪 Proxy check %s done: %d/%d working", job.id, len(working), len(job.results))
+
+
+def start(proxies: list[str], mode: str) -> CheckJob:
+    """بدء مهمة فحص في خيط خلفي مستقل (بـ event loop خاص) وإرجاعها فوراً."""
+    job = CheckJob(list(dict.fromkeys(p.strip() for p in proxies if p.strip())), mode)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        # الاحتفاظ بآخر المهام فقط
+        for old_id in list(_jobs)[:-_MAX_JOBS]:
+            if _jobs[old_id].done:
+                del _jobs[old_id]
+    threading.Thread(target=_run_job, args=(job,), daemon=True, name=f"proxy-check-{job.id}").start()
+    return job
+
+
+def get(job_id: str) -> CheckJob | None:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def iter_events(job: CheckJob, heartbeat: float = 15):
+    """مولد أحداث (النوع، البيانات) للبث عبر SSE حتى انتهاء المهمة."""
+    sent = 0
+    while True:
+        with job.cond:
+            if sent == len(job.results) and not job.done:
+                job.cond.wait(timeout=heartbeat)
+            pending = job.results[sent:]
+            summary = job.summary
+        if not pending and summary is None:
+            yield "ping", {}
+            continue
+        for result in pending:
+            sent += 1
+            yield "result", {**result, "index": sent, "total": len(job.proxies)}
+        if summary is not None and sent == len(job.results):
+            yield "done", summary
+            return
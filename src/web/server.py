@@ -2,17 +2,19 @@
 web/server.py - ط®ط§ط¯ظ… Flask ظ„ظ„ظˆط­ط© ط§ظ„طھط­ظƒظ… ط§ظ„ط¥ط¯ط§ط±ظٹط©
 """
 import os
+import json
 import asyncio
 import threading
 import logging
 import requests as http_requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify
 from telegram import Update
 
 import config
 from data import database
+from bot import media_cache
+from web import proxy_checker
 
 logger = logging.getLogger(__name__)
 
@@ -92,7 +94,8 @@ def dashboard():
         "msg_complete", "msg_error", "msg_banned", "msg_caption",
         "required_channels", "msg_force_sub", "share_msg", "share_btn_text",
     ]
-    settings = {k: database.get_setting(k) for k in settings_keys}
+    snapshot = database.get_settings_snapshot()
+    settings = {k: snapshot.get(k) for k in settings_keys}
     
     # ط¬ظ„ط¨ ط§ظ„طھظˆظƒظ† ظˆط§ظ„ظˆظٹط¨ ظ‡ظˆظƒ ظ…ظ† ط§ظ„ظ…ظ„ظپط§طھ ط§ظ„ظ†طµظٹط© ظƒط£ظˆظ„ظˆظٹط© (ط¨ظ†ط§ط،ظ‹ ط¹ظ„ظ‰ ط·ظ„ط¨ظƒ)
     settings["telegram_token"] = config._read_secret(config.TELEGRAM_TOKEN_FILE, env_key="TELEGRAM_TOKEN")
@@ -124,7 +127,8 @@ def dashboard():
         settings=settings,
         channels_list=channels_list,
         whitelist=whitelist,
-        cloud_limits=cloud_limits
+        cloud_limits=cloud_limits,
+        media_cache_stats=media_cache.stats(),
     )
 
 
@@ -135,41 +139,6 @@ def clear_errors():
     return redirect(url_for("dashboard") + "#errors-section")
 
 
-# â”€â”€â”€ ط¯ظˆط§ظ„ ظ…ط³ط§ط¹ط¯ط© ظ„ظ„ط¨ط±ظˆظƒط³ظٹط§طھ â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
-_PROXY_TEST_URL = "https://httpbin.org/ip"
-_PROXY_TIMEOUT  = 8
-
-
-def _check_single_proxy(proxy: str) -> bool:
-    """ظپط­طµ ط¨ط±ظˆظƒط³ظٹ ظˆط§ط­ط¯ - ظٹظڈط¹ظٹط¯ True ط¥ط°ط§ ظƒط§ظ† ظٹط¹ظ…ظ„."""
-    p = proxy.strip()
-    if not p.startswith(("http://", "https://", "socks4://", "socks5://")):
-        p = "http://" + p
-    try:
-        r = http_requests.get(
-            _PROXY_TEST_URL,
-            proxies={"http": p, "https": p},
-            timeout=_PROXY_TIMEOUT,
-        )
-        return r.status_code == 200
-    except Exception:
-        return False
-
-
-def _check_proxies_list(proxies: list[str], max_workers: int = 50) -> dict:
-    """ظپط­طµ ظ‚ط§ط¦ظ…ط© ظ…ظ† ط§ظ„ط¨ط±ظˆظƒط³ظٹط§طھ ظˆط¥ط¹ط§ط¯ط© ظ†طھط§ط¦ط¬ظ‡ط§."""
-    working, dead = [], []
-    with ThreadPoolExecutor(max_workers=min(max_workers, len(proxies) or 1)) as pool:
-        future_to_proxy = {pool.submit(_check_single_proxy, p): p for p in proxies}
-        for fut in as_completed(future_to_proxy):
-            proxy = future_to_proxy[fut]
-            if fut.result():
-                working.append(proxy)
-            else:
-                dead.append(proxy)
-    return {"working": working, "dead": dead}
-
-
 # â”€â”€â”€ ظ…ط³ط§ط±ط§طھ ط§ظ„ط¨ط±ظˆظƒط³ظٹط§طھ â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
 @app.route("/proxies/list")
 def proxies_list():
@@ -180,24 +149,17 @@ def proxies_list():
 
 @app.route("/proxies/check_current", methods=["POST"])
 def proxies_check_current():
-    """ظپط­طµ ط§ظ„ط¨ط±ظˆظƒط³ظٹط§طھ ط§ظ„ط­ط§ظ„ظٹط© ظˆط¥ط²ط§ظ„ط© ط§ظ„ظ…ظٹطھط© ظ…ظ†ظ‡ط§."""
+    """بدء فحص البروكسيات الحالية في الخلفية (تُحذف الميتة عند الانتهاء)."""
     current = database.get_proxies()
     if not current:
         return jsonify({"ok": False, "msg": "ط§ظ„ظ‚ط§ط¦ظ…ط© ظپط§ط±ط؛ط©"})
-    results = _check_proxies_list(current)
-    database.set_proxies(results["working"])
-    return jsonify({
-        "ok": True,
-        "total":   len(current),
-        "working": len(results["working"]),
-        "dead":    len(results["dead"]),
-        "working_list": results["working"],
-    })
+    job = proxy_checker.start(current, mode="current")
+    return jsonify({"ok": True, "job_id": job.id, "total": len(job.proxies)})
 
 
 @app.route("/proxies/add_and_check", methods=["POST"])
 def proxies_add_and_check():
-    """ط§ط³طھظ‚ط¨ط§ظ„ ظ‚ط§ط¦ظ…ط© ط¨ط±ظˆظƒط³ظٹط§طھ ط¬ط¯ظٹط¯ط©طŒ ظپط­طµظ‡ط§طŒ ط«ظ… ط¯ظ…ط¬ ط§ظ„ط´ط§ط؛ظ„ط© ظ…ط¹ ط§ظ„ظ…ظˆط¬ظˆط¯ط©."""
+    """بدء فحص بروكسيات جديدة في الخلفية (تُدمج الشغالة مع الموجودة عند الانتهاء)."""
     raw = request.form.get("new_proxies", "").strip()
     if not raw:
         return jsonify({"ok": False, "msg": "ظ„ظ… طھظڈط±ط³ظژظ„ ط£ظٹ ط¨ط±ظˆظƒط³ظٹط§طھ"})
@@ -206,19 +168,24 @@ def proxies_add_and_check():
     if not new_candidates:
         return jsonify({"ok": False, "msg": "ظ„ط§ طھظˆط¬ط¯ ط¨ط±ظˆظƒط³ظٹط§طھ طµط§ظ„ط­ط© ظپظٹ ط§ظ„ظ†طµ"})
 
-    results  = _check_proxies_list(new_candidates)
-    current  = database.get_proxies()
-    merged   = current + results["working"]
-    database.set_proxies(merged)
-    total    = len(database.get_proxies())
-
-    return jsonify({
-        "ok":          True,
-        "checked":     len(new_candidates),
-        "working":     len(results["working"]),
-        "dead":        len(results["dead"]),
-        "total_after": total,
-        "working_list": results["working"],
+    job = proxy_checker.start(new_candidates, mode="add")
+    return jsonify({"ok": True, "job_id": job.id, "total": len(job.proxies)})
+
+
+@app.route("/proxies/check_stream/<job_id>")
+def proxies_check_stream(job_id):
+    """بث نتائج الفحص لكل بروكسي أولاً بأول (Server-Sent Events)."""
+    job = proxy_checker.get(job_id)
+    if job is None:
+        return jsonify({"ok": False, "msg": "المهمة غير موجودة"}), 404
+
+    def _events():
+        for event, data in proxy_checker.iter_events(job):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return Response(_events(), mimetype="text/event-stream", headers={
+        "Cache-Control":     "no-cache",
+        "X-Accel-Buffering": "no",
     })
 
 
@@ -386,7 +353,7 @@ def add_channel():
         return redirect(url_for("dashboard"))
     if not new_channel.startswith("@"):
         new_channel = "@" + new_channel
-    current_list = [c.strip() for c in database.get_setting("required_channels", "").split(",") if c.strip()]
+    current_list = list(database.get_settings_snapshot().required_channels)
     if new_channel in current_list:
         flash("ط§ظ„ظ‚ظ†ط§ط© ظ…ظˆط¬ظˆط¯ط© ط¨ط§ظ„ظپط¹ظ„", "error")
     else:
@@ -399,7 +366,7 @@ def add_channel():
 @app.route("/delete_channel", methods=["POST"])
 def delete_channel():
     channel = request.form.get("channel_name", "").strip()
-    current_list = [c.strip() for c in database.get_setting("required_channels", "").split(",") if c.strip()]
+    current_list = list(database.get_settings_snapshot().required_channels)
     if channel in current_list:
         current_list.remove(channel)
         database.set_setting("required_channels", ",".join(current_list))
@@ -465,6 +432,108 @@ def api_server_specs():
     return jsonify(server_utils.get_server_specs())
 
 
+@app.route("/api/http_pool_stats")
+def api_http_pool_stats():
+    """إحصائيات إعادة استخدام اتصالات HTTP لكل مضيف (وحدات التحميل)."""
+    from downloaders import http_pool
+    return jsonify(http_pool.stats())
+
+
+@app.route("/api/strategy_scores")
+def api_strategy_scores():
+    """لوحة نتائج استراتيجيات التحميل (نسبة النجاح والزمن لكل منصة)."""
+    from downloaders import scoreboard
+    return jsonify(scoreboard.snapshot())
+
+
+@app.route("/api/scheduler_stats")
+def api_scheduler_stats():
+    """عمق طابور التحميل وأزمنة الانتظار لكل منصة."""
+    from bot import scheduler
+
+    async def _collect():
+        return scheduler.stats()
+
+    # حالة الجدولة مملوكة لـ loop البوت، لذا تُقرأ من داخله
+    if bot_loop is not None and bot_loop.is_running():
+        return jsonify(asyncio.run_coroutine_threadsafe(_collect(), bot_loop).result(timeout=5))
+    return jsonify(scheduler.stats())
+
+
+@app.route("/api/profile_cache")
+def api_profile_cache():
+    """إحصائيات ذاكرة قوائم حسابات تيك توك."""
+    from bot import profile_cache
+    return jsonify(profile_cache.stats())
+
+
+@app.route("/api/user_profiles")
+def api_user_profiles():
+    """إحصائيات تحديث بيانات المستخدمين (المنفذة والمتخطاة)."""
+    from bot import user_profiles
+    return jsonify(user_profiles.stats())
+
+
+@app.route("/api/membership_cache")
+def api_membership_cache():
+    """إحصائيات ذاكرة فحص الاشتراك (الإصابات والاستدعاءات الموفرة)."""
+    from bot import membership
+    return jsonify(membership.stats())
+
+
+@app.route("/api/access_cache")
+def api_access_cache():
+    """حالة ذاكرة المستخدمين والمحظورين والقائمة البيضاء."""
+    return jsonify(database.access_cache_stats())
+
+
+@app.route("/api/message_log")
+def api_message_log():
+    """حالة سجل الرسائل المحلي (المكتوب والمعلق والمحذوف بالاحتفاظ)."""
+    from data import message_log
+    return jsonify(message_log.stats())
+
+
+@app.route("/api/usage_tracking")
+def api_usage_tracking():
+    """حالة تجميع عدادات استهلاك Firestore (التفريغات والعمليات المعلقة)."""
+    return jsonify(database.usage_tracking_stats())
+
+
+@app.route("/api/settings_store")
+def api_settings_store():
+    """إصدار نسخة الإعدادات الحالية وحالة المستمع."""
+    return jsonify(database.settings_stats())
+
+
+@app.route("/api/job_queue")
+def api_job_queue():
+    """حالة طابور التحميل الدائم ومقاييس العمّال."""
+    from jobs import worker
+    return jsonify(worker.stats())
+
+
+@app.route("/api/download_stats")
+def api_download_stats():
+    """إحصائيات التحميل المباشر من CDN (المجزأ والاستئناف والسرعة)."""
+    from downloaders import async_http
+    return jsonify(async_http.stats())
+
+
+@app.route("/api/media_pipeline")
+def api_media_pipeline():
+    """إحصائيات مرحلة ffmpeg (Remux / ضغط / مهلات)."""
+    from downloaders import media_pipeline
+    return jsonify(media_pipeline.stats())
+
+
+@app.route("/api/proxy_pool")
+def api_proxy_pool():
+    """حالة مجمع البروكسيات (النقاط وقواطع الدائرة وصحة كل مضيف)."""
+    from downloaders import proxy_pool
+    return jsonify(proxy_pool.stats())
+
+
 @app.route("/api/speed_test", methods=["POST"])
 def api_speed_test():
     """طھط´ط؛ظٹظ„ ط§ط®طھط¨ط§ط± ط³ط±ط¹ط© ط§ظ„ط¥ظ†طھط±ظ†طھ ظˆط¥ط±ط¬ط§ط¹ ط§ظ„ظ†طھط§ط¦ط¬."""
@@ -0,0 +1,53 @@
+"""
+worker.py - تشغيل عمّال طابور التحميل كعملية مستقلة
+────────────────────────────────────────
+  - يستلم مهام التحميل من نفس الطابور الذي يكتب فيه خادم الـ Webhook
+  - يسمح بتوسيع العمّال بشكل مستقل عن طبقة الويب (اضبط JOB_WORKERS=0 في عملية الويب)
+  - التشغيل: python src/worker.py
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from data import database
+from telegram import Bot
+from bot import handlers as bot_handlers  # يسجل معالجات المهام عند الاستيراد
+from downloaders import http_pool, proxy_pool, ytdlp_pool
+from jobs import worker
+
+logging.basicConfig(
+    format="%(asctime)s | %(name)-20s | %(levelname)-8s | %(message)s",
+    level=logging.INFO,
+)
+logger = logging.getLogger(__name__)
+
+
+async def run() -> None:
+    token = config._read_secret(config.TELEGRAM_TOKEN_FILE, env_key="TELEGRAM_TOKEN")
+    if not token:
+        raise SystemExit("TELEGRAM_TOKEN is not set")
+
+    prober_task = asyncio.create_task(proxy_pool.run_prober())
+    async with Bot(token) as bot:
+        worker.start(bot, config.JOB_WORKERS or 4)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await worker.stop()
+            prober_task.cancel()
+
+
+if __name__ == "__main__":
+    try:
+        database.init_db()
+    except Exception as exc:
+        logger.error("❌ DB init failed: %s", exc)
+
+    http_pool.install_dns_cache()
+    bot_handlers.EXECUTOR = ThreadPoolExecutor(
+        max_workers=config.YTDLP_THREADS, thread_name_prefix="yt-dlp"
+    )
+    ytdlp_pool.start()
+
+    asyncio.run(run())
@@ -0,0 +1,60 @@
+import pytest
+
+from jobs.queue import DEAD, QUEUED, RUNNING, JobBackend, PendingLimit, SQLiteBackend
+
+
+def test_expired_lease_past_max_attempts_is_dead(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "jobs.db"))
+    job_id  = backend.enqueue("download", {"url": "x"}, max_attempts=2)
+
+    # العامل يموت أثناء كل محاولة: العقد ينتهي دون complete / fail
+    for attempt in (1, 2):
+        job = backend.claim("w", visibility_timeout=-1)
+        assert job is not None and job.id == job_id and job.attempts == attempt
+
+    assert backend.claim("w", visibility_timeout=-1) is None
+    status, error = backend._conn.execute(
+        "SELECT status, error FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    assert status == DEAD and error
+    assert backend.stats()["dead"] == 1
+
+
+def test_expired_lease_with_attempts_left_is_reclaimed(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "jobs.db"))
+    job_id  = backend.enqueue("download", {}, max_attempts=3)
+    backend.claim("w1", visibility_timeout=-1)
+
+    job = backend.claim("w2", visibility_timeout=60)
+    assert job.id == job_id and job.attempts == 2
+    assert backend._conn.execute("SELECT status FROM jobs").fetchone()[0] == RUNNING
+
+
+def test_pending_limit_per_owner(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "jobs.db"))
+    backend.enqueue("download", {}, owner="1", max_pending=2)
+    backend.enqueue("download", {}, owner="1", max_pending=2)
+    with pytest.raises(PendingLimit):
+        backend.enqueue("download", {}, owner="1", max_pending=2)
+    # مستخدم آخر غير متأثر
+    backend.enqueue("download", {}, owner="2", max_pending=2)
+
+
+def test_release_with_delay_does_not_count_attempt(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "jobs.db"))
+    job_id  = backend.enqueue("download", {}, max_attempts=1)
+    backend.claim("w", visibility_timeout=60)
+    backend.release(job_id, delay=60)
+
+    assert backend.claim("w", visibility_timeout=60) is None
+    attempts, status = backend._conn.execute("SELECT attempts, status FROM jobs").fetchone()
+    assert attempts == 0 and status == QUEUED
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class Partial(JobBackend):
+        def enqueue(self, kind, payload, priority=1, max_attempts=None, owner=None, max_pending=None):
+            return 1
+
+    with pytest.raises(TypeError):
+        Partial()